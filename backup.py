@@ -0,0 +1,557 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    BACKUP_DIR, BACKUP_KEEP_COUNT, BACKUP_KEEP_DAYS, BACKUP_PAGES_PER_STEP,
+    BACKUP_FULL_INTERVAL_DAYS, BACKUP_DIFF_MAX_RATIO, DB_BUSY_TIMEOUT_MS, logger
+)
+
+BACKUP_PREFIX = "booking_backup_"
+FULL_SUFFIX = ".db.gz"
+DIFF_SUFFIX = ".diff.gz"
+# Хэши страниц полного бэкапа, с которыми сравниваются дифференциальные
+MANIFEST_SUFFIX = ".pages"
+# Бэкапы до появления сжатия
+LEGACY_SUFFIX = ".db"
+
+# Пауза между шагами копирования: даёт писателям бота захватить базу
+STEP_SLEEP = 0.005
+
+# Размер хэша страницы в манифесте, байт
+DIGEST_SIZE = 16
+
+# Как часто проверять срок бэкапа при записи (страниц)
+DEADLINE_CHECK_PAGES = 1024
+
+# Номер страницы перед её содержимым в дифференциальном бэкапе
+PAGE_HEADER = struct.Struct('>I')
+
+
+class BackupError(Exception):
+    """Копия не прошла проверку целостности"""
+
+
+class BackupTimeout(BackupError):
+    """Бэкап не уложился в отведённое время и прерван"""
+
+
+# Один бэкап за раз: поток, брошенный по таймауту планировщика, мог ещё не завершиться
+_backup_lock = threading.Lock()
+
+
+def _check_deadline(deadline: Optional[float]):
+    """deadline - момент по time.monotonic(), после которого бэкап прерывается"""
+    if deadline is not None and time.monotonic() > deadline:
+        raise BackupTimeout("бэкап прерван по таймауту")
+
+
+def _check_integrity(path: str) -> str:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _snapshot(db_path: str, raw_path: str, pages_per_step: int,
+              deadline: Optional[float] = None) -> Tuple[int, int, int]:
+    """Согласованная копия базы в raw_path; возвращает (страниц, размер страницы, шагов)"""
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        # Исключение из progress прерывает копирование
+        _check_deadline(deadline)
+
+    source = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    target = sqlite3.connect(raw_path)
+    try:
+        # Читающая транзакция на всё время копирования: в режиме WAL она не мешает
+        # писателям, а копия берётся с одного снимка. Без неё каждая запись бота
+        # между шагами перезапускала бы копирование с начала.
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages_per_step, progress=progress, sleep=STEP_SLEEP)
+        source.rollback()
+        pages = target.execute("PRAGMA page_count").fetchone()[0]
+        page_size = target.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+    return pages, page_size, steps
+
+
+def _iter_pages(path: str, page_size: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return
+            yield page
+
+
+def _digest(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=DIGEST_SIZE).digest()
+
+
+def _write_manifest(path: str, page_size: int, digests: List[bytes], sha256: str):
+    header = {'page_size': page_size, 'page_count': len(digests), 'sha256': sha256}
+    with open(path + ".tmp", 'wb') as f:
+        f.write(json.dumps(header).encode() + b"\n")
+        f.write(b"".join(digests))
+    os.replace(path + ".tmp", path)
+
+
+def _read_manifest(path: str) -> Tuple[Dict, List[bytes]]:
+    with open(path, 'rb') as f:
+        header = json.loads(f.readline())
+        data = f.read()
+    digests = [data[i:i + DIGEST_SIZE] for i in range(0, len(data), DIGEST_SIZE)]
+    return header, digests
+
+
+def _read_diff_header(path: str) -> Dict:
+    with gzip.open(path, 'rb') as f:
+        return json.loads(f.readline())
+
+
+def _backup_time(path: str) -> datetime:
+    """Время бэкапа из имени файла (booking_backup_ГГГГММДД[_ЧЧММСС].*)"""
+    stamp = os.path.basename(path)[len(BACKUP_PREFIX):].split('.')[0]
+    if '_' in stamp:
+        return datetime.strptime(stamp, '%Y%m%d_%H%M%S')
+    return datetime.strptime(stamp, '%Y%m%d')
+
+
+def _latest_base(backup_dir: str) -> Optional[str]:
+    """Последний полный бэкап с манифестом страниц - база для дифференциальных"""
+    for path in list_backups(backup_dir):
+        if path.endswith(FULL_SUFFIX) and os.path.exists(path + MANIFEST_SUFFIX):
+            return path
+    return None
+
+
+def _write_full(raw_path: str, gz_path: str, page_size: int, deadline: Optional[float] = None) -> Dict:
+    """Сжать снимок целиком и записать рядом манифест хэшей страниц"""
+    sha = hashlib.sha256()
+    digests = []
+    with gzip.open(gz_path + ".tmp", 'wb', compresslevel=6) as dst:
+        for page in _iter_pages(raw_path, page_size):
+            if len(digests) % DEADLINE_CHECK_PAGES == 0:
+                _check_deadline(deadline)
+            dst.write(page)
+            sha.update(page)
+            digests.append(_digest(page))
+    os.replace(gz_path + ".tmp", gz_path)
+    _write_manifest(gz_path + MANIFEST_SUFFIX, page_size, digests, sha.hexdigest())
+    return {'kind': 'full', 'base': None, 'changed_pages': len(digests)}
+
+
+def _changed_pages(raw_path: str, page_size: int, base_digests: List[bytes]) -> Tuple[List[int], str]:
+    """Номера страниц снимка (с 1), отличающихся от базового бэкапа, и sha256 снимка"""
+    sha = hashlib.sha256()
+    changed = []
+    for index, page in enumerate(_iter_pages(raw_path, page_size)):
+        sha.update(page)
+        if index >= len(base_digests) or _digest(page) != base_digests[index]:
+            changed.append(index + 1)
+    return changed, sha.hexdigest()
+
+
+def _write_diff(raw_path: str, diff_path: str, base_path: str, page_size: int,
+                page_count: int, changed: List[int], sha256: str,
+                deadline: Optional[float] = None) -> Dict:
+    """Записать только изменившиеся страницы: заголовок JSON, затем (номер, страница)"""
+    header = {
+        'base': os.path.basename(base_path),
+        'page_size': page_size,
+        'page_count': page_count,
+        'sha256': sha256,
+        'changed_pages': len(changed),
+    }
+    with open(raw_path, 'rb') as src, gzip.open(diff_path + ".tmp", 'wb', compresslevel=6) as dst:
+        dst.write(json.dumps(header).encode() + b"\n")
+        for index, pgno in enumerate(changed):
+            if index % DEADLINE_CHECK_PAGES == 0:
+                _check_deadline(deadline)
+            src.seek((pgno - 1) * page_size)
+            dst.write(PAGE_HEADER.pack(pgno))
+            dst.write(src.read(page_size))
+    os.replace(diff_path + ".tmp", diff_path)
+    return {'kind': 'diff', 'base': header['base'], 'changed_pages': len(changed)}
+
+
+def create_backup(db_path: str, backup_dir: str = BACKUP_DIR,
+                  pages_per_step: int = BACKUP_PAGES_PER_STEP,
+                  full: Optional[bool] = None, deadline: Optional[float] = None) -> Dict:
+    """
+    Согласованная копия работающей базы через SQLite backup API.
+    Копирование идёт шагами по pages_per_step страниц, поэтому не блокирует
+    запись надолго; снимок проверяется integrity_check.
+
+    Полный бэкап сжимается целиком, дифференциальный хранит только страницы,
+    изменившиеся с последнего полного. full=None - выбрать автоматически:
+    полный, если базы нет, она старше BACKUP_FULL_INTERVAL_DAYS дней или
+    изменилось больше BACKUP_DIFF_MAX_RATIO страниц.
+    Возвращает метрики: путь, вид, размеры, число страниц и длительность этапов.
+    deadline (по time.monotonic()) проверяется между шагами копирования и записи;
+    после него бэкап прерывается с BackupTimeout, недописанные файлы удаляются.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"{BACKUP_PREFIX}{datetime.now():%Y%m%d_%H%M%S}"
+    raw_path = os.path.join(backup_dir, name + ".db.tmp")
+
+    started = time.monotonic()
+    try:
+        pages, page_size, steps = _snapshot(db_path, raw_path, pages_per_step, deadline)
+        copied = time.monotonic()
+        _check_deadline(deadline)
+
+        result = _check_integrity(raw_path)
+        if result != 'ok':
+            raise BackupError(f"integrity_check копии: {result}")
+        checked = time.monotonic()
+        _check_deadline(deadline)
+
+        base = None if full else _latest_base(backup_dir)
+        if base is not None and full is None:
+            if datetime.now() - _backup_time(base) >= timedelta(days=BACKUP_FULL_INTERVAL_DAYS):
+                base = None
+
+        info = None
+        if base is not None:
+            base_header, base_digests = _read_manifest(base + MANIFEST_SUFFIX)
+            if base_header['page_size'] == page_size:
+                changed, sha256 = _changed_pages(raw_path, page_size, base_digests)
+                if full is not None or len(changed) <= pages * BACKUP_DIFF_MAX_RATIO:
+                    path = os.path.join(backup_dir, name + DIFF_SUFFIX)
+                    info = _write_diff(raw_path, path, base, page_size, pages, changed, sha256, deadline)
+
+        if info is None:
+            path = os.path.join(backup_dir, name + FULL_SUFFIX)
+            info = _write_full(raw_path, path, page_size, deadline)
+        written = time.monotonic()
+
+        info.update({
+            'path': path,
+            'pages': pages,
+            'steps': steps,
+            'db_size': os.path.getsize(raw_path),
+            'size': os.path.getsize(path),
+            'copy_time': copied - started,
+            'check_time': checked - copied,
+            'write_time': written - checked,
+            'duration': written - started,
+        })
+        return info
+    finally:
+        for leftover in (raw_path, os.path.join(backup_dir, name + FULL_SUFFIX + ".tmp"),
+                         os.path.join(backup_dir, name + DIFF_SUFFIX + ".tmp")):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def _decompress(path: str, target_path: str):
+    if path.endswith(LEGACY_SUFFIX):
+        shutil.copyfile(path, target_path)
+        return
+    with gzip.open(path, 'rb') as src, open(target_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def restore_backup(backup_path: str, target_path: str) -> Dict:
+    """
+    Восстановить базу из полного или дифференциального бэкапа в target_path.
+    Результат сверяется с sha256 снимка и проверяется integrity_check;
+    target_path заменяется только после успешной проверки.
+    """
+    started = time.monotonic()
+    tmp_path = target_path + ".restore"
+    try:
+        expected = None
+        if backup_path.endswith(DIFF_SUFFIX):
+            header = _read_diff_header(backup_path)
+            base_path = os.path.join(os.path.dirname(backup_path), header['base'])
+            if not os.path.exists(base_path):
+                raise BackupError(f"нет полного бэкапа {header['base']}, от которого снят {backup_path}")
+            _decompress(base_path, tmp_path)
+
+            page_size = header['page_size']
+            record_size = PAGE_HEADER.size + page_size
+            with gzip.open(backup_path, 'rb') as src, open(tmp_path, 'r+b') as dst:
+                src.readline()
+                while True:
+                    record = src.read(record_size)
+                    if not record:
+                        break
+                    (pgno,) = PAGE_HEADER.unpack_from(record)
+                    dst.seek((pgno - 1) * page_size)
+                    dst.write(record[PAGE_HEADER.size:])
+                dst.truncate(header['page_count'] * page_size)
+            expected = header['sha256']
+        else:
+            _decompress(backup_path, tmp_path)
+            if os.path.exists(backup_path + MANIFEST_SUFFIX):
+                expected = _read_manifest(backup_path + MANIFEST_SUFFIX)[0]['sha256']
+        rebuilt = time.monotonic()
+
+        if expected is not None:
+            sha = hashlib.sha256()
+            with open(tmp_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(chunk)
+            if sha.hexdigest() != expected:
+                raise BackupError(f"контрольная сумма восстановленной базы не совпадает ({backup_path})")
+
+        result = _check_integrity(tmp_path)
+        if result != 'ok':
+            raise BackupError(f"integrity_check восстановленной базы: {result}")
+
+        os.replace(tmp_path, target_path)
+        finished = time.monotonic()
+        return {
+            'path': target_path,
+            'source': backup_path,
+            'size': os.path.getsize(target_path),
+            'verified_sha256': expected is not None,
+            'rebuild_time': rebuilt - started,
+            'check_time': finished - rebuilt,
+            'duration': finished - started,
+        }
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def list_backups(backup_dir: str = BACKUP_DIR) -> List[str]:
+    """Точки восстановления (полные и дифференциальные бэкапы), новые первыми"""
+    if not os.path.isdir(backup_dir):
+        return []
+    paths = [
+        os.path.join(backup_dir, filename)
+        for filename in os.listdir(backup_dir)
+        if filename.startswith(BACKUP_PREFIX)
+        and filename.endswith((FULL_SUFFIX, DIFF_SUFFIX, LEGACY_SUFFIX))
+    ]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def find_restore_point(day: str, backup_dir: str = BACKUP_DIR) -> Optional[str]:
+    """Последний бэкап за день 'ГГГГ-ММ-ДД'"""
+    target = datetime.strptime(day, '%Y-%m-%d').date()
+    for path in list_backups(backup_dir):
+        if _backup_time(path).date() == target:
+            return path
+    return None
+
+
+def prune_backups(backup_dir: str = BACKUP_DIR, keep_count: int = BACKUP_KEEP_COUNT,
+                  keep_days: int = BACKUP_KEEP_DAYS) -> List[str]:
+    """
+    Удалить бэкапы сверх keep_count последних или старше keep_days дней
+    (0 - ограничение не действует). Самый свежий бэкап не удаляется никогда,
+    полный - пока от него зависит хотя бы один оставшийся дифференциальный.
+    """
+    cutoff = datetime.now() - timedelta(days=keep_days) if keep_days else None
+    backups = list_backups(backup_dir)
+    keep = set()
+    for index, path in enumerate(backups):
+        too_many = keep_count and index >= keep_count
+        too_old = cutoff and datetime.fromtimestamp(os.path.getmtime(path)) < cutoff
+        if index == 0 or not (too_many or too_old):
+            keep.add(path)
+
+    for path in list(keep):
+        if path.endswith(DIFF_SUFFIX):
+            keep.add(os.path.join(backup_dir, _read_diff_header(path)['base']))
+
+    removed = []
+    for path in backups:
+        if path in keep:
+            continue
+        os.remove(path)
+        if os.path.exists(path + MANIFEST_SUFFIX):
+            os.remove(path + MANIFEST_SUFFIX)
+        removed.append(path)
+        logger.info(f"Удалён старый бэкап: {os.path.basename(path)}")
+    return removed
+
+
+def run_backup(db_path: str, backup_dir: str = BACKUP_DIR, full: Optional[bool] = None,
+               timeout: Optional[float] = None) -> Dict:
+    """
+    Бэкап с проверкой и очисткой старых копий (выполняется в рабочем потоке).
+    timeout - сколько секунд может идти бэкап: отмена ожидающей корутины не
+    останавливает поток, поэтому он сам прерывается по сроку (BackupTimeout).
+    Пока предыдущий бэкап ещё идёт, новый не запускается (BackupError).
+    """
+    if not _backup_lock.acquire(blocking=False):
+        raise BackupError("предыдущий бэкап ещё выполняется")
+    try:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        metrics = create_backup(db_path, backup_dir, full=full, deadline=deadline)
+        removed = prune_backups(backup_dir)
+    finally:
+        _backup_lock.release()
+    metrics['removed'] = len(removed)
+
+    kind = "полный" if metrics['kind'] == 'full' else f"дифференциальный от {metrics['base']}"
+    logger.info(
+        f"✅ Создан бэкап ({kind}): {metrics['path']} — "
+        f"{metrics['db_size'] / 1024 / 1024:.1f} МБ → {metrics['size'] / 1024 / 1024:.1f} МБ, "
+        f"записано {metrics['changed_pages']} из {metrics['pages']} страниц, "
+        f"{metrics['steps']} шагов копирования, "
+        f"{metrics['duration']:.2f} с (копирование {metrics['copy_time']:.2f} с, "
+        f"проверка {metrics['check_time']:.2f} с, запись {metrics['write_time']:.2f} с), "
+        f"удалено старых: {metrics['removed']}"
+    )
+    return metrics
+
+
+# === ЗАМЕР ===
+
+def _fill_orders(db_path: str, start_id: int, count: int):
+    """Добавить count заказов с клиентами и позициями"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("INSERT OR IGNORE INTO resources (id, name, total_quantity) VALUES (1, 'Замер', 1000000)")
+        ids = range(start_id, start_id + count)
+        conn.executemany(
+            "INSERT INTO clients (id, name, phone) VALUES (?, ?, ?)",
+            ((i, f"Клиент {i}", f"+7900{i:07d}") for i in ids)
+        )
+        conn.executemany("""
+            INSERT INTO orders (id, client_id, start_date, end_date, delivery_type,
+                                delivery_comment, cost, cost_minor, status, created_by)
+            VALUES (?, ?, '2025-01-10', '2025-01-12', 'pickup', 'комментарий к заказу', ?, ?, 'completed', 1)
+        """, ((i, i, str(i % 9000), (i % 9000) * 100) for i in ids))
+        conn.executemany(
+            "INSERT INTO order_items (order_id, resource_id, quantity) VALUES (?, 1, ?)",
+            ((i, i % 5 + 1) for i in ids)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _touch_orders(db_path: str, ratio: float):
+    """Изменить долю ratio заказов, разбросанных по всей таблице (дневная активность)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        step = max(1, int(1 / ratio))
+        conn.execute("UPDATE orders SET delivery_comment = 'изменено' WHERE id % ? = 0", (step,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def benchmark(sizes: List[int], change_ratio: float = 0.01) -> List[Dict]:
+    """
+    Размер и время полного и дифференциального бэкапа и время восстановления
+    по мере роста базы. Для каждого размера: полный бэкап, изменение доли
+    change_ratio заказов, дифференциальный бэкап, восстановление из него.
+    """
+    from database import Database
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        backup_dir = os.path.join(workdir, "backups")
+        Database(db_path, pool_size=1, cache_catalogue=False, use_ledger=False).close()
+
+        filled = 0
+        for size in sizes:
+            _fill_orders(db_path, filled + 1, size - filled)
+            filled = size
+
+            full = create_backup(db_path, backup_dir, full=True)
+            _touch_orders(db_path, change_ratio)
+            diff = create_backup(db_path, backup_dir, full=False)
+            restored = restore_backup(diff['path'], os.path.join(workdir, "restored.db"))
+
+            row = {
+                'orders': size,
+                'db_mb': full['db_size'] / 1024 / 1024,
+                'full_mb': full['size'] / 1024 / 1024,
+                'full_s': full['duration'],
+                'diff_mb': diff['size'] / 1024 / 1024,
+                'diff_pages': diff['changed_pages'],
+                'diff_s': diff['duration'],
+                'restore_s': restored['duration'],
+            }
+            rows.append(row)
+            print(
+                f"{row['orders']:>9} {row['db_mb']:>8.1f} {row['full_mb']:>8.2f} {row['full_s']:>7.2f} "
+                f"{row['diff_mb']:>8.2f} {row['diff_pages']:>8} {row['diff_s']:>7.2f} {row['restore_s']:>8.2f}",
+                flush=True
+            )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервные копии базы данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="список точек восстановления")
+
+    create = commands.add_parser("create", help="создать бэкап сейчас")
+    create.add_argument("--full", action="store_true", help="обязательно полный")
+
+    restore = commands.add_parser("restore", help="восстановить базу на дату или из файла")
+    restore.add_argument("point", help="ГГГГ-ММ-ДД (последний бэкап за день) или путь к файлу бэкапа")
+    restore.add_argument("target", help="куда записать восстановленную базу")
+
+    bench = commands.add_parser("bench", help="замер размера и времени бэкапа и восстановления")
+    bench.add_argument("--sizes", default="10000,50000,100000,200000",
+                       help="число заказов на каждом шаге, через запятую")
+    bench.add_argument("--change-ratio", type=float, default=0.01,
+                       help="доля заказов, изменённых между полным и дифференциальным бэкапом")
+
+    args = parser.parse_args()
+    from config import DATABASE_PATH
+
+    if args.command == "list":
+        for path in list_backups():
+            if path.endswith(DIFF_SUFFIX):
+                kind = f"дифф. от {_read_diff_header(path)['base']}"
+            else:
+                kind = "полный"
+            print(f"{_backup_time(path):%Y-%m-%d %H:%M:%S}  {os.path.getsize(path) / 1024 / 1024:>8.2f} МБ  "
+                  f"{os.path.basename(path)}  ({kind})")
+
+    elif args.command == "create":
+        run_backup(DATABASE_PATH, full=True if args.full else None)
+
+    elif args.command == "restore":
+        point = args.point
+        if not os.path.exists(point):
+            point = find_restore_point(point)
+            if point is None:
+                parser.error(f"нет бэкапа за {args.point}")
+        metrics = restore_backup(point, args.target)
+        print(f"Восстановлено из {metrics['source']} в {metrics['path']}: "
+              f"{metrics['size'] / 1024 / 1024:.1f} МБ за {metrics['duration']:.2f} с, "
+              f"контрольная сумма {'совпала' if metrics['verified_sha256'] else 'не записана'}, "
+              f"integrity_check: ok")
+
+    elif args.command == "bench":
+        sizes = [int(size) for size in args.sizes.split(",")]
+        print(f"{'заказов':>9} {'база МБ':>8} {'полн МБ':>8} {'полн с':>7} "
+              f"{'дифф МБ':>8} {'страниц':>8} {'дифф с':>7} {'восст с':>8}")
+        benchmark(sizes, args.change_ratio)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,39 @@ if not ADMIN_IDS:
     raise ValueError("ADMIN_IDS не найден в .env файле!")
 
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'booking.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+USE_RESERVATION_LEDGER = os.getenv('USE_RESERVATION_LEDGER', '0') == '1'
+
+# Генерация отчётов в отдельных процессах
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '2'))
+REPORT_MAX_PER_USER = int(os.getenv('REPORT_MAX_PER_USER', '1'))
+REPORT_CACHE_MAX_MB = int(os.getenv('REPORT_CACHE_MAX_MB', '50'))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', '32'))
+
+# Кэш отрисованных карточек заказов (записей)
+ORDER_RENDER_CACHE_SIZE = int(os.getenv('ORDER_RENDER_CACHE_SIZE', '2000'))
+
+# Отправка сообщений: лимиты Telegram (сообщений в секунду) и параллельность
+DELIVERY_GLOBAL_RATE = float(os.getenv('DELIVERY_GLOBAL_RATE', '30'))
+DELIVERY_CHAT_RATE = float(os.getenv('DELIVERY_CHAT_RATE', '1'))
+DELIVERY_CONCURRENCY = int(os.getenv('DELIVERY_CONCURRENCY', '20'))
+DELIVERY_MAX_RETRIES = int(os.getenv('DELIVERY_MAX_RETRIES', '3'))
+
+# Резервные копии: хранится не больше BACKUP_KEEP_COUNT копий и не старше
+# BACKUP_KEEP_DAYS дней (0 - без ограничения); копирование шагами по N страниц
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_KEEP_COUNT = int(os.getenv('BACKUP_KEEP_COUNT', '30'))
+BACKUP_KEEP_DAYS = int(os.getenv('BACKUP_KEEP_DAYS', '30'))
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '1024'))
+# Между полными бэкапами - дифференциальные (страницы, изменённые с последнего полного);
+# полный снимается раньше, если изменилась большая доля страниц
+BACKUP_FULL_INTERVAL_DAYS = int(os.getenv('BACKUP_FULL_INTERVAL_DAYS', '7'))
+BACKUP_DIFF_MAX_RATIO = float(os.getenv('BACKUP_DIFF_MAX_RATIO', '0.5'))
+
+# Расписания периодических задач (cron: минута час день месяц день_недели)
+REMINDERS_SCHEDULE = os.getenv('REMINDERS_SCHEDULE', '0 9 * * *')
+BACKUP_SCHEDULE = os.getenv('BACKUP_SCHEDULE', '0 3 * * *')
 
 # Helper functions
 def is_admin(user_id: int) -> bool:
@@ -1,17 +1,93 @@
+import asyncio
+import functools
+import re
 import sqlite3
-from typing import List, Optional, Tuple, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple, Dict
 from datetime import datetime, timedelta
-from config import DATABASE_PATH, logger
+from config import DATABASE_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, USE_RESERVATION_LEDGER, logger
+from db_pool import ConnectionPool
+from ledger import ReservationLedger
+from money import format_money, parse_money
 
 
 class Database:
-    def __init__(self, db_path: str = DATABASE_PATH):
+    # Максимум параметров в одном IN (...) (лимит SQLite на число переменных)
+    IN_BATCH_SIZE = 500
+    # Размер порции fetchmany при потоковом чтении отчётов
+    REPORT_CHUNK_SIZE = 500
+    
+    def __init__(self, db_path: str = DATABASE_PATH, pool_size: int = DB_POOL_SIZE,
+                 cache_catalogue: bool = True, use_ledger: bool = USE_RESERVATION_LEDGER,
+                 init_schema: bool = True):
         self.db_path = db_path
-        self.init_db()
+        self.pool = ConnectionPool(db_path, max_size=pool_size, busy_timeout_ms=DB_BUSY_TIMEOUT_MS)
+        
+        # Кэш каталога ресурсов: {id: (id, name, description, total_quantity)}.
+        # Таблица resources меняется только через add/update/delete_resource,
+        # которые обновляют кэш сразу после записи.
+        self.cache_catalogue = cache_catalogue
+        self._catalogue: Optional[Dict[int, Tuple]] = None
+        self._catalogue_sorted: Optional[List[Tuple]] = None
+        self._catalogue_lock = threading.RLock()
+        self.catalogue_version = 0
+        self.catalogue_hits = 0
+        self.catalogue_misses = 0
+        
+        # Версия данных заказов, клиентов и ресурсов: растёт после каждой записи в этом
+        # процессе, по ней инвалидируются кэши производных данных (отчёты)
+        self.data_version = 0
+        self._data_version_lock = threading.Lock()
+        # Версии отдельных заказов (значение data_version при последней записи
+        # заказа): по ним инвалидируется кэш отрисовки карточек заказов
+        self._order_versions: Dict[int, int] = {}
+        
+        # Полнотекстовый индекс клиентов (FTS5 trigram); без него поиск через LIKE
+        self.client_fts = False
+        
+        # Необязательный журнал активных броней в памяти (см. ledger.py)
+        self.ledger: Optional[ReservationLedger] = ReservationLedger() if use_ledger else None
+        
+        # Схему создаёт основной процесс; вспомогательные процессы
+        # (например, генерация отчётов) работают с готовой базой
+        if init_schema:
+            self.init_db()
+        if cache_catalogue:
+            self._load_catalogue()
+        if self.ledger is not None:
+            self.ledger.load(self._get_active_reservations())
         logger.info(f"База данных инициализирована: {db_path}")
     
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """Соединение из пула на время одного вызова (commit/rollback при выходе)"""
+        return self.pool.connection()
+    
+    def transaction(self):
+        """Транзакция BEGIN IMMEDIATE на одном соединении из пула"""
+        return self.pool.transaction(immediate=True)
+    
+    def _bump_data_version(self, *order_ids: int):
+        """
+        Отметить изменение заказов, клиентов или ресурсов (вызывается после commit).
+        order_ids - изменённые заказы, их версии тоже увеличиваются.
+        """
+        with self._data_version_lock:
+            self.data_version += 1
+            for order_id in order_ids:
+                self._order_versions[order_id] = self.data_version
+    
+    def order_version(self, order_id: int) -> int:
+        """Версия заказа: меняется при каждой записи заказа в этом процессе"""
+        return self._order_versions.get(order_id, 0)
+    
+    def get_pool_stats(self) -> Dict:
+        """Статистика пула соединений"""
+        return self.pool.stats()
+    
+    def close(self):
+        """Закрыть соединения пула"""
+        self.pool.close()
     
     def init_db(self):
         with self.get_connection() as conn:
@@ -86,13 +162,67 @@ class Database:
                 conn.commit()
                 logger.info("Миграция issued_at завершена успешно")
             
+            # Суммы, которые не удалось разобрать при переносе cost -> cost_minor
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cost_quarantine (
+                    order_id INTEGER PRIMARY KEY,
+                    raw_value TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+                )
+            """)
+            
+            # МИГРАЦИЯ: стоимость в копейках вместо свободного текста
+            try:
+                cursor.execute("SELECT cost_minor FROM orders LIMIT 1")
+            except sqlite3.OperationalError:
+                logger.info("Применяем миграцию: добавление поля cost_minor")
+                cursor.execute("ALTER TABLE orders ADD COLUMN cost_minor INTEGER")
+                self._migrate_costs(cursor)
+                conn.commit()
+                logger.info("Миграция cost_minor завершена успешно")
+            
+            # МИГРАЦИЯ: привязка клиента к Telegram для рассылок
+            try:
+                cursor.execute("SELECT telegram_id FROM clients LIMIT 1")
+            except sqlite3.OperationalError:
+                logger.info("Применяем миграцию: добавление поля telegram_id")
+                cursor.execute("ALTER TABLE clients ADD COLUMN telegram_id INTEGER")
+                conn.commit()
+                logger.info("Миграция telegram_id завершена успешно")
+            
             # СОЗДАНИЕ ИНДЕКСОВ для оптимизации
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_dates ON orders(start_date, end_date)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_client ON orders(client_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_resource ON order_items(resource_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_clients_phone ON clients(phone)")
+            # Один Telegram-аккаунт - один клиент; индекс же обходит аудиторию рассылки
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_clients_telegram
+                ON clients(telegram_id) WHERE telegram_id IS NOT NULL
+            """)
+            
+            # Составные индексы под горячие запросы: статус + даты для доступности
+            # и списков на день, статус + end_date для возвратов и просрочек
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_dates ON orders(status, start_date, end_date)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_end ON orders(status, end_date)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)")
+            # Keyset-пагинация списков: активные заказы по (start_date DESC, id DESC),
+            # клиенты по (name, id) - страница читается диапазоном индекса
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_orders_active_start
+                ON orders(start_date DESC, id DESC) WHERE status IN ('pending', 'issued', 'overdue')
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_clients_name ON clients(name)")
+            
+            # Покрывающие индексы позиций: суммы quantity считаются без чтения таблицы
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_resource_cover ON order_items(resource_id, order_id, quantity)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order_cover ON order_items(order_id, resource_id, quantity)")
+            
+            # Одноколоночные индексы стали префиксами составных
+            cursor.execute("DROP INDEX IF EXISTS idx_orders_status")
+            cursor.execute("DROP INDEX IF EXISTS idx_order_items_order")
+            cursor.execute("DROP INDEX IF EXISTS idx_order_items_resource")
             logger.info("Индексы базы данных созданы успешно")
             
             # Таблица аудита действий
@@ -111,8 +241,541 @@ class Database:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_log(timestamp)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_log(user_id)")
             
+            # Последние запуски задач планировщика (время - локальное, как в расписании)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS scheduler_runs (
+                    job TEXT PRIMARY KEY,
+                    scheduled_for TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    duration REAL,
+                    status TEXT NOT NULL,
+                    error TEXT
+                )
+            """)
+            
+            # Рассылки и очередь их получателей (переживает перезапуск бота)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    text TEXT NOT NULL,
+                    created_by INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    total INTEGER NOT NULL DEFAULT 0,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_outbox (
+                    broadcast_id INTEGER NOT NULL,
+                    telegram_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT,
+                    sent_at TIMESTAMP,
+                    PRIMARY KEY (broadcast_id, telegram_id),
+                    FOREIGN KEY (broadcast_id) REFERENCES broadcasts(id) ON DELETE CASCADE
+                ) WITHOUT ROWID
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_outbox_pending
+                ON broadcast_outbox(broadcast_id, telegram_id) WHERE status = 'pending'
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status)")
+            
+            self._init_rollups(cursor)
+            self._init_client_stats(cursor)
+            self.client_fts = self._init_client_search(cursor)
+            
             conn.commit()
     
+    # === ДНЕВНЫЕ СВОДКИ ===
+    
+    # Источники сводок: таблица -> запрос, пересчитывающий её с нуля.
+    # День - дата создания заказа/клиента (как в фильтрах отчётов).
+    ROLLUP_SOURCES = {
+        'daily_order_stats': """
+            SELECT DATE(created_at), status, COUNT(*), TOTAL(cost_minor)
+            FROM orders
+            GROUP BY DATE(created_at), status
+        """,
+        'daily_new_clients': """
+            SELECT DATE(created_at), COUNT(*)
+            FROM clients
+            GROUP BY DATE(created_at)
+        """,
+        'daily_resource_units': """
+            SELECT DATE(o.created_at), oi.resource_id, SUM(oi.quantity)
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            GROUP BY DATE(o.created_at), oi.resource_id
+        """,
+    }
+    
+    # Строки сводок с ненулевыми значениями (после удалений остаются нулевые строки)
+    ROLLUP_NONZERO = {
+        'daily_order_stats': "orders != 0 OR revenue_minor != 0",
+        'daily_new_clients': "clients != 0",
+        'daily_resource_units': "units != 0",
+    }
+    
+    def _init_rollups(self, cursor):
+        """
+        Таблицы дневных сводок и триггеры, поддерживающие их при каждой записи
+        в orders, order_items и clients. При первом создании сводки заполняются.
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'daily_order_stats'")
+        created = cursor.fetchone() is None
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_order_stats (
+                day TEXT NOT NULL,
+                status TEXT NOT NULL,
+                orders INTEGER NOT NULL DEFAULT 0,
+                revenue_minor INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, status)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_new_clients (
+                day TEXT PRIMARY KEY,
+                clients INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_resource_units (
+                day TEXT NOT NULL,
+                resource_id INTEGER NOT NULL,
+                units INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, resource_id)
+            )
+        """)
+        
+        # Заказы: +1 в (день, статус) при создании, перенос при смене статуса или суммы
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_insert
+            AFTER INSERT ON orders
+            BEGIN
+                INSERT INTO daily_order_stats (day, status, orders, revenue_minor)
+                VALUES (DATE(NEW.created_at), NEW.status, 1, COALESCE(NEW.cost_minor, 0))
+                ON CONFLICT (day, status) DO UPDATE SET
+                    orders = orders + excluded.orders,
+                    revenue_minor = revenue_minor + excluded.revenue_minor;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_update
+            AFTER UPDATE OF status, cost_minor ON orders
+            WHEN OLD.status IS NOT NEW.status OR OLD.cost_minor IS NOT NEW.cost_minor
+            BEGIN
+                UPDATE daily_order_stats
+                SET orders = orders - 1,
+                    revenue_minor = revenue_minor - COALESCE(OLD.cost_minor, 0)
+                WHERE day = DATE(OLD.created_at) AND status = OLD.status;
+                
+                INSERT INTO daily_order_stats (day, status, orders, revenue_minor)
+                VALUES (DATE(NEW.created_at), NEW.status, 1, COALESCE(NEW.cost_minor, 0))
+                ON CONFLICT (day, status) DO UPDATE SET
+                    orders = orders + excluded.orders,
+                    revenue_minor = revenue_minor + excluded.revenue_minor;
+            END
+        """)
+        # BEFORE DELETE: позиции заказа ещё на месте, поэтому единицы вычитаются здесь.
+        # Каскадное удаление позиций потом не находит заказ и сводку не трогает.
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_delete
+            BEFORE DELETE ON orders
+            BEGIN
+                UPDATE daily_order_stats
+                SET orders = orders - 1,
+                    revenue_minor = revenue_minor - COALESCE(OLD.cost_minor, 0)
+                WHERE day = DATE(OLD.created_at) AND status = OLD.status;
+                
+                UPDATE daily_resource_units
+                SET units = units - (
+                    SELECT SUM(oi.quantity) FROM order_items oi
+                    WHERE oi.order_id = OLD.id AND oi.resource_id = daily_resource_units.resource_id
+                )
+                WHERE day = DATE(OLD.created_at)
+                  AND resource_id IN (SELECT resource_id FROM order_items WHERE order_id = OLD.id);
+            END
+        """)
+        
+        # Позиции заказов: единицы ресурса в день создания заказа
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_order_items_rollup_insert
+            AFTER INSERT ON order_items
+            BEGIN
+                INSERT INTO daily_resource_units (day, resource_id, units)
+                SELECT DATE(o.created_at), NEW.resource_id, NEW.quantity
+                FROM orders o WHERE o.id = NEW.order_id
+                ON CONFLICT (day, resource_id) DO UPDATE SET
+                    units = units + excluded.units;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_order_items_rollup_delete
+            AFTER DELETE ON order_items
+            BEGIN
+                UPDATE daily_resource_units
+                SET units = units - OLD.quantity
+                WHERE resource_id = OLD.resource_id
+                  AND day = (SELECT DATE(created_at) FROM orders WHERE id = OLD.order_id);
+            END
+        """)
+        
+        # Клиенты: новые клиенты по дням
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_clients_rollup_insert
+            AFTER INSERT ON clients
+            BEGIN
+                INSERT INTO daily_new_clients (day, clients)
+                VALUES (DATE(NEW.created_at), 1)
+                ON CONFLICT (day) DO UPDATE SET clients = clients + 1;
+            END
+        """)
+        
+        if created:
+            logger.info("Применяем миграцию: заполнение дневных сводок")
+            self._fill_rollups(cursor)
+    
+    def _fill_rollups(self, cursor):
+        for table, query in self.ROLLUP_SOURCES.items():
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"INSERT INTO {table} {query}")
+    
+    def rebuild_rollups(self) -> Dict[str, int]:
+        """
+        Пересчитать дневные сводки и статистику клиентов с нуля в одной транзакции.
+        Возвращает {таблица: число строк, расходившихся с пересчётом} -
+        ненулевые значения говорят о записи в обход триггеров.
+        """
+        mismatches = {}
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            for table, query in self.ROLLUP_SOURCES.items():
+                current = f"SELECT * FROM {table} WHERE {self.ROLLUP_NONZERO[table]}"
+                cursor.execute(f"""
+                    SELECT
+                        (SELECT COUNT(*) FROM ({query} EXCEPT {current})) +
+                        (SELECT COUNT(*) FROM ({current} EXCEPT {query}))
+                """)
+                mismatches[table] = cursor.fetchone()[0]
+            self._fill_rollups(cursor)
+            
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM (
+                    {self.CLIENT_STATS_SOURCE}
+                    EXCEPT
+                    SELECT id, order_count, last_order_at, total_spent FROM clients
+                )
+            """)
+            mismatches['clients'] = cursor.fetchone()[0]
+            self._fill_client_stats(cursor)
+        
+        self._bump_data_version()
+        if any(mismatches.values()):
+            logger.warning(f"Дневные сводки пересчитаны, расхождения: {mismatches}")
+        else:
+            logger.info("Дневные сводки пересчитаны, расхождений нет")
+        return mismatches
+    
+    # Статистика клиента, пересчитанная по заказам: (id, order_count, last_order_at, total_spent)
+    CLIENT_STATS_SOURCE = """
+        SELECT c.id, COUNT(o.id), MAX(o.created_at), COALESCE(SUM(o.cost_minor), 0)
+        FROM clients c
+        LEFT JOIN orders o ON o.client_id = c.id
+        GROUP BY c.id
+    """
+    
+    def _init_client_stats(self, cursor):
+        """
+        Статистика клиента в строке clients: число заказов, время последнего
+        заказа и сумма всех заказов в копейках. Поддерживается триггерами
+        на orders, поэтому список клиентов не агрегирует заказы.
+        """
+        try:
+            cursor.execute("SELECT order_count FROM clients LIMIT 1")
+            created = False
+        except sqlite3.OperationalError:
+            logger.info("Применяем миграцию: статистика заказов в clients")
+            cursor.execute("ALTER TABLE clients ADD COLUMN order_count INTEGER NOT NULL DEFAULT 0")
+            cursor.execute("ALTER TABLE clients ADD COLUMN last_order_at TIMESTAMP")
+            cursor.execute("ALTER TABLE clients ADD COLUMN total_spent INTEGER NOT NULL DEFAULT 0")
+            created = True
+        
+        # "Недавние клиенты" - чтение диапазона индекса (NULL без заказов - в конце)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_clients_last_order ON clients(last_order_at DESC)")
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_client_stats_insert
+            AFTER INSERT ON orders
+            BEGIN
+                UPDATE clients
+                SET order_count = order_count + 1,
+                    total_spent = total_spent + COALESCE(NEW.cost_minor, 0),
+                    last_order_at = CASE
+                        WHEN last_order_at IS NULL OR NEW.created_at > last_order_at THEN NEW.created_at
+                        ELSE last_order_at
+                    END
+                WHERE id = NEW.client_id;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_client_stats_update
+            AFTER UPDATE OF client_id, cost_minor, created_at ON orders
+            WHEN OLD.client_id IS NOT NEW.client_id
+              OR OLD.cost_minor IS NOT NEW.cost_minor
+              OR OLD.created_at IS NOT NEW.created_at
+            BEGIN
+                UPDATE clients
+                SET order_count = order_count - 1,
+                    total_spent = total_spent - COALESCE(OLD.cost_minor, 0)
+                WHERE id = OLD.client_id;
+                
+                UPDATE clients
+                SET order_count = order_count + 1,
+                    total_spent = total_spent + COALESCE(NEW.cost_minor, 0)
+                WHERE id = NEW.client_id;
+                
+                UPDATE clients
+                SET last_order_at = (SELECT MAX(created_at) FROM orders WHERE client_id = clients.id)
+                WHERE id IN (OLD.client_id, NEW.client_id)
+                  AND (OLD.client_id IS NOT NEW.client_id OR OLD.created_at IS NOT NEW.created_at);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_client_stats_delete
+            AFTER DELETE ON orders
+            BEGIN
+                UPDATE clients
+                SET order_count = order_count - 1,
+                    total_spent = total_spent - COALESCE(OLD.cost_minor, 0),
+                    last_order_at = (SELECT MAX(created_at) FROM orders WHERE client_id = OLD.client_id)
+                WHERE id = OLD.client_id;
+            END
+        """)
+        
+        if created:
+            self._fill_client_stats(cursor)
+    
+    def _fill_client_stats(self, cursor):
+        cursor.execute(f"""
+            WITH stats (id, order_count, last_order_at, total_spent) AS ({self.CLIENT_STATS_SOURCE})
+            UPDATE clients
+            SET (order_count, last_order_at, total_spent) = (
+                SELECT order_count, last_order_at, total_spent FROM stats WHERE stats.id = clients.id
+            )
+        """)
+    
+    def _migrate_costs(self, cursor) -> int:
+        """
+        Перенести текстовые orders.cost в cost_minor.
+        Неразборчивые значения остаются в cost и попадают в cost_quarantine.
+        Возвращает число заказов в карантине.
+        """
+        cursor.execute("SELECT id, cost FROM orders WHERE cost IS NOT NULL AND TRIM(cost) != ''")
+        parsed = []
+        quarantined = []
+        for order_id, raw_value in cursor.fetchall():
+            try:
+                parsed.append((parse_money(raw_value), order_id))
+            except ValueError as e:
+                quarantined.append((order_id, raw_value, str(e)))
+        
+        cursor.executemany("UPDATE orders SET cost_minor = ? WHERE id = ?", parsed)
+        cursor.executemany("""
+            INSERT OR REPLACE INTO cost_quarantine (order_id, raw_value, reason)
+            VALUES (?, ?, ?)
+        """, quarantined)
+        
+        logger.info(f"Стоимость перенесена: {len(parsed)} заказов, в карантине {len(quarantined)}")
+        return len(quarantined)
+    
+    # === ПОИСК КЛИЕНТОВ ===
+    
+    def _init_client_search(self, cursor) -> bool:
+        """
+        Индекс clients_fts (FTS5, токенизатор trigram) по имени и телефону клиента:
+        находит любую подстроку от 3 символов. Индекс хранит только токены
+        (external content), синхронизацию с clients ведут триггеры.
+        Возвращает False, если SQLite собран без FTS5 или trigram.
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'clients_fts'")
+        created = cursor.fetchone() is None
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5(
+                    name, phone,
+                    content = 'clients', content_rowid = 'id',
+                    tokenize = 'trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 trigram недоступен, поиск клиентов через LIKE: {e}")
+            return False
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_clients_fts_insert AFTER INSERT ON clients
+            BEGIN
+                INSERT INTO clients_fts (rowid, name, phone) VALUES (new.id, new.name, new.phone);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_clients_fts_delete AFTER DELETE ON clients
+            BEGIN
+                INSERT INTO clients_fts (clients_fts, rowid, name, phone)
+                VALUES ('delete', old.id, old.name, old.phone);
+            END
+        """)
+        # Только имя и телефон: привязка Telegram и другие поля индекс не трогают
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_clients_fts_update AFTER UPDATE OF name, phone ON clients
+            BEGIN
+                INSERT INTO clients_fts (clients_fts, rowid, name, phone)
+                VALUES ('delete', old.id, old.name, old.phone);
+                INSERT INTO clients_fts (rowid, name, phone) VALUES (new.id, new.name, new.phone);
+            END
+        """)
+        
+        if created:
+            cursor.execute("INSERT INTO clients_fts (clients_fts) VALUES ('rebuild')")
+            logger.info("Индекс поиска клиентов построен")
+        return True
+    
+    @staticmethod
+    def _fts_query(text: str) -> Optional[str]:
+        """
+        Запрос MATCH из текста пользователя: каждое слово - фраза в кавычках
+        (подстрока), слова объединяются через AND. Слова короче 3 символов
+        trigram не ищет - они пропускаются; None, если искать нечего.
+        """
+        words = [word for word in text.split() if len(word) >= 3]
+        if not words:
+            return None
+        return " AND ".join('"' + word.replace('"', '""') + '"' for word in words)
+    
+    # Сколько совпадений поиска ранжируется по релевантности
+    SEARCH_CANDIDATES = 200
+    
+    def search_clients(self, text: str, limit: int = 10) -> List[Tuple]:
+        """
+        Клиенты, у которых имя или телефон содержат введённый текст:
+        [(id, name, phone, order_count)], лучшие совпадения первыми.
+        """
+        text = text.strip()
+        if not text:
+            return []
+        
+        query = self._fts_query(text) if self.client_fts else None
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if query is not None:
+                # bm25 считается только для SEARCH_CANDIDATES новейших совпадений:
+                # FTS5 отдаёт их в порядке rowid и останавливается, не ранжируя
+                # тысячи клиентов с распространённой фамилией
+                cursor.execute("""
+                    SELECT c.id, c.name, c.phone, c.order_count
+                    FROM (
+                        SELECT rowid, rank FROM clients_fts
+                        WHERE clients_fts MATCH ?
+                        ORDER BY rowid DESC
+                        LIMIT ?
+                    ) AS found
+                    JOIN clients c ON c.id = found.rowid
+                    ORDER BY found.rank, c.id DESC
+                    LIMIT ?
+                """, (query, self.SEARCH_CANDIDATES, limit))
+            else:
+                # Короткий запрос или нет FTS5: просмотр таблицы от новых клиентов
+                # к старым до первых limit совпадений
+                pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                cursor.execute("""
+                    SELECT c.id, c.name, c.phone, c.order_count
+                    FROM clients c
+                    WHERE c.name LIKE ? ESCAPE '\\' OR c.phone LIKE ? ESCAPE '\\'
+                    ORDER BY c.id DESC
+                    LIMIT ?
+                """, (pattern, pattern, limit))
+            return cursor.fetchall()
+    
+    # === ПЛАНЫ ЗАПРОСОВ ===
+    
+    # Таблицы, полный просмотр которых в горячем запросе считается регрессией
+    PLAN_GUARDED_TABLES = ('orders', 'order_items')
+    
+    def _hot_queries(self) -> Dict[str, Callable]:
+        """Горячие запросы бота с типичными параметрами"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        week_end = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+        resources = self.get_resources()
+        resource_id = resources[0][0] if resources else 0
+        
+        return {
+            'get_available_quantity': lambda: self.get_available_quantity(resource_id, today, week_end, 1),
+            'get_availability_bulk': lambda: self.get_availability_bulk(today, week_end, 1),
+            'get_occupancy_timeline': lambda: self.get_occupancy_timeline(today, 30, resource_id),
+            'get_orders_for_date[start]': lambda: self.get_orders_for_date(today, 'start'),
+            'get_orders_for_date[end]': lambda: self.get_orders_for_date(today, 'end'),
+            'get_orders_for_date[all]': lambda: self.get_orders_for_date(today),
+            'get_orders_to_give_today': self.get_orders_to_give_today,
+            'get_orders_to_return_today': self.get_orders_to_return_today,
+            'get_overdue_orders': self.get_overdue_orders,
+            'get_orders_for_period': lambda: self.get_orders_for_period(today, week_end),
+            'get_items_for_orders': lambda: self.get_items_for_orders([1, 2, 3]),
+            'get_all_active_orders': self.get_all_active_orders,
+            'get_active_orders_page': self.get_active_orders_page,
+            'get_clients_page': lambda: self.get_clients_page(1),
+            'search_clients': lambda: self.search_clients('Иванов'),
+            'get_clients_report': lambda: self.get_clients_report(today, week_end),
+            'get_financial_report': lambda: self.get_financial_report(today, week_end),
+            'get_operations_report': lambda: self.get_operations_report(today, week_end),
+        }
+    
+    def check_query_plans(self) -> Dict[str, List[str]]:
+        """
+        EXPLAIN QUERY PLAN для горячих запросов. Каждый запрос выполняется
+        с трассировкой, его SQL с подставленными параметрами объясняется
+        планировщиком. Возвращает {запрос: [шаги с полным просмотром orders/order_items]}.
+        Вызывается из тестов (tests/test_query_plans.py) на пустой и заполненной базе.
+        """
+        problems: Dict[str, List[str]] = {}
+        
+        # Запросы выполняются до того, как занято соединение для EXPLAIN:
+        # при пуле из одного соединения вложенный захват ждал бы сам себя
+        traced: Dict[str, List[str]] = {}
+        for name, run in self._hot_queries().items():
+            statements = traced[name] = []
+            with self.pool.trace(statements.append):
+                run()
+        
+        with self.get_connection() as conn:
+            for name, statements in traced.items():
+                for sql in statements:
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    
+                    # Псевдонимы охраняемых таблиц: "FROM orders o" -> {'o': 'orders'}
+                    aliases = {}
+                    for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+                        if table in self.PLAN_GUARDED_TABLES:
+                            if alias.upper() in ('', 'WHERE', 'JOIN', 'ON', 'LEFT', 'INNER', 'GROUP', 'ORDER'):
+                                alias = table
+                            aliases[alias] = table
+                    
+                    for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+                        detail = row[3]
+                        words = detail.split()
+                        if len(words) > 1 and words[0] == 'SCAN' and words[1] in aliases:
+                            problems.setdefault(name, []).append(detail)
+        
+        if problems:
+            logger.error(f"Полный просмотр таблиц в горячих запросах: {problems}")
+        else:
+            logger.info("Планы горячих запросов используют индексы")
+        return problems
+    
     # === AUDIT LOG ===
     
     def log_action(self, user_id: int, action: str, entity_type: str, 
@@ -130,6 +793,178 @@ class Database:
         except Exception as e:
             logger.error(f"Ошибка записи в audit log: {e}")
     
+    # === РАССЫЛКИ ===
+    
+    # Меньше любого Telegram ID: начальное значение курсора по получателям
+    MIN_TELEGRAM_ID = -(2 ** 63)
+    
+    def find_clients_by_phone(self, phone: str) -> List[Tuple]:
+        """Клиенты с указанным телефоном: (id, name, phone, telegram_id)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, name, phone, telegram_id FROM clients WHERE phone = ? ORDER BY name",
+                (phone,)
+            )
+            return cursor.fetchall()
+    
+    def get_client(self, client_id: int) -> Optional[Tuple]:
+        """Клиент: (id, name, phone, telegram_id)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name, phone, telegram_id FROM clients WHERE id = ?", (client_id,))
+            return cursor.fetchone()
+    
+    def link_client_telegram(self, client_id: int, telegram_id: Optional[int]) -> bool:
+        """
+        Привязать клиента к Telegram ID (None - отвязать).
+        False, если клиента нет или этот Telegram ID уже привязан к другому клиенту.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE clients SET telegram_id = ? WHERE id = ?", (telegram_id, client_id))
+                conn.commit()
+                if cursor.rowcount > 0:
+                    logger.info(f"Клиент #{client_id}: telegram_id = {telegram_id}")
+                    return True
+                return False
+        except sqlite3.IntegrityError:
+            logger.warning(f"Telegram ID {telegram_id} уже привязан к другому клиенту")
+            return False
+    
+    def count_linked_clients(self) -> int:
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM clients WHERE telegram_id IS NOT NULL")
+            return cursor.fetchone()[0]
+    
+    def create_broadcast(self, text: str, created_by: int) -> Optional[int]:
+        """
+        Создать рассылку и поставить в очередь всех клиентов с Telegram.
+        Получатели копируются одним INSERT ... SELECT, без загрузки в память.
+        """
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO broadcasts (text, created_by) VALUES (?, ?)",
+                    (text, created_by)
+                )
+                broadcast_id = cursor.lastrowid
+                cursor.execute("""
+                    INSERT INTO broadcast_outbox (broadcast_id, telegram_id)
+                    SELECT ?, telegram_id FROM clients WHERE telegram_id IS NOT NULL
+                """, (broadcast_id,))
+                total = cursor.rowcount
+                cursor.execute("UPDATE broadcasts SET total = ? WHERE id = ?", (total, broadcast_id))
+            
+            logger.info(f"Рассылка #{broadcast_id} создана: {total} получателей")
+            return broadcast_id
+        except Exception as e:
+            logger.error(f"Ошибка создания рассылки: {e}")
+            return None
+    
+    def get_broadcast(self, broadcast_id: int) -> Optional[Tuple]:
+        """(id, text, created_by, status, total, sent, failed)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, text, created_by, status, total, sent, failed
+                FROM broadcasts WHERE id = ?
+            """, (broadcast_id,))
+            return cursor.fetchone()
+    
+    def get_running_broadcasts(self) -> List[int]:
+        """Незавершённые рассылки (прерваны остановкой бота)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_outbox_page(self, broadcast_id: int, after: int, limit: int) -> List[int]:
+        """Следующая страница неотправленных получателей после Telegram ID after (keyset)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT telegram_id FROM broadcast_outbox
+                WHERE broadcast_id = ? AND status = 'pending' AND telegram_id > ?
+                ORDER BY telegram_id
+                LIMIT ?
+            """, (broadcast_id, after, limit))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def mark_outbox_results(self, broadcast_id: int, results: List[Tuple[int, bool, Optional[str]]]) -> bool:
+        """Записать результаты отправки пачкой: [(telegram_id, отправлено, ошибка)]"""
+        sent = [(broadcast_id, telegram_id) for telegram_id, ok, _ in results if ok]
+        failed = [(error, broadcast_id, telegram_id) for telegram_id, ok, error in results if not ok]
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    UPDATE broadcast_outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP
+                    WHERE broadcast_id = ? AND telegram_id = ? AND status = 'pending'
+                """, sent)
+                sent_count = cursor.rowcount
+                cursor.executemany("""
+                    UPDATE broadcast_outbox SET status = 'failed', error = ?
+                    WHERE broadcast_id = ? AND telegram_id = ? AND status = 'pending'
+                """, failed)
+                failed_count = cursor.rowcount
+                cursor.execute("""
+                    UPDATE broadcasts SET sent = sent + ?, failed = failed + ?
+                    WHERE id = ?
+                """, (sent_count, failed_count, broadcast_id))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка записи результатов рассылки #{broadcast_id}: {e}")
+            return False
+    
+    def finish_broadcast(self, broadcast_id: int, status: str = 'done') -> bool:
+        """Завершить рассылку ('done' или 'cancelled')"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            """, (status, broadcast_id))
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    # === ПЛАНИРОВЩИК ===
+    
+    def get_scheduler_runs(self) -> Dict[str, Tuple]:
+        """Последние запуски задач: {job: (scheduled_for, started_at, duration, status, error)}"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT job, scheduled_for, started_at, duration, status, error
+                FROM scheduler_runs
+            """)
+            return {row[0]: row[1:] for row in cursor.fetchall()}
+    
+    def record_scheduler_run(self, job: str, scheduled_for: str, started_at: str,
+                             duration: float, status: str, error: str = None) -> bool:
+        """Сохранить результат последнего запуска задачи"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO scheduler_runs (job, scheduled_for, started_at, duration, status, error)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (job) DO UPDATE SET
+                        scheduled_for = excluded.scheduled_for,
+                        started_at = excluded.started_at,
+                        duration = excluded.duration,
+                        status = excluded.status,
+                        error = excluded.error
+                """, (job, scheduled_for, started_at, duration, status, error))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения запуска задачи {job}: {e}")
+            return False
+    
     # === КЛИЕНТЫ ===
     
     def add_client(self, name: str, phone: str) -> Optional[int]:
@@ -138,30 +973,80 @@ class Database:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("INSERT OR IGNORE INTO clients (name, phone) VALUES (?, ?)", (name, phone))
+                inserted = cursor.rowcount > 0
                 cursor.execute("SELECT id FROM clients WHERE name = ? AND phone = ?", (name, phone))
                 client_id = cursor.fetchone()[0]
                 conn.commit()
+                if inserted:
+                    self._bump_data_version()
                 logger.info(f"Клиент добавлен/получен: {name} (ID: {client_id})")
                 return client_id
         except Exception as e:
             logger.error(f"Ошибка добавления клиента: {e}")
             return None
     
-    def get_all_clients(self) -> List[Tuple]:
-        """Получить всех клиентов"""
+    def get_all_clients(self, limit: Optional[int] = None) -> List[Tuple]:
+        """Клиенты, недавно заказывавшие - первыми: (id, name, phone, order_count, last_order)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT c.id, c.name, c.phone, 
-                       COUNT(o.id) as order_count,
-                       MAX(o.created_at) as last_order
-                FROM clients c
-                LEFT JOIN orders o ON c.id = o.client_id
-                GROUP BY c.id, c.name, c.phone
-                ORDER BY last_order DESC NULLS LAST
-            """)
+                SELECT id, name, phone, order_count, last_order_at
+                FROM clients
+                ORDER BY last_order_at DESC
+                LIMIT ?
+            """, (-1 if limit is None else limit,))
             return cursor.fetchall()
     
+    @staticmethod
+    def _keyset_result(rows: List[Tuple], cursor, forward: bool, limit: int) -> Tuple[List[Tuple], bool, bool]:
+        """
+        Страница keyset-пагинации из limit + 1 строк, прочитанных в направлении листания.
+        Возвращает (строки в порядке списка, есть предыдущая, есть следующая).
+        """
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if forward:
+            return rows, cursor is not None, more
+        rows.reverse()
+        return rows, more, True
+    
+    def get_clients_page(self, cursor: Optional[int] = None, forward: bool = True,
+                         limit: int = 10) -> Tuple[List[Tuple], bool, bool]:
+        """
+        Страница клиентов по алфавиту (name, id): [(id, name, phone, order_count)].
+        cursor - ID последнего клиента предыдущей страницы (forward) или первого
+        клиента следующей (назад); имя для сравнения берётся по ID.
+        Возвращает (клиенты, есть предыдущая, есть следующая).
+        """
+        condition, params = "", []
+        if cursor is not None:
+            sign = '>' if forward else '<'
+            condition = f"WHERE (c.name, c.id) {sign} (SELECT name, id FROM clients WHERE id = ?)"
+            params.append(cursor)
+        direction = 'ASC' if forward else 'DESC'
+        
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.execute(f"""
+                SELECT c.id, c.name, c.phone, c.order_count
+                FROM clients c
+                {condition}
+                ORDER BY c.name {direction}, c.id {direction}
+                LIMIT ?
+            """, params + [limit + 1])
+            rows = db_cursor.fetchall()
+        
+        if not rows and cursor is not None:
+            # Граница пропала (клиент не найден) - начинаем сначала
+            return self.get_clients_page(limit=limit)
+        return self._keyset_result(rows, cursor, forward, limit)
+    
+    def count_clients(self) -> int:
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM clients")
+            return cursor.fetchone()[0]
+    
     def get_client_by_id(self, client_id: int) -> Optional[Tuple]:
         """Получить клиента по ID"""
         with self.get_connection() as conn:
@@ -171,6 +1056,53 @@ class Database:
     
     # === РЕСУРСЫ ===
     
+    def _load_catalogue(self) -> Dict[int, Tuple]:
+        """Загрузить каталог ресурсов из базы в кэш"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name, description, total_quantity FROM resources ORDER BY name")
+            rows = cursor.fetchall()
+        
+        with self._catalogue_lock:
+            self._catalogue = {row[0]: row for row in rows}
+            self._catalogue_sorted = rows
+        return self._catalogue
+    
+    def _get_catalogue(self) -> Dict[int, Tuple]:
+        with self._catalogue_lock:
+            if self._catalogue is not None:
+                self.catalogue_hits += 1
+                return self._catalogue
+            self.catalogue_misses += 1
+        return self._load_catalogue()
+    
+    def _update_catalogue(self, resource_id: int, row: Optional[Tuple]):
+        """Сквозное обновление кэша после записи в resources (row=None - удаление)"""
+        with self._catalogue_lock:
+            self.catalogue_version += 1
+            if self._catalogue is not None:
+                if row is None:
+                    self._catalogue.pop(resource_id, None)
+                else:
+                    self._catalogue[resource_id] = row
+                self._catalogue_sorted = sorted(self._catalogue.values(), key=lambda r: r[1])
+        
+        # Названия и количества ресурсов входят в отчёты
+        self._bump_data_version()
+    
+    def get_catalogue_stats(self) -> Dict:
+        """Статистика кэша каталога ресурсов"""
+        with self._catalogue_lock:
+            requests = self.catalogue_hits + self.catalogue_misses
+            return {
+                'cached': self._catalogue is not None,
+                'size': len(self._catalogue or {}),
+                'version': self.catalogue_version,
+                'hits': self.catalogue_hits,
+                'misses': self.catalogue_misses,
+                'hit_rate': self.catalogue_hits / requests if requests else 0.0,
+            }
+    
     def add_resource(self, name: str, description: str = "", quantity: int = 1) -> bool:
         try:
             with self.get_connection() as conn:
@@ -180,23 +1112,50 @@ class Database:
                     (name, description, quantity)
                 )
                 conn.commit()
-                logger.info(f"Ресурс добавлен: {name} ({quantity} шт.)")
-                return True
+                resource_id = cursor.lastrowid
+            
+            self._update_catalogue(resource_id, (resource_id, name, description, quantity))
+            logger.info(f"Ресурс добавлен: {name} ({quantity} шт.)")
+            return True
         except sqlite3.IntegrityError:
             logger.warning(f"Ресурс уже существует: {name}")
             return False
     
     def get_resources(self) -> List[Tuple]:
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name, description, total_quantity FROM resources ORDER BY name")
-            return cursor.fetchall()
+        if not self.cache_catalogue:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id, name, description, total_quantity FROM resources ORDER BY name")
+                return cursor.fetchall()
+        
+        self._get_catalogue()
+        with self._catalogue_lock:
+            return list(self._catalogue_sorted)
     
     def get_resource_info(self, resource_id: int) -> Optional[Tuple]:
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name, total_quantity FROM resources WHERE id = ?", (resource_id,))
-            return cursor.fetchone()
+        if not self.cache_catalogue:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id, name, total_quantity FROM resources WHERE id = ?", (resource_id,))
+                return cursor.fetchone()
+        
+        row = self._get_catalogue().get(resource_id)
+        if row is None:
+            return None
+        return (row[0], row[1], row[3])
+    
+    def get_resource(self, resource_id: int) -> Optional[Tuple]:
+        """Полная запись ресурса: (id, name, description, total_quantity)"""
+        if not self.cache_catalogue:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT id, name, description, total_quantity FROM resources WHERE id = ?",
+                    (resource_id,)
+                )
+                return cursor.fetchone()
+        
+        return self._get_catalogue().get(resource_id)
     
     def update_resource(self, resource_id: int, name: str = None, description: str = None, 
                        total_quantity: int = None) -> bool:
@@ -223,38 +1182,52 @@ class Database:
                 params.append(resource_id)
                 query = f"UPDATE resources SET {', '.join(updates)} WHERE id = ?"
                 cursor.execute(query, params)
-                conn.commit()
                 
-                if cursor.rowcount > 0:
-                    logger.info(f"Ресурс обновлён: ID {resource_id}")
-                    return True
-                return False
+                if cursor.rowcount == 0:
+                    return False
+                
+                cursor.execute(
+                    "SELECT id, name, description, total_quantity FROM resources WHERE id = ?",
+                    (resource_id,)
+                )
+                row = cursor.fetchone()
+                conn.commit()
+            
+            self._update_catalogue(resource_id, row)
+            logger.info(f"Ресурс обновлён: ID {resource_id}")
+            return True
         except Exception as e:
             logger.error(f"Ошибка обновления ресурса: {e}")
             return False
     
     def delete_resource(self, resource_id: int) -> bool:
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM resources WHERE id = ?", (resource_id,))
-            conn.commit()
-            if cursor.rowcount > 0:
-                logger.info(f"Ресурс удалён: ID {resource_id}")
-                return True
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM resources WHERE id = ?", (resource_id,))
+                conn.commit()
+                if cursor.rowcount == 0:
+                    return False
+            
+            self._update_catalogue(resource_id, None)
+            logger.info(f"Ресурс удалён: ID {resource_id}")
+            return True
+        except sqlite3.IntegrityError:
+            # foreign_keys=ON: ресурс используется в заказах
+            logger.warning(f"Ресурс ID {resource_id} используется в заказах и не может быть удалён")
             return False
     
     def get_available_quantity(self, resource_id: int, start_date: str, end_date: str, 
                                exclude_order_id: int = None) -> int:
         """Получить доступное количество ресурса на период"""
+        resource = self.get_resource_info(resource_id)
+        if not resource:
+            return 0
+        total = resource[2]
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("SELECT total_quantity FROM resources WHERE id = ?", (resource_id,))
-            result = cursor.fetchone()
-            if not result:
-                return 0
-            total = result[0]
-            
             query = """
                 SELECT SUM(oi.quantity) 
                 FROM order_items oi
@@ -274,6 +1247,98 @@ class Database:
             
             return total - booked
     
+    def _query_availability(self, cursor, start_date: str, end_date: str,
+                            exclude_order_id: int = None,
+                            resource_ids: List[int] = None) -> Dict[int, int]:
+        """Доступность ресурсов на период на переданном курсоре (в т.ч. внутри транзакции)"""
+        # CROSS JOIN фиксирует порядок: сначала активные заказы по индексу статуса,
+        # затем их позиции; иначе со статистикой планировщик просматривает все позиции
+        exclude_condition = "AND o.id != ?" if exclude_order_id else ""
+        query = f"""
+            SELECT r.id, r.total_quantity - COALESCE(b.booked, 0)
+            FROM resources r
+            LEFT JOIN (
+                SELECT oi.resource_id, SUM(oi.quantity) AS booked
+                FROM orders o
+                CROSS JOIN order_items oi ON oi.order_id = o.id
+                WHERE o.status IN ('pending', 'issued', 'overdue')
+                AND NOT (o.end_date < ? OR o.start_date > ?)
+                {exclude_condition}
+                GROUP BY oi.resource_id
+            ) b ON b.resource_id = r.id
+        """
+        params = [start_date, end_date]
+        if exclude_order_id:
+            params.append(exclude_order_id)
+        
+        if resource_ids is not None:
+            if not resource_ids:
+                return {}
+            query += f" WHERE r.id IN ({', '.join('?' * len(resource_ids))})"
+            params.extend(resource_ids)
+        
+        cursor.execute(query, params)
+        return {resource_id: available for resource_id, available in cursor.fetchall()}
+    
+    def get_availability_bulk(self, start_date: str, end_date: str,
+                              exclude_order_id: int = None) -> Dict[int, int]:
+        """Получить доступное количество всех ресурсов на период одним запросом"""
+        with self.get_connection() as conn:
+            return self._query_availability(conn.cursor(), start_date, end_date, exclude_order_id)
+    
+    def get_occupancy_timeline(self, start_date: str, days: int,
+                               resource_id: int = None) -> Dict[int, List[int]]:
+        """
+        Забронированное количество по дням: {resource_id: [занято в день 0, день 1, ...]}.
+        Один запрос по пересекающимся заказам + префиксные суммы по событиям
+        начала/окончания. В результат попадают только ресурсы с бронями.
+        """
+        if days <= 0:
+            return {}
+        
+        horizon_start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        horizon_end = horizon_start + timedelta(days=days - 1)
+        
+        query = """
+            SELECT oi.resource_id, o.start_date, o.end_date, SUM(oi.quantity)
+            FROM order_items oi
+            JOIN orders o ON oi.order_id = o.id
+            WHERE o.status IN ('pending', 'issued', 'overdue')
+            AND NOT (o.end_date < ? OR o.start_date > ?)
+        """
+        params = [horizon_start.isoformat(), horizon_end.isoformat()]
+        
+        if resource_id is not None:
+            query += " AND oi.resource_id = ?"
+            params.append(resource_id)
+        
+        query += " GROUP BY oi.resource_id, o.start_date, o.end_date"
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+        
+        # Разностный массив: +qty в день начала, -qty на следующий день после окончания
+        deltas: Dict[int, List[int]] = {}
+        for res_id, order_start, order_end, quantity in rows:
+            first = max((datetime.strptime(order_start, '%Y-%m-%d').date() - horizon_start).days, 0)
+            last = min((datetime.strptime(order_end, '%Y-%m-%d').date() - horizon_start).days, days - 1)
+            diff = deltas.setdefault(res_id, [0] * (days + 1))
+            diff[first] += quantity
+            diff[last + 1] -= quantity
+        
+        timeline = {}
+        for res_id, diff in deltas.items():
+            booked = []
+            running = 0
+            for delta in diff[:days]:
+                running += delta
+                booked.append(running)
+            timeline[res_id] = booked
+        
+        return timeline
+    
     def check_availability(self, resource_id: int, start_date: str, end_date: str, 
                           quantity: int = 1, exclude_order_id: int = None) -> bool:
         """Проверить доступность ресурса"""
@@ -283,24 +1348,33 @@ class Database:
     # === ЗАКАЗЫ (АТОМАРНОЕ СОЗДАНИЕ) ===
     
     def create_order_with_items(self, client_id: int, start_date: str, end_date: str,
-                               delivery_type: str, delivery_comment: str, cost: str,
+                               delivery_type: str, delivery_comment: str, cost_minor: Optional[int],
                                created_by: int, items: List[Dict]) -> Optional[int]:
         """
         Создать заказ с позициями в одной атомарной транзакции.
+        cost_minor - стоимость в копейках (None - не указана).
+        Проверка остатков и вставка выполняются на одном соединении внутри
+        BEGIN IMMEDIATE, поэтому параллельные создания не могут перебронировать ресурс.
         """
+        # Суммируем количество по ресурсам (одна позиция может встречаться несколько раз)
+        requested: Dict[int, int] = {}
+        for item in items:
+            requested[item['resource_id']] = requested.get(item['resource_id'], 0) + item['quantity']
+        
         try:
-            with self.get_connection() as conn:
+            with self.transaction() as conn:
                 cursor = conn.cursor()
                 
-                # 1. Проверяем доступность ВСЕХ ресурсов перед созданием
-                for item in items:
-                    available = self.get_available_quantity(
-                        item['resource_id'], start_date, end_date
-                    )
-                    if available < item['quantity']:
+                # 1. Проверяем доступность ВСЕХ ресурсов одним запросом внутри транзакции
+                availability = self._query_availability(
+                    cursor, start_date, end_date, resource_ids=list(requested)
+                )
+                for resource_id, quantity in requested.items():
+                    available = availability.get(resource_id, 0)
+                    if available < quantity:
                         logger.error(
-                            f"Недостаточно ресурса {item['resource_id']}: "
-                            f"нужно {item['quantity']}, доступно {available}"
+                            f"Недостаточно ресурса {resource_id}: "
+                            f"нужно {quantity}, доступно {available}"
                         )
                         return None
                 
@@ -308,39 +1382,103 @@ class Database:
                 cursor.execute("""
                     INSERT INTO orders 
                     (client_id, start_date, end_date, delivery_type, 
-                     delivery_comment, cost, created_by, status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')
+                     delivery_comment, cost, cost_minor, created_by, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')
                 """, (client_id, start_date, end_date, delivery_type, 
-                      delivery_comment, cost, created_by))
+                      delivery_comment, format_money(cost_minor), cost_minor, created_by))
                 
                 order_id = cursor.lastrowid
                 
                 # 3. Добавляем все позиции
-                for item in items:
-                    cursor.execute("""
-                        INSERT INTO order_items (order_id, resource_id, quantity)
-                        VALUES (?, ?, ?)
-                    """, (order_id, item['resource_id'], item['quantity']))
+                cursor.executemany("""
+                    INSERT INTO order_items (order_id, resource_id, quantity)
+                    VALUES (?, ?, ?)
+                """, [(order_id, item['resource_id'], item['quantity']) for item in items])
                 
-                # 4. Коммитим только если всё успешно
-                conn.commit()
-                
-                # 5. Логируем действие
-                self.log_action(
-                    user_id=created_by,
-                    action='created',
-                    entity_type='order',
-                    entity_id=order_id,
-                    details=f"Создан заказ с {len(items)} позициями"
+                # 4. Коммит выполняется при выходе из транзакции
+            
+            self._bump_data_version(order_id)
+            if self.ledger is not None:
+                self.ledger.add_order(
+                    order_id, start_date, end_date,
+                    [(item['resource_id'], item['quantity']) for item in items]
                 )
-                
-                logger.info(f"Заказ #{order_id} создан с {len(items)} позициями")
-                return order_id
+            
+            # 5. Логируем действие
+            self.log_action(
+                user_id=created_by,
+                action='created',
+                entity_type='order',
+                entity_id=order_id,
+                details=f"Создан заказ с {len(items)} позициями"
+            )
+            
+            logger.info(f"Заказ #{order_id} создан с {len(items)} позициями")
+            return order_id
                 
         except Exception as e:
             logger.error(f"Ошибка создания заказа с позициями: {e}")
             return None
     
+    # === ЖУРНАЛ БРОНЕЙ ===
+    
+    def _get_active_reservations(self) -> List[Tuple]:
+        """Активные брони: (order_id, resource_id, start_date, end_date, quantity)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT o.id, oi.resource_id, o.start_date, o.end_date, oi.quantity
+                FROM orders o
+                JOIN order_items oi ON oi.order_id = o.id
+                WHERE o.status IN ('pending', 'issued', 'overdue')
+            """)
+            return cursor.fetchall()
+    
+    def get_peak_usage_bulk(self, start_date: str, end_date: str) -> Dict[int, int]:
+        """
+        Пиковая одновременная загрузка каждого ресурса за период: {resource_id: единиц}.
+        С журналом броней - O(log n) на ресурс, без него - один запрос по дням.
+        """
+        if self.ledger is not None:
+            return {
+                resource_id: self.ledger.peak_usage(resource_id, start_date, end_date)
+                for resource_id in self.ledger.resource_ids()
+            }
+        
+        days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+        timeline = self.get_occupancy_timeline(start_date, days)
+        return {resource_id: max(booked) for resource_id, booked in timeline.items()}
+    
+    def verify_ledger(self, horizon_days: int = 365) -> List[str]:
+        """
+        Сверить журнал броней с базой: состав броней и пиковую загрузку
+        по дням на горизонте horizon_days. Возвращает список расхождений.
+        """
+        if self.ledger is None:
+            return []
+        
+        problems = self.ledger.diff(self._get_active_reservations())
+        
+        start_date = datetime.now().strftime('%Y-%m-%d')
+        start = datetime.now().date()
+        timeline = self.get_occupancy_timeline(start_date, horizon_days)
+        for resource_id in set(timeline) | set(self.ledger.resource_ids()):
+            booked = timeline.get(resource_id, [0] * horizon_days)
+            for day, expected in enumerate(booked):
+                day_str = (start + timedelta(days=day)).strftime('%Y-%m-%d')
+                actual = self.ledger.peak_usage(resource_id, day_str, day_str)
+                if actual != expected:
+                    problems.append(
+                        f"ресурс {resource_id}, {day_str}: в базе {expected}, в журнале {actual}"
+                    )
+                    break
+        
+        if problems:
+            logger.error(f"Журнал броней расходится с базой ({len(problems)}): {problems[:5]}")
+        else:
+            logger.info("Журнал броней согласован с базой")
+        return problems
+    
     def get_order_items(self, order_id: int) -> List[Tuple]:
         """Получить все позиции заказа"""
         try:
@@ -358,6 +1496,40 @@ class Database:
             logger.error(f"Ошибка получения позиций заказа {order_id}: {e}")
             return []
     
+    def get_items_for_orders(self, order_ids: List[int]) -> Dict[int, List[Tuple]]:
+        """
+        Получить позиции сразу для нескольких заказов: {order_id: [(id, name, quantity, resource_id)]}.
+        Один запрос IN (...) на пачку заказов вместо запроса на каждый заказ.
+        """
+        result = {order_id: [] for order_id in order_ids}
+        if not result:
+            return result
+        
+        ids = list(result)
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                for i in range(0, len(ids), self.IN_BATCH_SIZE):
+                    batch = ids[i:i + self.IN_BATCH_SIZE]
+                    placeholders = ", ".join("?" * len(batch))
+                    cursor.execute(f"""
+                        SELECT oi.order_id, oi.id, r.name, oi.quantity, r.id
+                        FROM order_items oi
+                        JOIN resources r ON oi.resource_id = r.id
+                        WHERE oi.order_id IN ({placeholders})
+                        ORDER BY oi.order_id, oi.id
+                    """, batch)
+                    for order_id, item_id, name, quantity, resource_id in cursor.fetchall():
+                        result[order_id].append((item_id, name, quantity, resource_id))
+        except Exception as e:
+            logger.error(f"Ошибка получения позиций заказов: {e}")
+        return result
+    
+    def attach_items(self, orders: List[Tuple]) -> List[Tuple[Tuple, List[Tuple]]]:
+        """Список заказов с уже подгруженными позициями: [(order, items), ...]"""
+        items = self.get_items_for_orders([order[0] for order in orders])
+        return [(order, items[order[0]]) for order in orders]
+    
     # === КОНТРОЛЬ ВОЗВРАТА ===
     
     def get_orders_to_give_today(self) -> List[Tuple]:
@@ -455,6 +1627,8 @@ class Database:
                 conn.commit()
                 
                 if cursor.rowcount > 0:
+                    self._bump_data_version(order_id)
+                    # Выданный заказ остаётся активной бронью - журнал не меняется
                     self.log_action(
                         user_id=issued_by,
                         action='issued',
@@ -489,6 +1663,9 @@ class Database:
                 conn.commit()
                 
                 if cursor.rowcount > 0:
+                    self._bump_data_version(order_id)
+                    if self.ledger is not None:
+                        self.ledger.remove_order(order_id)
                     self.log_action(
                         user_id=confirmed_by,
                         action='confirmed_return',
@@ -518,11 +1695,14 @@ class Database:
                     WHERE end_date < ? 
                       AND status = 'issued'
                       AND return_confirmed = 0
+                    RETURNING id
                 """, (today,))
+                order_ids = [row[0] for row in cursor.fetchall()]
                 conn.commit()
                 
-                count = cursor.rowcount
+                count = len(order_ids)
                 if count > 0:
+                    self._bump_data_version(*order_ids)
                     logger.warning(f"Обновлено статусов 'overdue': {count}")
                 return count
                 
@@ -537,9 +1717,8 @@ class Database:
         orders = self.get_all_active_orders()
         result = []
         
-        for order in orders:
+        for order, items in self.attach_items(orders):
             order_id = order[0]
-            items = self.get_order_items(order_id)
             
             for item in items:
                 _, resource_name, quantity, resource_id = item
@@ -635,6 +1814,8 @@ class Database:
             return None
     
     def get_orders_for_period(self, start_date: str, end_date: str) -> List[Tuple]:
+        # +o.start_date: порядок не берётся из индекса по дате, иначе планировщик
+        # просматривает его целиком вместо поиска активных заказов по статусу
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -644,11 +1825,12 @@ class Database:
                 JOIN clients c ON o.client_id = c.id
                 WHERE NOT (o.end_date < ? OR o.start_date > ?)
                 AND o.status IN ('pending', 'issued', 'overdue')
-                ORDER BY o.start_date
+                ORDER BY +o.start_date
             """, (start_date, end_date))
             return cursor.fetchall()
     
     def get_all_active_orders(self) -> List[Tuple]:
+        # +o.start_date - см. get_orders_for_period
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -657,10 +1839,154 @@ class Database:
                 FROM orders o
                 JOIN clients c ON o.client_id = c.id
                 WHERE o.status IN ('pending', 'issued', 'overdue')
-                ORDER BY o.start_date DESC, o.id DESC
+                ORDER BY +o.start_date DESC, o.id DESC
             """)
             return cursor.fetchall()
     
+    # Больше любого (start_date, id): курсор первой страницы активных заказов
+    ACTIVE_ORDERS_FIRST_CURSOR = ('9999-12-31', 0)
+    
+    def get_active_orders_page(self, cursor: Optional[Tuple[str, int]] = None, forward: bool = True,
+                               limit: int = 10) -> Tuple[List[Tuple], bool, bool]:
+        """
+        Страница активных заказов в порядке get_all_active_orders (start_date DESC, id DESC).
+        cursor - (start_date, id) последнего заказа предыдущей страницы (forward)
+        или первого заказа следующей (назад).
+        Возвращает (заказы, есть предыдущая, есть следующая).
+        """
+        sign = '<' if forward else '>'
+        direction = 'DESC' if forward else 'ASC'
+        
+        # Без статистики ANALYZE планировщик выбирает idx_orders_status_dates
+        # и сортирует все активные заказы ради одной страницы
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.execute(f"""
+                SELECT o.id, c.name, c.phone, o.start_date, o.end_date,
+                       o.delivery_type, o.delivery_comment, o.cost, o.status
+                FROM orders o INDEXED BY idx_orders_active_start
+                JOIN clients c ON o.client_id = c.id
+                WHERE o.status IN ('pending', 'issued', 'overdue')
+                  AND (o.start_date, o.id) {sign} (?, ?)
+                ORDER BY o.start_date {direction}, o.id {direction}
+                LIMIT ?
+            """, (*(cursor or self.ACTIVE_ORDERS_FIRST_CURSOR), limit + 1))
+            rows = db_cursor.fetchall()
+        
+        if not rows and cursor is not None:
+            # Все заказы страницы завершены или удалены - начинаем сначала
+            return self.get_active_orders_page(limit=limit)
+        return self._keyset_result(rows, cursor, forward, limit)
+    
+    def count_active_orders(self) -> int:
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM orders WHERE status IN ('pending', 'issued', 'overdue')")
+            return cursor.fetchone()[0]
+    
+    def reschedule_order(self, order_id: int, start_date: str, end_date: str,
+                         changed_by: int = None) -> Tuple[bool, List[Dict]]:
+        """
+        Перенести заказ на новые даты в одной транзакции BEGIN IMMEDIATE.
+        Все позиции проверяются одним запросом доступности (без учёта самого заказа).
+        Возвращает (успех, конфликты); конфликт - dict с ключами
+        resource_id, name, requested, available.
+        """
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT oi.resource_id, r.name, SUM(oi.quantity)
+                    FROM order_items oi
+                    JOIN resources r ON oi.resource_id = r.id
+                    WHERE oi.order_id = ?
+                    GROUP BY oi.resource_id, r.name
+                """, (order_id,))
+                requested = cursor.fetchall()
+                
+                availability = self._query_availability(
+                    cursor, start_date, end_date,
+                    exclude_order_id=order_id,
+                    resource_ids=[resource_id for resource_id, _, _ in requested]
+                )
+                conflicts = [
+                    {
+                        'resource_id': resource_id,
+                        'name': name,
+                        'requested': quantity,
+                        'available': availability.get(resource_id, 0)
+                    }
+                    for resource_id, name, quantity in requested
+                    if availability.get(resource_id, 0) < quantity
+                ]
+                if conflicts:
+                    return False, conflicts
+                
+                cursor.execute(
+                    "UPDATE orders SET start_date = ?, end_date = ? WHERE id = ?",
+                    (start_date, end_date, order_id)
+                )
+                if cursor.rowcount == 0:
+                    logger.warning(f"Заказ #{order_id} не найден для переноса")
+                    return False, []
+            
+            self._bump_data_version(order_id)
+            if self.ledger is not None:
+                self.ledger.move_order(order_id, start_date, end_date)
+            
+            if changed_by is not None:
+                self.log_action(
+                    user_id=changed_by,
+                    action='rescheduled',
+                    entity_type='order',
+                    entity_id=order_id,
+                    details=f"Новые даты: {start_date} — {end_date}"
+                )
+            logger.info(f"Заказ #{order_id} перенесён на {start_date} — {end_date}")
+            return True, []
+        
+        except Exception as e:
+            logger.error(f"Ошибка переноса заказа #{order_id}: {e}")
+            return False, []
+    
+    def update_order_cost(self, order_id: int, cost_minor: Optional[int]) -> bool:
+        """Изменить стоимость заказа (в копейках, None - не указана)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE orders SET cost = ?, cost_minor = ? WHERE id = ?",
+                    (format_money(cost_minor), cost_minor, order_id)
+                )
+                updated = cursor.rowcount > 0
+                # Исправленная сумма больше не требует внимания
+                cursor.execute("DELETE FROM cost_quarantine WHERE order_id = ?", (order_id,))
+                conn.commit()
+                if updated:
+                    self._bump_data_version(order_id)
+                return updated
+        except Exception as e:
+            logger.error(f"Ошибка обновления стоимости заказа #{order_id}: {e}")
+            return False
+    
+    def update_order_comment(self, order_id: int, comment: str) -> bool:
+        """Изменить комментарий заказа"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE orders SET delivery_comment = ? WHERE id = ?",
+                    (comment, order_id)
+                )
+                conn.commit()
+                if cursor.rowcount > 0:
+                    self._bump_data_version(order_id)
+                    return True
+                return False
+        except Exception as e:
+            logger.error(f"Ошибка обновления комментария заказа #{order_id}: {e}")
+            return False
+    
     def mark_order_completed(self, order_id: int) -> bool:
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -670,6 +1996,9 @@ class Database:
             )
             conn.commit()
             if cursor.rowcount > 0:
+                self._bump_data_version(order_id)
+                if self.ledger is not None:
+                    self.ledger.remove_order(order_id)
                 logger.info(f"Заказ #{order_id} отмечен как завершённый")
                 return True
             return False
@@ -680,92 +2009,243 @@ class Database:
             cursor.execute("DELETE FROM orders WHERE id = ?", (order_id,))
             conn.commit()
             if cursor.rowcount > 0:
+                self._bump_data_version(order_id)
+                if self.ledger is not None:
+                    self.ledger.remove_order(order_id)
                 logger.info(f"Заказ удалён: #{order_id}")
                 return True
             return False
     
     # === ОТЧЁТЫ ===
     
-    def get_clients_report(self, start_date: str = None, end_date: str = None) -> List[Tuple]:
+    @staticmethod
+    def _created_range(column: str, start_date: str = None, end_date: str = None) -> Tuple[str, List[str]]:
+        """
+        Условие по дате создания в виде полуинтервала [start_date, end_date + 1 день).
+        created_at хранится как 'ГГГГ-ММ-ДД ЧЧ:ММ:СС', поэтому строковое сравнение
+        работает по индексу idx_orders_created, в отличие от DATE(created_at).
+        """
+        condition = ""
+        params = []
+        if start_date:
+            condition += f" AND {column} >= ?"
+            params.append(start_date)
+        if end_date:
+            next_day = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+            condition += f" AND {column} < ?"
+            params.append(next_day.strftime('%Y-%m-%d'))
+        return condition, params
+    
+    @staticmethod
+    def _day_range(column: str, start_date: str = None, end_date: str = None) -> Tuple[str, List[str]]:
+        """Условие по дню дневных сводок: [start_date, end_date] включительно"""
+        condition = ""
+        params = []
+        if start_date:
+            condition += f" AND {column} >= ?"
+            params.append(start_date)
+        if end_date:
+            condition += f" AND {column} <= ?"
+            params.append(end_date)
+        return condition, params
+    
+    def _iter_rows(self, query: str, params: List) -> Iterator[Tuple]:
+        """
+        Построчное чтение результата порциями по REPORT_CHUNK_SIZE.
+        Соединение остаётся занятым до конца итерации.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            query = """
-                SELECT c.name, c.phone, 
-                       MIN(o.created_at) as first_order,
-                       MAX(o.created_at) as last_order,
-                       COUNT(o.id) as total_orders,
-                       SUM(CASE WHEN o.cost != '' THEN CAST(o.cost AS REAL) ELSE 0 END) as total_spent
-                FROM clients c
-                LEFT JOIN orders o ON c.id = o.client_id
-                WHERE 1=1
-            """
-            params = []
-            
-            if start_date:
-                query += " AND DATE(o.created_at) >= ?"
-                params.append(start_date)
-            if end_date:
-                query += " AND DATE(o.created_at) <= ?"
-                params.append(end_date)
-            
-            query += " GROUP BY c.id, c.name, c.phone HAVING COUNT(o.id) > 0 ORDER BY last_order DESC"
-            
             cursor.execute(query, params)
-            return cursor.fetchall()
+            while True:
+                rows = cursor.fetchmany(self.REPORT_CHUNK_SIZE)
+                if not rows:
+                    return
+                yield from rows
+    
+    def iter_clients_report(self, start_date: str = None, end_date: str = None) -> Iterator[Tuple]:
+        """Клиенты с заказами за период: (name, phone, first_order, last_order, total_orders, total_spent)"""
+        query = """
+            SELECT c.name, c.phone, 
+                   MIN(o.created_at) as first_order,
+                   MAX(o.created_at) as last_order,
+                   COUNT(o.id) as total_orders,
+                   TOTAL(o.cost_minor) / 100.0 as total_spent
+            FROM clients c
+            LEFT JOIN orders o ON c.id = o.client_id
+            WHERE 1=1
+        """
+        condition, params = self._created_range("o.created_at", start_date, end_date)
+        query += condition
+        query += " GROUP BY c.id, c.name, c.phone HAVING COUNT(o.id) > 0 ORDER BY last_order DESC"
+        return self._iter_rows(query, params)
+    
+    def get_clients_report(self, start_date: str = None, end_date: str = None) -> List[Tuple]:
+        return list(self.iter_clients_report(start_date, end_date))
     
     def get_financial_report(self, start_date: str = None, end_date: str = None) -> Tuple:
+        """(total_orders, total_revenue, avg_order) за период по дневным сводкам"""
+        condition, params = self._day_range("day", start_date, end_date)
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            query = """
+            cursor.execute(f"""
                 SELECT 
-                    COUNT(*) as total_orders,
-                    SUM(CASE WHEN cost != '' THEN CAST(cost AS REAL) ELSE 0 END) as total_revenue,
-                    AVG(CASE WHEN cost != '' THEN CAST(cost AS REAL) ELSE 0 END) as avg_order
-                FROM orders
-                WHERE 1=1
-            """
-            params = []
-            
-            if start_date:
-                query += " AND DATE(created_at) >= ?"
-                params.append(start_date)
-            if end_date:
-                query += " AND DATE(created_at) <= ?"
-                params.append(end_date)
-            
-            cursor.execute(query, params)
-            return cursor.fetchone()
+                    TOTAL(orders) as total_orders,
+                    TOTAL(revenue_minor) / 100.0 as total_revenue
+                FROM daily_order_stats
+                WHERE 1=1 {condition}
+            """, params)
+            total_orders, total_revenue = cursor.fetchone()
+            total_orders = int(total_orders)
+            avg_order = total_revenue / total_orders if total_orders else None
+            return total_orders, total_revenue, avg_order
+    
+    def get_new_clients_count(self, start_date: str = None, end_date: str = None) -> int:
+        """Число клиентов, добавленных за период"""
+        condition, params = self._day_range("day", start_date, end_date)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT TOTAL(clients) FROM daily_new_clients WHERE 1=1 {condition}", params)
+            return int(cursor.fetchone()[0])
+    
+    def get_resource_units(self, start_date: str = None, end_date: str = None) -> List[Tuple]:
+        """Забронировано единиц по ресурсам в заказах за период: (name, units), по убыванию"""
+        condition, params = self._day_range("u.day", start_date, end_date)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT r.name, SUM(u.units) as units
+                FROM daily_resource_units u
+                JOIN resources r ON r.id = u.resource_id
+                WHERE 1=1 {condition}
+                GROUP BY u.resource_id
+                HAVING SUM(u.units) > 0
+                ORDER BY units DESC, r.name
+            """, params)
+            return cursor.fetchall()
+    
+    def get_cost_quarantine(self) -> List[Tuple]:
+        """Заказы с неразборчивой стоимостью: (order_id, client_name, raw_value, reason, detected_at)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT q.order_id, c.name, q.raw_value, q.reason, q.detected_at
+                FROM cost_quarantine q
+                JOIN orders o ON o.id = q.order_id
+                JOIN clients c ON c.id = o.client_id
+                ORDER BY q.order_id
+            """)
+            return cursor.fetchall()
+    
+    def iter_operations_report(self, start_date: str = None, end_date: str = None) -> Iterator[Tuple]:
+        """
+        Заказы за период, новые первыми:
+        (id, client_name, client_phone, start_date, end_date, cost, status, created_at, completed_at)
+        """
+        query = """
+            SELECT o.id, c.name, c.phone, o.start_date, o.end_date,
+                   o.cost, o.status, o.created_at, o.completed_at
+            FROM orders o
+            JOIN clients c ON o.client_id = c.id
+            WHERE 1=1
+        """
+        condition, params = self._created_range("o.created_at", start_date, end_date)
+        query += condition
+        query += " ORDER BY o.created_at DESC"
+        return self._iter_rows(query, params)
     
     def get_operations_report(self, start_date: str = None, end_date: str = None) -> List[Tuple]:
+        return list(self.iter_operations_report(start_date, end_date))
+    
+    def get_status_counts(self, start_date: str = None, end_date: str = None) -> Dict[str, int]:
+        """Число заказов за период по статусам (по дневным сводкам)"""
+        condition, params = self._day_range("day", start_date, end_date)
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            query = """
-                SELECT o.id, c.name, c.phone, o.start_date, o.end_date,
-                       o.cost, o.status, o.created_at, o.completed_at
+            cursor.execute(f"""
+                SELECT status, SUM(orders) FROM daily_order_stats
+                WHERE 1=1 {condition}
+                GROUP BY status
+                HAVING SUM(orders) > 0
+            """, params)
+            return dict(cursor.fetchall())
+    
+    def get_report_text_widths(self, start_date: str = None, end_date: str = None) -> Dict[str, int]:
+        """
+        Максимальная длина текстовых полей заказов за период (для ширины столбцов отчёта,
+        которую в потоковом режиме нужно знать до первой строки)
+        """
+        condition, params = self._created_range("o.created_at", start_date, end_date)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT MAX(LENGTH(c.name)), MAX(LENGTH(c.phone)),
+                       MAX(LENGTH(c.name) + LENGTH(c.phone)), MAX(LENGTH(o.cost))
                 FROM orders o
                 JOIN clients c ON o.client_id = c.id
-                WHERE 1=1
-            """
-            params = []
-            
-            if start_date:
-                query += " AND DATE(o.created_at) >= ?"
-                params.append(start_date)
-            if end_date:
-                query += " AND DATE(o.created_at) <= ?"
-                params.append(end_date)
-            
-            query += " ORDER BY o.created_at DESC"
-            
-            cursor.execute(query, params)
-            return cursor.fetchall()
+                WHERE 1=1 {condition}
+            """, params)
+            name, phone, name_phone, cost = cursor.fetchone()
+            return {
+                'name': name or 0,
+                'phone': phone or 0,
+                'name_phone': name_phone or 0,
+                'cost': cost or 0,
+            }
+
+
+class AsyncDatabase:
+    """
+    Асинхронный фасад над Database с тем же набором методов.
+    Каждый вызов выполняется в пуле потоков, чтобы медленные запросы
+    не блокировали event loop бота.
+    """
+    
+    def __init__(self, database: Database, max_workers: int = 4):
+        self._db = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+    
+    @property
+    def sync(self) -> Database:
+        """Синхронный экземпляр (для кода, который уже работает вне event loop)"""
+        return self._db
+    
+    def __getattr__(self, name: str):
+        attr = getattr(self._db, name)
+        if not callable(attr):
+            return attr
+        
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(attr, *args, **kwargs)
+            )
+        
+        # Кэшируем обёртку, чтобы не создавать её при каждом вызове
+        setattr(self, name, wrapper)
+        return wrapper
+    
+    def close(self):
+        """Дождаться завершения запросов, остановить пул потоков и закрыть соединения"""
+        self._executor.shutdown(wait=True)
+        self._db.close()
 
 
 _db_instance = None
+_async_db_instance = None
 
 def get_database() -> Database:
     """Получить единственный экземпляр базы данных"""
     global _db_instance
     if _db_instance is None:
         _db_instance = Database()
-    return _db_instance
\ No newline at end of file
+    return _db_instance
+
+
+def get_async_database() -> AsyncDatabase:
+    """Получить единственный асинхронный экземпляр базы данных"""
+    global _async_db_instance
+    if _async_db_instance is None:
+        _async_db_instance = AsyncDatabase(get_database(), max_workers=DB_POOL_SIZE)
+    return _async_db_instance
\ No newline at end of file
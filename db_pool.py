@@ -0,0 +1,184 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from config import logger
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул долгоживущих соединений SQLite.
+    Каждое соединение настраивается один раз при создании (WAL, synchronous=NORMAL,
+    foreign_keys, busy_timeout) и затем переиспользуется между вызовами.
+    """
+
+    def __init__(self, db_path: str, max_size: int = 5, busy_timeout_ms: int = 5000,
+                 acquire_timeout: float = 30.0):
+        self.db_path = db_path
+        self.max_size = max(1, max_size)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.acquire_timeout = acquire_timeout
+
+        self._idle: List[sqlite3.Connection] = []
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        # Трассировка запросов текущего потока (см. trace())
+        self._local = threading.local()
+
+        # Счётчики
+        self.hits = 0          # выдано готовое соединение
+        self.misses = 0        # пришлось открыть новое соединение
+        self.waits = 0         # пришлось ждать освобождения соединения
+        self.wait_time = 0.0   # суммарное время ожидания, сек
+
+    def _create_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Взять соединение из пула (при необходимости дождаться свободного)"""
+        conn = self._acquire()
+        conn.set_trace_callback(getattr(self._local, 'trace', None))
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._cond:
+            if self._closed:
+                raise PoolTimeoutError("Пул соединений закрыт")
+
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+
+            if self._created < self.max_size:
+                # Резервируем слот, само соединение открываем вне блокировки
+                self._created += 1
+                self.misses += 1
+            else:
+                started = time.monotonic()
+                self.waits += 1
+                ready = self._cond.wait_for(
+                    lambda: self._idle or self._closed, timeout=self.acquire_timeout
+                )
+                self.wait_time += time.monotonic() - started
+                if not ready or self._closed:
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений за {self.acquire_timeout} сек"
+                    )
+                self.hits += 1
+                return self._idle.pop()
+
+        try:
+            return self._create_connection()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: sqlite3.Connection):
+        """Вернуть соединение в пул"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            # Соединение неработоспособно - выбрасываем его и освобождаем слот
+            logger.warning(f"Соединение исключено из пула: {e}")
+            conn.close()
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._created -= 1
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Соединение на время одного вызова.
+        Как и у sqlite3.Connection: commit при успехе, rollback при исключении.
+        """
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self, immediate: bool = True):
+        """
+        Явная транзакция на одном соединении.
+        BEGIN IMMEDIATE сразу берёт блокировку записи, поэтому конкурирующие
+        транзакции выстраиваются в очередь (busy_timeout), а не гоняются.
+        """
+        conn = self.acquire()
+        try:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def trace(self, callback: Callable[[str], None]):
+        """
+        Передавать в callback текст каждого запроса, выполненного в текущем потоке
+        на соединениях пула (с подставленными параметрами). Другие потоки не затрагиваются.
+        """
+        self._local.trace = callback
+        try:
+            yield
+        finally:
+            self._local.trace = None
+
+    def stats(self) -> Dict:
+        """Счётчики использования пула"""
+        with self._cond:
+            requests = self.hits + self.misses
+            return {
+                'size': self._created,
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'avg_wait': self.wait_time / self.waits if self.waits else 0.0,
+            }
+
+    def close(self):
+        """Закрыть все свободные соединения; занятые закроются при возврате"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._created -= 1
+            self._cond.notify_all()
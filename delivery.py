@@ -0,0 +1,235 @@
+import asyncio
+import random
+import time
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+
+from config import (
+    DELIVERY_GLOBAL_RATE, DELIVERY_CHAT_RATE, DELIVERY_CONCURRENCY,
+    DELIVERY_MAX_RETRIES, logger
+)
+
+# Пауза перед повтором после сетевой ошибки: BACKOFF_BASE * 2^попытка (+ случайная добавка)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# Сколько чатов держать в таблице лимитов, прежде чем чистить неактивные
+CHAT_BUCKETS_PRUNE_AT = 10000
+
+# on_result(chat_id, отправлено, описание ошибки или None)
+ResultCallback = Callable[[int, bool, Optional[str]], Awaitable[None]]
+# on_progress(обработано получателей)
+ProgressCallback = Callable[[int], Awaitable[None]]
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты (token bucket в форме GCRA): rate событий в секунду,
+    до burst подряд без ожидания. Место в очереди резервируется сразу,
+    поэтому ожидающие отправители не соревнуются друг с другом.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate
+        self.tolerance = (max(1, burst) - 1) * self.interval
+        # Теоретическое время следующего события
+        self._tat = 0.0
+
+    def reserve(self) -> float:
+        """Занять место и вернуть, сколько секунд нужно подождать"""
+        now = time.monotonic()
+        tat = max(self._tat, now)
+        self._tat = tat + self.interval
+        return max(0.0, tat - self.tolerance - now)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Не выдавать событий ближайшие seconds секунд (ответ RetryAfter)"""
+        self._tat = max(self._tat, time.monotonic() + seconds + self.tolerance)
+
+    @property
+    def idle(self) -> bool:
+        return self._tat <= time.monotonic()
+
+
+class DeliveryStats:
+    """Итог рассылки"""
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0        # пользователь заблокировал бота или удалил чат
+        self.retries = 0        # повторные попытки после сетевых ошибок
+        self.rate_limited = 0   # ответы RetryAfter от Telegram
+        self.elapsed = 0.0
+        self.errors: Dict[int, str] = {}
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+
+    def as_dict(self) -> Dict:
+        return {
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'elapsed': round(self.elapsed, 2),
+        }
+
+
+class Delivery:
+    """
+    Отправка сообщений с соблюдением лимитов Telegram: общий лимит бота
+    (около 30 сообщений в секунду) и лимит на один чат (около 1 в секунду).
+    Лимиты общие для всех рассылок и напоминаний процесса.
+    На RetryAfter отправка приостанавливается на указанное Telegram время,
+    сетевые ошибки и ошибки сервера повторяются с экспоненциальной паузой.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float = DELIVERY_GLOBAL_RATE,
+                 chat_rate: float = DELIVERY_CHAT_RATE, concurrency: int = DELIVERY_CONCURRENCY,
+                 max_retries: int = DELIVERY_MAX_RETRIES):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        # Без запаса на пачку: Telegram считает лимит по скользящему окну,
+        # и пачка поверх равномерного потока приводит к RetryAfter
+        self._global = TokenBucket(global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_PRUNE_AT:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    async def send(self, chat_id: int, text: str, stats: DeliveryStats = None, **kwargs) -> Optional[str]:
+        """
+        Отправить одно сообщение в пределах лимитов.
+        Возвращает None при успехе или описание ошибки.
+        """
+        stats = stats if stats is not None else DeliveryStats(1)
+        attempt = 0
+        # Флуд-контроль считается отдельно от сетевых ошибок: его паузы длинные,
+        # но бесконечные ответы RetryAfter для одного чата не должны держать рассылку
+        rate_limited = 0
+        while True:
+            # Сначала лимит чата: пока ждём его, не занимаем общую полосу
+            await self._chat_bucket(chat_id).acquire()
+            await self._global.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                return None
+
+            except TelegramRetryAfter as e:
+                # Флуд-контроль действует на всего бота - приостанавливаем все отправки
+                stats.rate_limited += 1
+                logger.warning(f"Флуд-контроль Telegram: пауза {e.retry_after} с (чат {chat_id})")
+                self._global.pause(e.retry_after)
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                if rate_limited >= self.max_retries:
+                    return str(e)
+                rate_limited += 1
+
+            except TelegramForbiddenError as e:
+                stats.blocked += 1
+                return str(e)
+
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempt >= self.max_retries:
+                    return str(e)
+                delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+                delay += random.uniform(0, delay / 2)
+                attempt += 1
+                stats.retries += 1
+                logger.warning(f"Ошибка отправки в чат {chat_id}: {e}, повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+
+            except Exception as e:
+                # Ошибки запроса (чат не найден, некорректная разметка) не повторяются
+                return str(e)
+
+    async def broadcast(self, chat_ids: Union[Iterable[int], AsyncIterable[int]], text: str,
+                        on_result: ResultCallback = None,
+                        on_progress: ProgressCallback = None, **kwargs) -> DeliveryStats:
+        """
+        Отправить text всем chat_ids параллельно (не больше concurrency одновременно).
+        chat_ids читается лениво и может быть асинхронным генератором страниц из базы:
+        впереди отправки держится не больше 2 x concurrency получателей.
+        """
+        try:
+            total = len(chat_ids)
+        except TypeError:
+            total = 0
+        stats = DeliveryStats(total)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        started = time.monotonic()
+
+        async def produce():
+            if hasattr(chat_ids, '__aiter__'):
+                async for chat_id in chat_ids:
+                    await queue.put(chat_id)
+            else:
+                for chat_id in chat_ids:
+                    await queue.put(chat_id)
+            # По одной метке завершения на обработчик
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def worker():
+            while True:
+                chat_id = await queue.get()
+                if chat_id is None:
+                    return
+                error = await self.send(chat_id, text, stats, **kwargs)
+                if error is None:
+                    stats.sent += 1
+                else:
+                    stats.failed += 1
+                    stats.errors[chat_id] = error
+                    logger.error(f"Не удалось отправить сообщение в чат {chat_id}: {error}")
+                if on_result:
+                    await on_result(chat_id, error is None, error)
+                if on_progress:
+                    await on_progress(stats.processed)
+
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Ошибка в одной задаче (или отмена рассылки) останавливает остальные
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        stats.total = max(stats.total, stats.processed)
+        stats.elapsed = time.monotonic() - started
+        logger.info(f"Рассылка завершена: {stats.as_dict()}")
+        return stats
+
+
+_delivery: Optional[Delivery] = None
+
+
+def get_delivery(bot: Bot) -> Delivery:
+    """Общий для процесса экземпляр (лимиты Telegram действуют на бота целиком)"""
+    global _delivery
+    if _delivery is None:
+        _delivery = Delivery(bot)
+    return _delivery
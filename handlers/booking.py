@@ -1,3 +1,4 @@
+import html
 from datetime import datetime
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
@@ -5,18 +6,20 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from states import BookingStates
-from utils import get_main_keyboard, edit_or_send, parse_date_range
+from utils import get_main_keyboard, edit_or_send, parse_date_range, add_pagination_row, parse_page_callback
+from money import parse_money, format_money
 
 router = Router()
 
-from database import get_database
-db = get_database()
+from database import get_async_database
+db = get_async_database()
 
 
 @router.callback_query(F.data == "create_booking")
 async def start_booking(callback: CallbackQuery, state: FSMContext):
     """Начало процесса создания брони - выбор клиента"""
-    clients = db.get_all_clients()
+    # Лишний клиент показывает, нужна ли кнопка "Все клиенты"
+    clients = await db.get_all_clients(limit=11)
     
     builder = InlineKeyboardBuilder()
     
@@ -37,7 +40,8 @@ async def start_booking(callback: CallbackQuery, state: FSMContext):
     await edit_or_send(
         callback,
         "📝 <b>Создание брони</b>\n\n"
-        "👥 <b>Выберите клиента или создайте нового:</b>",
+        "👥 <b>Выберите клиента или создайте нового:</b>\n\n"
+        "🔍 Для поиска отправьте часть имени или телефона клиента",
         reply_markup=builder.as_markup(),
         parse_mode='HTML'
     )
@@ -45,10 +49,48 @@ async def start_booking(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+# Сколько найденных клиентов показывать
+SEARCH_RESULTS = 10
+
+
+@router.message(BookingStates.choosing_client)
+async def search_client(message: Message, state: FSMContext):
+    """Поиск клиента по части имени или телефона"""
+    query = (message.text or "").strip()
+    clients = await db.search_clients(query, SEARCH_RESULTS) if query else []
+    
+    builder = InlineKeyboardBuilder()
+    for client_id, name, phone, order_count in clients:
+        builder.row(InlineKeyboardButton(
+            text=f"👤 {name} ({phone}) - {order_count} заказ.",
+            callback_data=f"selectclient_{client_id}"
+        ))
+    builder.row(InlineKeyboardButton(text="➕ Новый клиент", callback_data="new_client"))
+    builder.row(InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"))
+    
+    if clients:
+        text = f"🔍 <b>Найдено по запросу «{html.escape(query)}»:</b>"
+    else:
+        text = (
+            f"🔍 По запросу «{html.escape(query)}» клиентов не найдено.\n\n"
+            "Уточните запрос или создайте нового клиента."
+        )
+    
+    await message.answer(text, reply_markup=builder.as_markup(), parse_mode='HTML')
+
+
+# Клиентов на странице списка
+CLIENTS_PAGE_SIZE = 10
+
+
 @router.callback_query(F.data == "all_clients")
+@router.callback_query(F.data.startswith("clientspage_"))
 async def show_all_clients(callback: CallbackQuery, state: FSMContext):
-    """Показать всех клиентов"""
-    clients = db.get_all_clients()
+    """Показать всех клиентов (постранично по алфавиту, курсор - ID клиента)"""
+    forward, cursor = parse_page_callback(callback.data)
+    clients, has_prev, has_next = await db.get_clients_page(
+        int(cursor) if cursor else None, forward, CLIENTS_PAGE_SIZE
+    )
     
     if not clients:
         await callback.answer("❌ Клиенты не найдены", show_alert=True)
@@ -56,19 +98,20 @@ async def show_all_clients(callback: CallbackQuery, state: FSMContext):
     
     builder = InlineKeyboardBuilder()
     
-    for client_id, name, phone, order_count, _ in clients:
+    for client_id, name, phone, order_count in clients:
         builder.row(InlineKeyboardButton(
             text=f"👤 {name} ({phone}) - {order_count} заказ.",
             callback_data=f"selectclient_{client_id}"
         ))
     
+    add_pagination_row(builder, "clientspage", str(clients[0][0]), str(clients[-1][0]), has_prev, has_next)
     builder.row(InlineKeyboardButton(text="➕ Новый клиент", callback_data="new_client"))
     builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="create_booking"))
     
     await edit_or_send(
         callback,
         f"📝 <b>Создание брони</b>\n\n"
-        f"👥 <b>Все клиенты ({len(clients)}):</b>",
+        f"👥 <b>Все клиенты ({await db.count_clients()}):</b>",
         reply_markup=builder.as_markup(),
         parse_mode='HTML'
     )
@@ -79,7 +122,7 @@ async def show_all_clients(callback: CallbackQuery, state: FSMContext):
 async def select_existing_client(callback: CallbackQuery, state: FSMContext):
     """Выбор существующего клиента"""
     client_id = int(callback.data.split("_")[1])
-    client = db.get_client_by_id(client_id)
+    client = await db.get_client_by_id(client_id)
     
     if not client:
         await callback.answer("❌ Клиент не найден", show_alert=True)
@@ -145,7 +188,7 @@ async def enter_client_name(message: Message, state: FSMContext):
 async def enter_client_phone(message: Message, state: FSMContext):
     """Ввод телефона нового клиента"""
     data = await state.get_data()
-    client_id = db.add_client(data['client_name'], message.text)
+    client_id = await db.add_client(data['client_name'], message.text)
     
     await state.update_data(client_id=client_id, client_phone=message.text)
     
@@ -230,7 +273,7 @@ async def confirm_dates_no(callback: CallbackQuery, state: FSMContext):
 
 async def show_resources_menu(callback: CallbackQuery, state: FSMContext):
     """Показать меню выбора ресурсов"""
-    resources = db.get_resources()
+    resources = await db.get_resources()
     data = await state.get_data()
     
     if not resources:
@@ -257,12 +300,11 @@ async def show_resources_menu(callback: CallbackQuery, state: FSMContext):
     
     builder = InlineKeyboardBuilder()
     
+    # Доступность всех ресурсов одним запросом
+    availability = await db.get_availability_bulk(data['start_date'], data['end_date'])
+    
     for res_id, name, _, total_quantity in resources:
-        available = db.get_available_quantity(
-            res_id,
-            data['start_date'],
-            data['end_date']
-        )
+        available = availability.get(res_id, 0)
         
         # Учитываем уже добавленные позиции
         for item in order_items:
@@ -303,7 +345,7 @@ async def resource_unavailable(callback: CallbackQuery):
 async def add_resource_to_order(callback: CallbackQuery, state: FSMContext):
     """Добавление ресурса в заказ"""
     resource_id = int(callback.data.split("_")[1])
-    resource_info = db.get_resource_info(resource_id)
+    resource_info = await db.get_resource_info(resource_id)
     
     if not resource_info:
         await callback.answer("❌ Ресурс не найден", show_alert=True)
@@ -313,7 +355,7 @@ async def add_resource_to_order(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     
     # Проверяем доступность
-    available = db.get_available_quantity(
+    available = await db.get_available_quantity(
         resource_id,
         data['start_date'],
         data['end_date']
@@ -486,41 +528,27 @@ async def enter_delivery_comment(message: Message, state: FSMContext):
 async def enter_cost(message: Message, state: FSMContext):
     """Ввод стоимости и создание брони"""
     
-    # Валидация стоимости
-    cost_text = message.text.strip().replace(',', '.')
-    
-    # Проверка на пустую строку (можно не указывать стоимость)
-    if cost_text and cost_text != '-':
-        try:
-            cost_value = float(cost_text)
-            if cost_value < 0:
-                await message.answer(
-                    "❌ Стоимость не может быть отрицательной!\n\n"
-                    "Введите корректную стоимость или '-' для пропуска:"
-                )
-                return
-        except ValueError:
-            await message.answer(
-                "❌ Неверный формат стоимости!\n\n"
-                "Введите число (например: 5000 или 5000.50)\n"
-                "Или '-' для пропуска:"
-            )
-            return
-    
-    # Нормализуем стоимость
-    if not cost_text or cost_text == '-':
-        cost_text = ''
+    # Валидация стоимости ('-' или пустая строка - не указывать)
+    try:
+        cost_minor = parse_money(message.text)
+    except ValueError as e:
+        await message.answer(
+            f"❌ Неверный формат стоимости: {e}!\n\n"
+            "Введите число (например: 5000 или 5000.50)\n"
+            "Или '-' для пропуска:"
+        )
+        return
     
     data = await state.get_data()
     
     # ИСПОЛЬЗУЕМ НОВЫЙ АТОМАРНЫЙ МЕТОД
-    order_id = db.create_order_with_items(
+    order_id = await db.create_order_with_items(
         client_id=data['client_id'],
         start_date=data['start_date'],
         end_date=data['end_date'],
         delivery_type=data['delivery_type'],
         delivery_comment=data['delivery_comment'],
-        cost=cost_text,
+        cost_minor=cost_minor,
         created_by=message.from_user.id,
         items=data['order_items']
     )
@@ -538,8 +566,8 @@ async def enter_cost(message: Message, state: FSMContext):
             text += f"   • {item['name']}: {item['quantity']} шт.\n"
         text += f"\n{delivery_emoji} Тип: {delivery_text}\n"
         text += f"💬 Комментарий: {data['delivery_comment']}\n"
-        if cost_text:
-            text += f"💰 Стоимость: {cost_text}"
+        if cost_minor is not None:
+            text += f"💰 Стоимость: {format_money(cost_minor)}"
         
         await message.answer(text, reply_markup=get_main_keyboard(), parse_mode='HTML')
     else:
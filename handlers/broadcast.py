@@ -1,29 +1,124 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
 from aiogram import F, Router, Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from states import MessageStates
 from utils import get_main_keyboard, edit_or_send
 from config import logger
+from delivery import get_delivery
 
 router = Router()
 
-from database import get_database
-db = get_database()
+from database import get_async_database
+db = get_async_database()
 
+# Получателей за один запрос к очереди рассылки
+OUTBOX_PAGE_SIZE = 500
+# Результаты отправки записываются в базу пачками
+RESULTS_FLUSH_SIZE = 50
+# Не чаще одного обновления прогресса за столько секунд
+PROGRESS_EDIT_INTERVAL = 3.0
+
+# Выполняющиеся рассылки: broadcast_id -> задача
+_active: Dict[int, asyncio.Task] = {}
+
+
+# === АУДИТОРИЯ ===
+
+@router.message(Command("link"))
+async def cmd_link(message: Message, command: CommandObject):
+    """Привязка клиента к Telegram ID: /link <телефон или #ID клиента> <Telegram ID>"""
+    args = (command.args or "").split()
+    if len(args) != 2 or not args[1].lstrip('-').isdigit():
+        await message.answer(
+            "ℹ️ Использование: <code>/link телефон telegram_id</code>\n"
+            "или <code>/link #ID_клиента telegram_id</code>",
+            parse_mode='HTML'
+        )
+        return
+
+    client_ref, telegram_id = args[0], int(args[1])
+    client = await _find_client(message, client_ref)
+    if client is None:
+        return
+
+    client_id, name, phone, _ = client
+    if await db.link_client_telegram(client_id, telegram_id):
+        await message.answer(
+            f"✅ Клиент <b>{name}</b> ({phone}) привязан к Telegram ID <code>{telegram_id}</code>",
+            parse_mode='HTML'
+        )
+    else:
+        await message.answer(f"❌ Telegram ID {telegram_id} уже привязан к другому клиенту.")
+
+
+@router.message(Command("unlink"))
+async def cmd_unlink(message: Message, command: CommandObject):
+    """Отвязка клиента от Telegram: /unlink <телефон или #ID клиента>"""
+    if not command.args:
+        await message.answer("ℹ️ Использование: <code>/unlink телефон</code>", parse_mode='HTML')
+        return
+
+    client = await _find_client(message, command.args.strip())
+    if client is None:
+        return
+
+    client_id, name, phone, _ = client
+    await db.link_client_telegram(client_id, None)
+    await message.answer(f"✅ Клиент <b>{name}</b> ({phone}) отвязан от Telegram", parse_mode='HTML')
+
+
+async def _find_client(message: Message, client_ref: str) -> Optional[Tuple]:
+    """Клиент по '#ID' или телефону; при неоднозначности просит уточнить ID"""
+    if client_ref.startswith('#') and client_ref[1:].isdigit():
+        client = await db.get_client(int(client_ref[1:]))
+        if client is None:
+            await message.answer(f"❌ Клиент {client_ref} не найден.")
+        return client
+
+    clients = await db.find_clients_by_phone(client_ref)
+    if not clients:
+        await message.answer(f"❌ Клиент с телефоном {client_ref} не найден.")
+        return None
+    if len(clients) > 1:
+        text = "⚠️ С этим телефоном несколько клиентов, укажите ID:\n\n"
+        text += "\n".join(f"• #{client_id} — {name}" for client_id, name, _, _ in clients)
+        await message.answer(text)
+        return None
+    return clients[0]
+
+
+# === РАССЫЛКА ===
 
 @router.callback_query(F.data == "broadcast_message")
 async def broadcast_message_start(callback: CallbackQuery, state: FSMContext):
     """Начало рассылки"""
-    # Получаем всех клиентов с Telegram ID (пока что функционал для будущего расширения)
+    linked = await db.count_linked_clients()
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="❌ Отмена", callback_data="back_to_main"))
-    
+
+    if not linked:
+        await edit_or_send(
+            callback,
+            "📢 <b>Массовая рассылка</b>\n\n"
+            "⚠️ Нет клиентов с привязанным Telegram.\n"
+            "Привяжите клиента командой <code>/link телефон telegram_id</code>.",
+            reply_markup=builder.as_markup(),
+            parse_mode='HTML'
+        )
+        await callback.answer()
+        return
+
     await edit_or_send(
         callback,
         "📢 <b>Массовая рассылка</b>\n\n"
-        "⚠️ <i>Внимание: сообщение будет отправлено всем пользователям бота</i>\n\n"
+        f"👥 Получателей: <b>{linked}</b> (клиенты с привязанным Telegram)\n\n"
         "<b>Введите текст для рассылки:</b>",
         reply_markup=builder.as_markup(),
         parse_mode='HTML'
@@ -34,35 +129,193 @@ async def broadcast_message_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(MessageStates.entering_broadcast_message)
 async def broadcast_message_execute(message: Message, state: FSMContext, bot: Bot):
-    """Выполнение рассылки"""
-    # Пока что отправляем только администраторам
-    # В будущем здесь будет логика получения всех пользователей из БД
-    
-    from config import ADMIN_IDS
-    
-    text_to_send = f"📢 <b>РАССЫЛКА</b>\n\n{message.text}"
-    
-    success_count = 0
-    fail_count = 0
-    
-    for user_id in ADMIN_IDS:
-        if user_id == message.from_user.id:
-            continue  # Не отправляем отправителю
-        
+    """Создание рассылки и запуск отправки в фоне"""
+    await state.clear()
+
+    # html_text сохраняет форматирование и экранирует спецсимволы
+    text_to_send = f"📢 <b>РАССЫЛКА</b>\n\n{message.html_text}"
+
+    broadcast_id = await db.create_broadcast(text_to_send, message.from_user.id)
+    if broadcast_id is None:
+        await message.answer(
+            "❌ Не удалось создать рассылку.",
+            reply_markup=get_main_keyboard()
+        )
+        return
+
+    status = await message.answer(f"⏳ Рассылка #{broadcast_id}: подготовка...")
+    start_broadcast(bot, broadcast_id, status)
+
+
+@router.callback_query(F.data.startswith("broadcast_cancel_"))
+async def broadcast_cancel(callback: CallbackQuery):
+    """Остановка рассылки"""
+    broadcast_id = int(callback.data.split("_")[2])
+
+    if await db.finish_broadcast(broadcast_id, 'cancelled'):
+        task = _active.get(broadcast_id)
+        if task is not None:
+            task.cancel()
+        logger.info(f"Рассылка #{broadcast_id} остановлена пользователем {callback.from_user.id}")
         try:
-            await bot.send_message(user_id, text_to_send, parse_mode='HTML')
-            success_count += 1
-            logger.info(f"Рассылка отправлена пользователю {user_id}")
-        except Exception as e:
-            fail_count += 1
-            logger.error(f"Ошибка отправки рассылки пользователю {user_id}: {e}")
-    
-    await message.answer(
-        f"📊 <b>Результат рассылки:</b>\n\n"
-        f"✅ Отправлено: {success_count}\n"
-        f"❌ Ошибок: {fail_count}",
-        reply_markup=get_main_keyboard(),
-        parse_mode='HTML'
+            await callback.message.edit_reply_markup(reply_markup=None)
+        except TelegramBadRequest:
+            pass
+        await callback.answer("Рассылка остановлена")
+    else:
+        await callback.answer("Рассылка уже завершена", show_alert=True)
+
+
+class BroadcastProgress:
+    """Прогресс рассылки в сообщении отправителя: отправлено, ошибки, скорость"""
+
+    def __init__(self, message: Optional[Message], broadcast: Tuple):
+        self.message = message
+        self.broadcast_id, _, _, _, self.total, self.sent_before, self.failed_before = broadcast
+        self.started = time.monotonic()
+        self.last_edit = 0.0
+
+    def text(self, sent: int, failed: int, title: str = "⏳ Идёт рассылка") -> str:
+        processed = self.sent_before + self.failed_before + sent + failed
+        elapsed = time.monotonic() - self.started
+        rate = (sent + failed) / elapsed if elapsed > 0 else 0.0
+        text = (
+            f"{title} #{self.broadcast_id}\n\n"
+            f"📨 Обработано: {processed} из {self.total}\n"
+            f"✅ Отправлено: {self.sent_before + sent}\n"
+            f"❌ Ошибок: {self.failed_before + failed}\n"
+            f"⚡ Скорость: {rate:.1f} сообщ./с"
+        )
+        remaining = self.total - processed
+        if remaining > 0 and rate > 0:
+            text += f"\n⏱ Осталось: ~{int(remaining / rate)} с"
+        return text
+
+    async def edit(self, text: str, reply_markup: InlineKeyboardMarkup = None, force: bool = False):
+        now = time.monotonic()
+        if self.message is None:
+            return
+        if not force and now - self.last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        self.last_edit = now
+        try:
+            await self.message.edit_text(text, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            logger.debug(f"Не удалось обновить прогресс рассылки: {e}")
+
+
+def _cancel_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="⏹ Остановить", callback_data=f"broadcast_cancel_{broadcast_id}"))
+    return builder.as_markup()
+
+
+async def _pending_recipients(broadcast_id: int):
+    """Неотправленные получатели рассылки постранично (keyset по telegram_id)"""
+    after = db.sync.MIN_TELEGRAM_ID
+    while True:
+        page = await db.get_outbox_page(broadcast_id, after, OUTBOX_PAGE_SIZE)
+        if not page:
+            return
+        for telegram_id in page:
+            yield telegram_id
+        after = page[-1]
+
+
+async def run_broadcast(bot: Bot, broadcast_id: int, status: Optional[Message]):
+    """
+    Отправка рассылки по очереди broadcast_outbox.
+    Результаты записываются пачками: после перезапуска бота отправка продолжается
+    с неотправленных получателей (последняя незаписанная пачка может уйти повторно).
+    """
+    broadcast = await db.get_broadcast(broadcast_id)
+    if broadcast is None:
+        return
+    text = broadcast[1]
+    progress = BroadcastProgress(status, broadcast)
+    cancel_keyboard = _cancel_keyboard(broadcast_id)
+    results: List[Tuple[int, bool, Optional[str]]] = []
+    counts = {'sent': 0, 'failed': 0}
+
+    async def on_result(telegram_id: int, ok: bool, error: Optional[str]):
+        counts['sent' if ok else 'failed'] += 1
+        results.append((telegram_id, ok, error))
+        if len(results) >= RESULTS_FLUSH_SIZE:
+            batch = results[:]
+            results.clear()
+            if not await db.mark_outbox_results(broadcast_id, batch):
+                # Пачка не записана - повторим её вместе со следующей
+                results[:0] = batch
+
+    async def on_progress(processed: int):
+        await progress.edit(progress.text(counts['sent'], counts['failed']), cancel_keyboard)
+
+    await progress.edit(progress.text(0, 0), cancel_keyboard, force=True)
+    try:
+        stats = await get_delivery(bot).broadcast(
+            _pending_recipients(broadcast_id), text,
+            on_result=on_result, on_progress=on_progress,
+            parse_mode='HTML'
+        )
+    finally:
+        saved = not results or await db.mark_outbox_results(broadcast_id, results)
+
+    if not saved:
+        # Незаписанные получатели остались в очереди как неотправленные:
+        # рассылка остаётся 'running' и продолжится после перезапуска бота
+        logger.error(f"Рассылка #{broadcast_id}: не записаны результаты {len(results)} получателей")
+        await progress.edit(
+            progress.text(counts['sent'], counts['failed'], "⚠️ Рассылка приостановлена")
+            + "\n\nРезультаты записаны не полностью, отправка продолжится после перезапуска бота",
+            force=True
+        )
+        return
+
+    await db.finish_broadcast(broadcast_id, 'done')
+    logger.info(f"Рассылка #{broadcast_id} завершена: {stats.as_dict()}")
+    await progress.edit(
+        progress.text(counts['sent'], counts['failed'], "📊 Рассылка завершена"),
+        force=True
     )
-    
-    await state.clear()
\ No newline at end of file
+
+
+def start_broadcast(bot: Bot, broadcast_id: int, status: Optional[Message]):
+    """Запустить отправку рассылки в фоне"""
+    if broadcast_id in _active:
+        return
+
+    async def runner():
+        try:
+            await run_broadcast(bot, broadcast_id, status)
+        except asyncio.CancelledError:
+            logger.info(f"Рассылка #{broadcast_id} прервана")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка рассылки #{broadcast_id}: {e}")
+        finally:
+            _active.pop(broadcast_id, None)
+
+    _active[broadcast_id] = asyncio.create_task(runner(), name=f"broadcast-{broadcast_id}")
+
+
+async def resume_broadcasts(bot: Bot):
+    """Продолжить рассылки, прерванные остановкой бота"""
+    for broadcast_id in await db.get_running_broadcasts():
+        broadcast = await db.get_broadcast(broadcast_id)
+        created_by = broadcast[2]
+        logger.info(f"Возобновляем рассылку #{broadcast_id}")
+        try:
+            status = await bot.send_message(created_by, f"⏳ Рассылка #{broadcast_id}: возобновление...")
+        except Exception as e:
+            # Рассылка продолжается и без сообщения с прогрессом
+            logger.error(f"Не удалось уведомить о возобновлении рассылки #{broadcast_id}: {e}")
+            status = None
+        start_broadcast(bot, broadcast_id, status)
+
+
+async def stop_broadcasts():
+    """Прервать рассылки при остановке бота (они продолжатся после запуска)"""
+    tasks = list(_active.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
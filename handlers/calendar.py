@@ -6,14 +6,14 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from utils import get_main_keyboard, edit_or_send
 
 router = Router()
-from database import get_database
-db = get_database()
+from database import get_async_database
+db = get_async_database()
 
 
 @router.callback_query(F.data == "calendar_availability")
 async def calendar_availability(callback: CallbackQuery):
     """Календарь загруженности ресурсов"""
-    resources = db.get_resources()
+    resources = await db.get_resources()
     
     if not resources:
         await edit_or_send(
@@ -27,12 +27,17 @@ async def calendar_availability(callback: CallbackQuery):
         return
     
     text = "📊 <b>КАЛЕНДАРЬ ЗАГРУЖЕННОСТИ</b>\n\n"
-    text += "Выберите ресурс для просмотра:"
+    text += "Свободно сегодня / всего. Выберите ресурс для просмотра:"
+    
+    # Свободный остаток на сегодня по всем ресурсам одним запросом
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    availability = await db.get_availability_bulk(today_str, today_str)
     
     builder = InlineKeyboardBuilder()
     for res_id, name, _, quantity in resources:
+        available = availability.get(res_id, quantity)
         builder.row(InlineKeyboardButton(
-            text=f"📦 {name} ({quantity} шт.)",
+            text=f"📦 {name} ({available}/{quantity} шт.)",
             callback_data=f"calres_{res_id}"
         ))
     builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_main"))
@@ -41,11 +46,20 @@ async def calendar_availability(callback: CallbackQuery):
     await callback.answer()
 
 
+# Доступные горизонты календаря (дней)
+CALENDAR_HORIZONS = (14, 30, 60, 90)
+
+
 @router.callback_query(F.data.startswith("calres_"))
 async def show_resource_calendar(callback: CallbackQuery):
     """Показать календарь для конкретного ресурса"""
-    resource_id = int(callback.data.split("_")[1])
-    resource_info = db.get_resource_info(resource_id)
+    parts = callback.data.split("_")
+    resource_id = int(parts[1])
+    # Горизонт из устаревшей или подделанной кнопки заменяется стандартным
+    days = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else CALENDAR_HORIZONS[0]
+    if days not in CALENDAR_HORIZONS:
+        days = CALENDAR_HORIZONS[0]
+    resource_info = await db.get_resource_info(resource_id)
     
     if not resource_info:
         await callback.answer("❌ Ресурс не найден", show_alert=True)
@@ -53,36 +67,40 @@ async def show_resource_calendar(callback: CallbackQuery):
     
     _, name, total_quantity = resource_info
     
-    # Генерируем календарь на 14 дней вперед
+    # Загруженность по дням одним запросом
     today = datetime.now().date()
+    timeline = await db.get_occupancy_timeline(today.strftime('%Y-%m-%d'), days, resource_id)
+    booked_by_day = timeline.get(resource_id, [0] * days)
+    
+    # Для длинных горизонтов - по одной строке на день, чтобы уложиться в лимит сообщения
+    compact = days > CALENDAR_HORIZONS[0]
     
     text = f"📊 <b>КАЛЕНДАРЬ ЗАГРУЖЕННОСТИ</b>\n\n"
     text += f"🎯 Ресурс: {name}\n"
     text += f"📦 Всего: {total_quantity} шт.\n\n"
-    text += "📅 <b>Загруженность на 14 дней:</b>\n\n"
+    text += f"📅 <b>Загруженность на {days} дн.:</b>\n\n"
     
-    for i in range(14):
+    for i in range(days):
         check_date = today + timedelta(days=i)
-        date_str = check_date.strftime('%Y-%m-%d')
-        
-        available = db.get_available_quantity(resource_id, date_str, date_str)
-        booked = total_quantity - available
+        booked = booked_by_day[i]
+        available = total_quantity - booked
         
         # Определяем статус
         if available == total_quantity:
-            status = "🟢 Свободно"
             status_icon = "🟢"
         elif available > 0:
-            status = f"🟡 Частично ({booked}/{total_quantity})"
             status_icon = "🟡"
         else:
-            status = "🔴 Занято"
             status_icon = "🔴"
         
         # Форматируем дату
         date_display = check_date.strftime('%d.%m')
         weekday = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'][check_date.weekday()]
         
+        if compact:
+            text += f"{status_icon} {date_display} {weekday}: {available}/{total_quantity}\n"
+            continue
+        
         if i == 0:
             text += f"{status_icon} <b>Сегодня</b> ({date_display}, {weekday})\n"
         elif i == 1:
@@ -96,8 +114,15 @@ async def show_resource_calendar(callback: CallbackQuery):
         text += "\n"
     
     builder = InlineKeyboardBuilder()
+    builder.row(*[
+        InlineKeyboardButton(
+            text=f"{'• ' if horizon == days else ''}{horizon} дн.",
+            callback_data=f"calres_{resource_id}_{horizon}"
+        )
+        for horizon in CALENDAR_HORIZONS
+    ])
     builder.row(InlineKeyboardButton(text="◀️ К списку ресурсов", callback_data="calendar_availability"))
     builder.row(InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_main"))
     
     await edit_or_send(callback, text, reply_markup=builder.as_markup(), parse_mode='HTML')
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
@@ -1,12 +1,17 @@
+import html
+
 from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
 
 from config import is_admin, logger
+from database import get_async_database
+from scheduler import get_scheduler
 from utils import get_main_keyboard, edit_or_send
 
 router = Router()
+db = get_async_database()
 
 
 @router.message(Command("start"))
@@ -43,6 +48,66 @@ async def cmd_menu(message: Message, state: FSMContext):
     )
 
 
+@router.message(Command("ledger_check"))
+async def cmd_ledger_check(message: Message):
+    """Сверка журнала броней в памяти с базой данных"""
+    if db.ledger is None:
+        await message.answer("ℹ️ Журнал броней отключён (USE_RESERVATION_LEDGER=0).")
+        return
+    
+    problems = await db.verify_ledger()
+    if problems:
+        text = f"❌ <b>Найдено расхождений: {len(problems)}</b>\n\n"
+        text += "\n".join(f"• {p}" for p in problems[:10])
+    else:
+        text = "✅ Журнал броней согласован с базой данных."
+    
+    await message.answer(text, parse_mode='HTML')
+
+
+@router.message(Command("rebuild_stats"))
+async def cmd_rebuild_stats(message: Message):
+    """Пересчёт дневных сводок для отчётов с нуля"""
+    mismatches = await db.rebuild_rollups()
+    fixed = sum(mismatches.values())
+    if fixed:
+        text = f"⚠️ <b>Сводки пересчитаны, исправлено строк: {fixed}</b>\n\n"
+        text += "\n".join(f"• {table}: {count}" for table, count in mismatches.items() if count)
+    else:
+        text = "✅ Дневные сводки пересчитаны, расхождений не было."
+    
+    await message.answer(text, parse_mode='HTML')
+
+
+@router.message(Command("jobs"))
+async def cmd_jobs(message: Message):
+    """Периодические задачи: расписание, следующий и последний запуск"""
+    jobs = get_scheduler().jobs()
+    if not jobs:
+        await message.answer("ℹ️ Периодических задач нет.")
+        return
+    
+    status_icons = {'ok': '✅', 'timeout': '⏱', 'error': '❌'}
+    text = "🕒 <b>Периодические задачи</b>\n"
+    for job in jobs:
+        text += f"\n<b>{job.name}</b> — {job.description}\n"
+        text += f"Расписание: <code>{job.spec}</code>\n"
+        if job.running:
+            text += "Выполняется сейчас\n"
+        if job.next_run:
+            text += f"Следующий запуск: {job.next_run:%d.%m.%Y %H:%M}\n"
+        if job.last_started:
+            icon = status_icons.get(job.last_status, '•')
+            text += (f"Последний запуск: {job.last_started:%d.%m.%Y %H:%M} {icon} "
+                     f"({job.last_duration:.1f} с)\n")
+            if job.last_error:
+                text += f"Ошибка: {html.escape(job.last_error)}\n"
+        else:
+            text += "Ещё не запускалась\n"
+    
+    await message.answer(text, parse_mode='HTML')
+
+
 @router.callback_query(F.data == "back_to_main")
 async def back_to_main(callback: CallbackQuery, state: FSMContext):
     """Возврат в главное меню"""
@@ -2,20 +2,30 @@ from aiogram import F, Router
 from aiogram.types import CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from utils import get_main_keyboard, edit_or_send, format_booking
+from utils import get_main_keyboard, edit_or_send, format_booking, add_pagination_row, parse_page_callback
 
 router = Router()
 
-from database import get_database
-db = get_database()
+from database import get_async_database
+db = get_async_database()
+
+
+# Броней на странице меню
+PAGE_SIZE = 10
 
 
 @router.callback_query(F.data == "delete_booking_menu")
+@router.callback_query(F.data.startswith("delpage_"))
 async def delete_booking_menu(callback: CallbackQuery):
-    """Меню удаления бронирования"""
-    bookings = db.get_all_active_bookings()
+    """Меню удаления бронирования (постранично, курсор (start_date, id) в callback_data)"""
+    forward, cursor = parse_page_callback(callback.data)
+    if cursor is not None:
+        start_date, order_id = cursor.split(":")
+        cursor = (start_date, int(order_id))
+    
+    orders, has_prev, has_next = await db.get_active_orders_page(cursor, forward, PAGE_SIZE)
     
-    if not bookings:
+    if not orders:
         await edit_or_send(
             callback,
             "🗑️ <b>Удаление брони</b>\n\n"
@@ -27,20 +37,24 @@ async def delete_booking_menu(callback: CallbackQuery):
         return
     
     text = f"🗑️ <b>Удаление брони</b>\n"
-    text += f"📊 Активных броней: {len(bookings)}\n\n"
+    text += f"📊 Активных броней: {await db.count_active_orders()}\n\n"
     text += "Выберите бронь для удаления:"
     
+    # Позиции загружаются только для заказов страницы
     builder = InlineKeyboardBuilder()
-    for booking in bookings[:10]:
-        booking_id, resource, client, _, start, end, quantity = booking[:7]
+    for order, items in await db.attach_items(orders):
+        booking_id, client = order[0], order[1]
+        resources = ", ".join(f"{name} ({quantity} шт.)" for _, name, quantity, _ in items)
         builder.row(InlineKeyboardButton(
-            text=f"#{booking_id} | {resource} ({quantity} шт.) | {client}",
+            text=f"#{booking_id} | {resources} | {client}",
             callback_data=f"delbooking_{booking_id}"
         ))
     
-    if len(bookings) > 10:
-        text += f"\n<i>Показаны первые 10 из {len(bookings)} броней</i>"
-    
+    add_pagination_row(
+        builder, "delpage",
+        f"{orders[0][3]}:{orders[0][0]}", f"{orders[-1][3]}:{orders[-1][0]}",
+        has_prev, has_next
+    )
     builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_main"))
     
     await edit_or_send(callback, text, reply_markup=builder.as_markup(), parse_mode='HTML')
@@ -52,14 +66,14 @@ async def delete_booking_confirm(callback: CallbackQuery):
     """Подтверждение удаления брони"""
     booking_id = int(callback.data.split("_")[1])
     
-    booking = db.get_booking_details(booking_id)
+    booking = await db.get_booking_details(booking_id)
     if not booking:
         await callback.answer("❌ Бронь не найдена", show_alert=True)
         return
     
     text = "⚠️ <b>Подтверждение удаления</b>\n\n"
     text += "Вы уверены, что хотите удалить эту бронь?\n\n"
-    text += format_booking(booking)
+    text += await format_booking(booking)
     
     builder = InlineKeyboardBuilder()
     builder.row(
@@ -76,7 +90,7 @@ async def delete_booking_execute(callback: CallbackQuery):
     """Выполнение удаления брони"""
     booking_id = int(callback.data.split("_")[1])
     
-    if db.delete_booking(booking_id):
+    if await db.delete_booking(booking_id):
         await callback.answer(f"✅ Бронь #{booking_id} удалена!", show_alert=True)
         await edit_or_send(
             callback,
@@ -5,18 +5,32 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from states import OrderEditStates
-from utils import get_main_keyboard, edit_or_send, format_order, parse_date_range
+from utils import (
+    get_main_keyboard, edit_or_send, format_order, parse_date_range,
+    add_pagination_row, parse_page_callback
+)
+from money import parse_money, format_money
 
 router = Router()
 
-from database import get_database
-db = get_database()
+from database import get_async_database
+db = get_async_database()
+
+
+# Броней на странице меню
+PAGE_SIZE = 10
 
 
 @router.callback_query(F.data == "edit_booking_menu")
+@router.callback_query(F.data.startswith("editpage_"))
 async def edit_booking_menu(callback: CallbackQuery):
-    """Меню редактирования броней"""
-    orders = db.get_all_active_orders()
+    """Меню редактирования броней (постранично, курсор (start_date, id) в callback_data)"""
+    forward, cursor = parse_page_callback(callback.data)
+    if cursor is not None:
+        start_date, order_id = cursor.split(":")
+        cursor = (start_date, int(order_id))
+    
+    orders, has_prev, has_next = await db.get_active_orders_page(cursor, forward, PAGE_SIZE)
     
     if not orders:
         await edit_or_send(
@@ -30,20 +44,22 @@ async def edit_booking_menu(callback: CallbackQuery):
         return
     
     text = f"✏️ <b>Редактирование броней</b>\n"
-    text += f"📊 Активных броней: {len(orders)}\n\n"
+    text += f"📊 Активных броней: {await db.count_active_orders()}\n\n"
     text += "Выберите бронь для редактирования:"
     
     builder = InlineKeyboardBuilder()
-    for order in orders[:10]:
+    for order in orders:
         order_id, client_name, _, start_date, end_date = order[:5]
         builder.row(InlineKeyboardButton(
             text=f"#{order_id} | {client_name} | {start_date}",
             callback_data=f"editorder_{order_id}"
         ))
     
-    if len(orders) > 10:
-        text += f"\n<i>Показаны первые 10 из {len(orders)} броней</i>"
-    
+    add_pagination_row(
+        builder, "editpage",
+        f"{orders[0][3]}:{orders[0][0]}", f"{orders[-1][3]}:{orders[-1][0]}",
+        has_prev, has_next
+    )
     builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_main"))
     
     await edit_or_send(callback, text, reply_markup=builder.as_markup(), parse_mode='HTML')
@@ -54,7 +70,7 @@ async def edit_booking_menu(callback: CallbackQuery):
 async def choose_field_to_edit(callback: CallbackQuery, state: FSMContext):
     """Выбор поля заказа для редактирования"""
     order_id = int(callback.data.split("_")[1])
-    order = db.get_order_details(order_id)
+    order = await db.get_order_details(order_id)
     
     if not order:
         await callback.answer("❌ Заказ не найден", show_alert=True)
@@ -63,7 +79,7 @@ async def choose_field_to_edit(callback: CallbackQuery, state: FSMContext):
     await state.update_data(edit_order_id=order_id)
     
     text = "✏️ <b>Редактирование заказа</b>\n\n"
-    text += format_order(order, show_items=True)
+    text += await format_order(order, show_items=True)
     text += "\n<b>Что хотите изменить?</b>"
     
     builder = InlineKeyboardBuilder()
@@ -92,7 +108,7 @@ async def start_edit_order_field(callback: CallbackQuery, state: FSMContext):
         prompt = "📅 <b>Введите новые даты:</b>\nФормат: ГГГГ-ММ-ДД - ГГГГ-ММ-ДД"
         next_state = OrderEditStates.entering_new_dates
     elif field == 'cost':
-        prompt = "💰 <b>Введите новую стоимость:</b>"
+        prompt = "💰 <b>Введите новую стоимость:</b>\nНапример: 5000 или 5000.50, '-' - не указывать"
         next_state = OrderEditStates.entering_new_cost
     else:  # comment
         prompt = "💬 <b>Введите новый комментарий:</b>"
@@ -121,39 +137,29 @@ async def process_new_dates(message: Message, state: FSMContext):
     data = await state.get_data()
     order_id = data['edit_order_id']
     
-    # Проверяем доступность всех ресурсов на новые даты
-    items = db.get_order_items(order_id)
-    unavailable = []
-    
-    for _, resource_name, quantity, resource_id in items:
-        if not db.check_availability(resource_id, start_date, end_date, quantity, order_id):
-            available = db.get_available_quantity(resource_id, start_date, end_date, order_id)
-            unavailable.append(f"• {resource_name}: нужно {quantity}, доступно {available}")
+    # Проверка остатков и перенос выполняются атомарно
+    success, conflicts = await db.reschedule_order(
+        order_id, start_date, end_date, changed_by=message.from_user.id
+    )
     
-    if unavailable:
+    if conflicts:
         text = "❌ <b>Недостаточно оборудования на новые даты!</b>\n\n"
-        text += "\n".join(unavailable)
+        text += "\n".join(
+            f"• {c['name']}: нужно {c['requested']}, доступно {c['available']}"
+            for c in conflicts
+        )
         text += "\n\nВыберите другие даты или измените количество."
         await message.answer(text, parse_mode='HTML')
         return
     
-    # Обновляем даты в базе
-    try:
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE orders SET start_date = ?, end_date = ? WHERE id = ?",
-                (start_date, end_date, order_id)
-            )
-            conn.commit()
-        
+    if success:
         await message.answer(
             f"✅ <b>Даты заказа обновлены!</b>\n\n"
             f"Новый период: {start_date} — {end_date}",
             reply_markup=get_main_keyboard(),
             parse_mode='HTML'
         )
-    except Exception as e:
+    else:
         await message.answer(
             "❌ Ошибка при обновлении дат.",
             reply_markup=get_main_keyboard()
@@ -165,25 +171,27 @@ async def process_new_dates(message: Message, state: FSMContext):
 @router.message(OrderEditStates.entering_new_cost)
 async def process_new_cost(message: Message, state: FSMContext):
     """Обработка новой стоимости"""
+    try:
+        cost_minor = parse_money(message.text)
+    except ValueError as e:
+        await message.answer(
+            f"❌ Неверный формат стоимости: {e}!\n\n"
+            "Введите число (например: 5000 или 5000.50)\n"
+            "Или '-', чтобы не указывать стоимость:"
+        )
+        return
+    
     data = await state.get_data()
     order_id = data['edit_order_id']
     
-    try:
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE orders SET cost = ? WHERE id = ?",
-                (message.text, order_id)
-            )
-            conn.commit()
-        
+    if await db.update_order_cost(order_id, cost_minor):
         await message.answer(
             f"✅ <b>Стоимость заказа обновлена!</b>\n\n"
-            f"Новая стоимость: {message.text}",
+            f"Новая стоимость: {format_money(cost_minor) or 'не указана'}",
             reply_markup=get_main_keyboard(),
             parse_mode='HTML'
         )
-    except Exception as e:
+    else:
         await message.answer(
             "❌ Ошибка при обновлении стоимости.",
             reply_markup=get_main_keyboard()
@@ -198,21 +206,13 @@ async def process_new_comment(message: Message, state: FSMContext):
     data = await state.get_data()
     order_id = data['edit_order_id']
     
-    try:
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE orders SET delivery_comment = ? WHERE id = ?",
-                (message.text, order_id)
-            )
-            conn.commit()
-        
+    if await db.update_order_comment(order_id, message.text):
         await message.answer(
             f"✅ <b>Комментарий заказа обновлён!</b>",
             reply_markup=get_main_keyboard(),
             parse_mode='HTML'
         )
-    except Exception as e:
+    else:
         await message.answer(
             "❌ Ошибка при обновлении комментария.",
             reply_markup=get_main_keyboard()
@@ -7,14 +7,14 @@ from states import ResourceStates
 from utils import get_main_keyboard, edit_or_send
 
 router = Router()
-from database import get_database
-db = get_database()
+from database import get_async_database
+db = get_async_database()
 
 
 @router.callback_query(F.data == "edit_resource_menu")
 async def edit_resource_menu(callback: CallbackQuery):
     """Меню редактирования ресурсов"""
-    resources = db.get_resources()
+    resources = await db.get_resources()
     
     if not resources:
         await edit_or_send(
@@ -46,21 +46,14 @@ async def edit_resource_menu(callback: CallbackQuery):
 async def choose_edit_field(callback: CallbackQuery, state: FSMContext):
     """Выбор поля для редактирования"""
     resource_id = int(callback.data.split("_")[1])
-    resource = db.get_resource_info(resource_id)
+    resource = await db.get_resource(resource_id)
     
     if not resource:
         await callback.answer("❌ Ресурс не найден", show_alert=True)
         return
     
-    res_id, name, quantity = resource
-    
-    # Получаем полную информацию
-    resources = db.get_resources()
-    description = ""
-    for r in resources:
-        if r[0] == res_id:
-            description = r[2] or "Не указано"
-            break
+    res_id, name, description, quantity = resource
+    description = description or "Не указано"
     
     await state.update_data(edit_resource_id=resource_id)
     
@@ -118,17 +111,17 @@ async def process_edit_value(message: Message, state: FSMContext):
     success = False
     
     if field == 'name':
-        success = db.update_resource(resource_id, name=message.text)
+        success = await db.update_resource(resource_id, name=message.text)
     elif field == 'description':
         desc = message.text if message.text != '-' else ''
-        success = db.update_resource(resource_id, description=desc)
+        success = await db.update_resource(resource_id, description=desc)
     elif field == 'quantity':
         try:
             quantity = int(message.text)
             if quantity <= 0:
                 await message.answer("❌ Количество должно быть больше 0!")
                 return
-            success = db.update_resource(resource_id, total_quantity=quantity)
+            success = await db.update_resource(resource_id, total_quantity=quantity)
         except ValueError:
             await message.answer("❌ Введите корректное число!")
             return
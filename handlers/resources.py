@@ -7,8 +7,8 @@ from states import ResourceStates
 from utils import get_main_keyboard, edit_or_send
 
 router = Router()
-from database import get_database
-db = get_database()
+from database import get_async_database
+db = get_async_database()
 
 
 @router.callback_query(F.data == "manage_resources")
@@ -94,7 +94,7 @@ async def add_resource_quantity(message: Message, state: FSMContext):
         
         data = await state.get_data()
         
-        if db.add_resource(data['name'], data['description'], quantity):
+        if await db.add_resource(data['name'], data['description'], quantity):
             await message.answer(
                 f"✅ <b>Оборудование добавлено!</b>\n\n"
                 f"🎯 Название: {data['name']}\n"
@@ -117,7 +117,7 @@ async def add_resource_quantity(message: Message, state: FSMContext):
 @router.callback_query(F.data == "list_resources")
 async def list_resources(callback: CallbackQuery):
     """Список всех ресурсов"""
-    resources = db.get_resources()
+    resources = await db.get_resources()
     
     if not resources:
         await edit_or_send(
@@ -150,7 +150,7 @@ async def list_resources(callback: CallbackQuery):
 @router.callback_query(F.data == "delete_resource_menu")
 async def delete_resource_menu(callback: CallbackQuery):
     """Меню удаления ресурса"""
-    resources = db.get_resources()
+    resources = await db.get_resources()
     
     if not resources:
         await edit_or_send(
@@ -183,8 +183,11 @@ async def delete_resource_confirm(callback: CallbackQuery):
     """Удаление ресурса"""
     resource_id = int(callback.data.split("_")[1])
     
-    if db.delete_resource(resource_id):
+    if await db.delete_resource(resource_id):
         await callback.answer("✅ Оборудование удалено!", show_alert=True)
         await manage_resources_menu(callback)
     else:
-        await callback.answer("❌ Ошибка при удалении", show_alert=True)
\ No newline at end of file
+        await callback.answer(
+            "❌ Ошибка при удалении.\nВозможно, оборудование используется в заказах.",
+            show_alert=True
+        )
\ No newline at end of file
@@ -3,12 +3,12 @@ from aiogram import F, Router
 from aiogram.types import CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from utils import get_main_keyboard, edit_or_send, format_order
+from utils import get_main_keyboard, edit_or_send, format_orders
 from config import logger
-from database import get_database
+from database import get_async_database
 
 router = Router()
-db = get_database()
+db = get_async_database()
 
 
 @router.callback_query(F.data == "tasks_today")
@@ -16,12 +16,17 @@ async def tasks_today(callback: CallbackQuery):
     """Задачи на сегодня: выдать и забрать оборудование"""
     
     # Обновляем статусы просроченных заказов
-    db.update_overdue_status()
+    await db.update_overdue_status()
     
     # Получаем данные
-    orders_to_give = db.get_orders_to_give_today()
-    orders_to_return = db.get_orders_to_return_today()
-    overdue_orders = db.get_overdue_orders()
+    orders_to_give = await db.get_orders_to_give_today()
+    orders_to_return = await db.get_orders_to_return_today()
+    overdue_orders = await db.get_overdue_orders()
+    
+    # Позиции всех показываемых заказов одним запросом
+    items_map = await db.get_items_for_orders(
+        [order[0] for order in overdue_orders[:5] + orders_to_give[:5] + orders_to_return[:5]]
+    )
     
     today_str = datetime.now().strftime('%d.%m.%Y, %A')
     
@@ -45,8 +50,7 @@ async def tasks_today(callback: CallbackQuery):
             text += f"   👤 {client_name} | 📞 {client_phone}\n"
             text += f"   📅 Должен был вернуть: {end_date}\n"
             
-            # Получаем позиции
-            items = db.get_order_items(order_id)
+            items = items_map.get(order_id, [])
             if items:
                 items_text = ", ".join([f"{name}×{qty}" for _, name, qty, _ in items])
                 text += f"   📦 {items_text}\n"
@@ -79,8 +83,7 @@ async def tasks_today(callback: CallbackQuery):
             text += f"   👤 {client_name} | 📞 {client_phone}\n"
             text += f"   📅 {start_date} — {end_date}\n"
             
-            # Получаем позиции
-            items = db.get_order_items(order_id)
+            items = items_map.get(order_id, [])
             if items:
                 items_text = ", ".join([f"{name}×{qty}" for _, name, qty, _ in items])
                 text += f"   📦 {items_text}\n"
@@ -118,8 +121,7 @@ async def tasks_today(callback: CallbackQuery):
             text += f"   👤 {client_name} | 📞 {client_phone}\n"
             text += f"   📅 Период: {start_date} — {end_date}\n"
             
-            # Получаем позиции
-            items = db.get_order_items(order_id)
+            items = items_map.get(order_id, [])
             if items:
                 items_text = ", ".join([f"{name}×{qty}" for _, name, qty, _ in items])
                 text += f"   📦 {items_text}\n"
@@ -178,8 +180,13 @@ async def tasks_today(callback: CallbackQuery):
 async def tasks_tomorrow(callback: CallbackQuery):
     """Задачи на завтра: выдать и забрать оборудование"""
     
-    orders_to_give = db.get_orders_to_give_tomorrow()
-    orders_to_return = db.get_orders_to_return_tomorrow()
+    orders_to_give = await db.get_orders_to_give_tomorrow()
+    orders_to_return = await db.get_orders_to_return_tomorrow()
+    
+    # Позиции всех показываемых заказов одним запросом
+    items_map = await db.get_items_for_orders(
+        [order[0] for order in orders_to_give[:5] + orders_to_return[:5]]
+    )
     
     tomorrow = datetime.now() + timedelta(days=1)
     tomorrow_str = tomorrow.strftime('%d.%m.%Y, %A')
@@ -207,7 +214,7 @@ async def tasks_tomorrow(callback: CallbackQuery):
             text += f"   👤 {client_name} | 📞 {client_phone}\n"
             text += f"   📅 {start_date} — {end_date}\n"
             
-            items = db.get_order_items(order_id)
+            items = items_map.get(order_id, [])
             if items:
                 items_text = ", ".join([f"{name}×{qty}" for _, name, qty, _ in items])
                 text += f"   📦 {items_text}\n"
@@ -242,7 +249,7 @@ async def tasks_tomorrow(callback: CallbackQuery):
             text += f"   👤 {client_name} | 📞 {client_phone}\n"
             text += f"   📅 {start_date} — {end_date}\n"
             
-            items = db.get_order_items(order_id)
+            items = items_map.get(order_id, [])
             if items:
                 items_text = ", ".join([f"{name}×{qty}" for _, name, qty, _ in items])
                 text += f"   📦 {items_text}\n"
@@ -273,7 +280,7 @@ async def issue_order_handler(callback: CallbackQuery):
     order_id = int(callback.data.split("_")[2])
     
     # Выдаём оборудование
-    success = db.issue_order(order_id, callback.from_user.id)
+    success = await db.issue_order(order_id, callback.from_user.id)
     
     if success:
         await callback.answer(
@@ -300,7 +307,7 @@ async def confirm_return_handler(callback: CallbackQuery):
     order_id = int(callback.data.split("_")[2])
     
     # Подтверждаем возврат
-    success = db.confirm_return(order_id, callback.from_user.id)
+    success = await db.confirm_return(order_id, callback.from_user.id)
     
     if success:
         await callback.answer(
@@ -328,7 +335,7 @@ async def check_week(callback: CallbackQuery):
     week_end = (today + timedelta(days=7)).strftime('%Y-%m-%d')
     today_str = today.strftime('%Y-%m-%d')
     
-    orders = db.get_orders_for_period(today_str, week_end)
+    orders = await db.get_orders_for_period(today_str, week_end)
     
     if not orders:
         await edit_or_send(
@@ -345,10 +352,7 @@ async def check_week(callback: CallbackQuery):
     text += f"📆 {today.strftime('%d.%m.%Y')} — {(today + timedelta(days=7)).strftime('%d.%m.%Y')}\n"
     text += f"📊 Всего заказов: {len(orders)}\n\n"
     
-    for i, order in enumerate(orders[:5]):
-        text += format_order(order, show_items=True)
-        if i < min(len(orders), 5) - 1:
-            text += "\n━━━━━━━━━━━━━━━━\n\n"
+    text += "\n━━━━━━━━━━━━━━━━\n\n".join(await format_orders(orders[:5]))
     
     if len(orders) > 5:
         text += f"\n<i>... и ещё {len(orders) - 5} заказов</i>\n"
@@ -373,7 +377,7 @@ async def view_calendar(callback: CallbackQuery):
     month_end = (today + timedelta(days=30)).strftime('%Y-%m-%d')
     today_str = today.strftime('%Y-%m-%d')
     
-    orders = db.get_orders_for_period(today_str, month_end)
+    orders = await db.get_orders_for_period(today_str, month_end)
     
     if not orders:
         await edit_or_send(
@@ -390,10 +394,7 @@ async def view_calendar(callback: CallbackQuery):
     text += f"📆 {today.strftime('%d.%m.%Y')} — {(today + timedelta(days=30)).strftime('%d.%m.%Y')}\n"
     text += f"📋 Всего заказов: {len(orders)}\n\n"
     
-    for i, order in enumerate(orders[:5]):
-        text += format_order(order, show_items=True)
-        if i < min(len(orders), 5) - 1:
-            text += "\n━━━━━━━━━━━━━━━━\n\n"
+    text += "\n━━━━━━━━━━━━━━━━\n\n".join(await format_orders(orders[:5]))
     
     if len(orders) > 5:
         text += f"\n<i>Показано 5 из {len(orders)} заказов</i>\n"
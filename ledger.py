@@ -0,0 +1,174 @@
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Tuple
+
+from config import logger
+
+# Диапазон дат, который покрывают деревья (в ординалах date.toordinal())
+MIN_DAY = date(2000, 1, 1).toordinal()
+MAX_DAY = date(2199, 12, 31).toordinal()
+
+
+def _to_day(value: str) -> int:
+    """'ГГГГ-ММ-ДД' -> ординал дня, ограниченный диапазоном леджера"""
+    day = datetime.strptime(value, '%Y-%m-%d').date().toordinal()
+    return min(max(day, MIN_DAY), MAX_DAY)
+
+
+class MaxSegmentTree:
+    """
+    Дерево отрезков по дням: прибавление на отрезке и максимум на отрезке за O(log n).
+    Узлы создаются лениво, поэтому память растёт только с числом броней.
+    Отложенные прибавления не проталкиваются вниз: max узла = max детей + add узла.
+    """
+
+    def __init__(self, lo: int = MIN_DAY, hi: int = MAX_DAY):
+        self.lo = lo
+        self.hi = hi
+        self._max = [0]
+        self._add = [0]
+        self._left = [-1]
+        self._right = [-1]
+
+    def _child(self, node: int, right: bool) -> int:
+        children = self._right if right else self._left
+        if children[node] == -1:
+            self._max.append(0)
+            self._add.append(0)
+            self._left.append(-1)
+            self._right.append(-1)
+            children[node] = len(self._max) - 1
+        return children[node]
+
+    def add(self, start: int, end: int, value: int):
+        """Прибавить value ко всем дням отрезка [start, end]"""
+        self._update(0, self.lo, self.hi, start, end, value)
+
+    def _update(self, node: int, lo: int, hi: int, start: int, end: int, value: int):
+        if start <= lo and hi <= end:
+            self._add[node] += value
+            self._max[node] += value
+            return
+
+        mid = (lo + hi) // 2
+        if start <= mid:
+            self._update(self._child(node, False), lo, mid, start, end, value)
+        if end > mid:
+            self._update(self._child(node, True), mid + 1, hi, start, end, value)
+
+        left, right = self._left[node], self._right[node]
+        left_max = self._max[left] if left != -1 else 0
+        right_max = self._max[right] if right != -1 else 0
+        self._max[node] = max(left_max, right_max) + self._add[node]
+
+    def max(self, start: int, end: int) -> int:
+        """Максимум по дням отрезка [start, end]"""
+        return self._query(0, self.lo, self.hi, start, end)
+
+    def _query(self, node: int, lo: int, hi: int, start: int, end: int) -> int:
+        if node == -1:
+            return 0
+        if start <= lo and hi <= end:
+            return self._max[node]
+
+        mid = (lo + hi) // 2
+        best = None
+        if start <= mid:
+            best = self._query(self._left[node], lo, mid, start, end)
+        if end > mid:
+            right = self._query(self._right[node], mid + 1, hi, start, end)
+            best = right if best is None else max(best, right)
+        return (best or 0) + self._add[node]
+
+
+class ReservationLedger:
+    """
+    Журнал активных броней в памяти процесса.
+    Для каждого ресурса хранится дерево отрезков занятости по дням, поэтому
+    пиковая одновременная загрузка за любой период считается за O(log n).
+    """
+
+    def __init__(self):
+        self._trees: Dict[int, MaxSegmentTree] = {}
+        # order_id -> [(resource_id, start_date, end_date, quantity)]
+        self._orders: Dict[int, List[Tuple[int, str, str, int]]] = {}
+        self._lock = threading.Lock()
+
+    def _apply(self, entries: Iterable[Tuple[int, str, str, int]], sign: int):
+        for resource_id, start_date, end_date, quantity in entries:
+            tree = self._trees.get(resource_id)
+            if tree is None:
+                tree = self._trees[resource_id] = MaxSegmentTree()
+            tree.add(_to_day(start_date), _to_day(end_date), sign * quantity)
+
+    def load(self, rows: Iterable[Tuple[int, int, str, str, int]]):
+        """Построить журнал с нуля из строк (order_id, resource_id, start, end, quantity)"""
+        orders: Dict[int, List[Tuple[int, str, str, int]]] = {}
+        for order_id, resource_id, start_date, end_date, quantity in rows:
+            orders.setdefault(order_id, []).append((resource_id, start_date, end_date, quantity))
+
+        with self._lock:
+            self._trees = {}
+            self._orders = orders
+            for entries in orders.values():
+                self._apply(entries, 1)
+
+        logger.info(f"Журнал броней загружен: {len(orders)} активных заказов")
+
+    def add_order(self, order_id: int, start_date: str, end_date: str,
+                  items: Iterable[Tuple[int, int]]):
+        """Добавить активный заказ; items - пары (resource_id, quantity)"""
+        entries = [(resource_id, start_date, end_date, quantity) for resource_id, quantity in items]
+        with self._lock:
+            self._apply(self._orders.pop(order_id, []), -1)
+            self._orders[order_id] = entries
+            self._apply(entries, 1)
+
+    def remove_order(self, order_id: int):
+        """Убрать заказ (завершён, удалён)"""
+        with self._lock:
+            self._apply(self._orders.pop(order_id, []), -1)
+
+    def move_order(self, order_id: int, start_date: str, end_date: str):
+        """Перенести заказ на новые даты"""
+        with self._lock:
+            entries = self._orders.get(order_id)
+            if not entries:
+                return
+            self._apply(entries, -1)
+            moved = [(resource_id, start_date, end_date, quantity)
+                     for resource_id, _, _, quantity in entries]
+            self._orders[order_id] = moved
+            self._apply(moved, 1)
+
+    def peak_usage(self, resource_id: int, start_date: str, end_date: str) -> int:
+        """Максимальное число одновременно занятых единиц ресурса за период"""
+        with self._lock:
+            tree = self._trees.get(resource_id)
+            if tree is None:
+                return 0
+            return tree.max(_to_day(start_date), _to_day(end_date))
+
+    def resource_ids(self) -> List[int]:
+        with self._lock:
+            return list(self._trees)
+
+    def snapshot(self) -> Dict[int, List[Tuple[int, str, str, int]]]:
+        """Копия содержимого журнала: {order_id: [(resource_id, start, end, quantity)]}"""
+        with self._lock:
+            return {order_id: sorted(entries) for order_id, entries in self._orders.items()}
+
+    def diff(self, rows: Iterable[Tuple[int, int, str, str, int]]) -> List[str]:
+        """Сравнить журнал с эталонными строками из SQL; вернуть описания расхождений"""
+        expected: Dict[int, List[Tuple[int, str, str, int]]] = {}
+        for order_id, resource_id, start_date, end_date, quantity in rows:
+            expected.setdefault(order_id, []).append((resource_id, start_date, end_date, quantity))
+
+        actual = self.snapshot()
+        problems = []
+        for order_id in sorted(set(expected) | set(actual)):
+            want = sorted(expected.get(order_id, []))
+            have = actual.get(order_id, [])
+            if want != have:
+                problems.append(f"заказ #{order_id}: в базе {want}, в журнале {have}")
+        return problems
@@ -1,193 +1,187 @@
 import asyncio
 import signal
-import shutil
-import os
-from datetime import datetime, timedelta
+from datetime import timedelta
+from typing import Optional
 from aiogram import Bot, Dispatcher
 
-from config import BOT_TOKEN, ADMIN_IDS, logger
-from database import get_database
-from utils import get_main_keyboard
+from config import BOT_TOKEN, ADMIN_IDS, REMINDERS_SCHEDULE, BACKUP_SCHEDULE, logger
+from backup import run_backup
+from database import AsyncDatabase, get_async_database
+from delivery import get_delivery
+from report_jobs import get_report_queue
+from scheduler import get_scheduler
 from middleware import AdminCheckMiddleware  # НОВОЕ
 
-# Импорт роутеров
-from handlers import (
-    common, 
-    booking, 
-    tasks, 
-    resources, 
-    delete_booking, 
-    reports, 
-    messaging,
-    edit_resource, 
-    edit_booking, 
-    broadcast, 
-    calendar as calendar_handler
-)
-
-# Инициализация
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
-db = get_database()
-
-# РЕГИСТРАЦИЯ MIDDLEWARE
-dp.message.middleware(AdminCheckMiddleware())
-dp.callback_query.middleware(AdminCheckMiddleware())
-
-# Регистрация роутеров
-dp.include_router(common.router)
-dp.include_router(booking.router)
-dp.include_router(tasks.router)
-dp.include_router(resources.router)
-dp.include_router(edit_resource.router)
-dp.include_router(edit_booking.router)
-dp.include_router(delete_booking.router)
-dp.include_router(reports.router)
-dp.include_router(messaging.router)
-dp.include_router(broadcast.router)
-dp.include_router(calendar_handler.router)
-
-# Флаг для остановки задач
-shutdown_event = asyncio.Event()
+# Бот, диспетчер и база создаются в setup(), а не при импорте: процессы
+# генерации отчётов (spawn) заново импортируют этот модуль как __mp_main__,
+# и каждый строил бы вторую полную базу и загружал все роутеры
+bot: Optional[Bot] = None
+dp: Optional[Dispatcher] = None
+db: Optional[AsyncDatabase] = None
+scheduler = get_scheduler()
+
+
+def setup():
+    """Инициализация бота, базы и регистрация роутеров"""
+    global bot, dp, db
+    
+    # Роутеры и utils при импорте подключаются к базе
+    from handlers import (
+        common, 
+        booking, 
+        tasks, 
+        resources, 
+        delete_booking, 
+        reports, 
+        messaging,
+        edit_resource, 
+        edit_booking, 
+        broadcast, 
+        calendar as calendar_handler
+    )
+    
+    bot = Bot(token=BOT_TOKEN)
+    dp = Dispatcher()
+    db = get_async_database()
+    
+    # РЕГИСТРАЦИЯ MIDDLEWARE
+    dp.message.middleware(AdminCheckMiddleware())
+    dp.callback_query.middleware(AdminCheckMiddleware())
+    
+    # Регистрация роутеров
+    dp.include_router(common.router)
+    dp.include_router(booking.router)
+    dp.include_router(tasks.router)
+    dp.include_router(resources.router)
+    dp.include_router(edit_resource.router)
+    dp.include_router(edit_booking.router)
+    dp.include_router(delete_booking.router)
+    dp.include_router(reports.router)
+    dp.include_router(messaging.router)
+    dp.include_router(broadcast.router)
+    dp.include_router(calendar_handler.router)
+
+
+# Таймауты периодических задач, секунд
+REMINDERS_TIMEOUT = 300
+BACKUP_TIMEOUT = 1800
 
 
 async def send_daily_reminders():
     """Ежедневные напоминания о задачах и просроченных заказах"""
-    while not shutdown_event.is_set():
-        try:
-            now = datetime.now()
-            
-            # Отправка напоминаний в 9:00
-            if now.hour == 9 and now.minute == 0:
-                today = now.strftime('%Y-%m-%d')
-                
-                # Обновляем статусы просроченных
-                db.update_overdue_status()
-                
-                # Получаем данные
-                orders_to_give = db.get_orders_to_give_today()
-                orders_to_return = db.get_orders_to_return_today()
-                overdue_orders = db.get_overdue_orders()
-                
-                # Формируем сообщение только если есть задачи
-                if orders_to_give or orders_to_return or overdue_orders:
-                    text = "🔔 <b>НАПОМИНАНИЕ О ЗАДАЧАХ НА СЕГОДНЯ</b>\n\n"
-                    
-                    if overdue_orders:
-                        text += f"🔴 Просроченных возвратов: {len(overdue_orders)}\n"
-                        for order in overdue_orders[:3]:
-                            order_id = order[0]
-                            client_name = order[1]
-                            days = int(order[9]) if len(order) > 9 else 0
-                            text += f"   • Заказ #{order_id} ({client_name}) — {days} дн.\n"
-                        text += "\n"
-                    
-                    if orders_to_give:
-                        text += f"🟢 Выдать оборудование: {len(orders_to_give)} заказов\n"
-                    
-                    if orders_to_return:
-                        text += f"🔴 Забрать оборудование: {len(orders_to_return)} заказов\n"
-                    
-                    text += "\n📱 Используйте кнопку 'Сегодня' для просмотра деталей."
-                    
-                    # Отправляем всем администраторам
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            await bot.send_message(
-                                admin_id,
-                                text,
-                                parse_mode='HTML',
-                                reply_markup=get_main_keyboard()
-                            )
-                            logger.info(f"Напоминание отправлено админу {admin_id}")
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки напоминания админу {admin_id}: {e}")
-                
-                # Ждём час перед следующей проверкой
-                await asyncio.sleep(3600)
-            else:
-                # Проверяем каждую минуту
-                await asyncio.sleep(60)
-        
-        except asyncio.CancelledError:
-            logger.info("Задача напоминаний остановлена")
-            break
-        except Exception as e:
-            logger.error(f"Ошибка в задаче напоминаний: {e}")
-            await asyncio.sleep(60)
+    # Обновляем статусы просроченных
+    await db.update_overdue_status()
+    
+    # Получаем данные
+    orders_to_give = await db.get_orders_to_give_today()
+    orders_to_return = await db.get_orders_to_return_today()
+    overdue_orders = await db.get_overdue_orders()
+    
+    # Формируем сообщение только если есть задачи
+    if not (orders_to_give or orders_to_return or overdue_orders):
+        return
+    
+    text = "🔔 <b>НАПОМИНАНИЕ О ЗАДАЧАХ НА СЕГОДНЯ</b>\n\n"
+    
+    if overdue_orders:
+        text += f"🔴 Просроченных возвратов: {len(overdue_orders)}\n"
+        for order in overdue_orders[:3]:
+            order_id = order[0]
+            client_name = order[1]
+            days = int(order[9]) if len(order) > 9 else 0
+            text += f"   • Заказ #{order_id} ({client_name}) — {days} дн.\n"
+        text += "\n"
+    
+    if orders_to_give:
+        text += f"🟢 Выдать оборудование: {len(orders_to_give)} заказов\n"
+    
+    if orders_to_return:
+        text += f"🔴 Забрать оборудование: {len(orders_to_return)} заказов\n"
+    
+    text += "\n📱 Используйте кнопку 'Сегодня' для просмотра деталей."
+    
+    # Отправляем всем администраторам
+    from utils import get_main_keyboard
+    stats = await get_delivery(bot).broadcast(
+        ADMIN_IDS,
+        text,
+        parse_mode='HTML',
+        reply_markup=get_main_keyboard()
+    )
+    logger.info(f"Напоминания отправлены: {stats.sent} из {stats.total}")
 
 
 async def backup_database():
     """Ежедневное резервное копирование базы данных"""
-    while not shutdown_event.is_set():
-        try:
-            now = datetime.now()
-            
-            # Backup в 3:00 ночи
-            if now.hour == 3 and now.minute == 0:
-                backup_dir = "backups"
-                
-                # Создаём папку для бэкапов если её нет
-                if not os.path.exists(backup_dir):
-                    os.makedirs(backup_dir)
-                    logger.info(f"Создана папка для бэкапов: {backup_dir}")
-                
-                # Имя файла с датой
-                backup_name = f"booking_backup_{now.strftime('%Y%m%d')}.db"
-                backup_path = os.path.join(backup_dir, backup_name)
-                
-                # Копируем базу данных
-                shutil.copy2(db.db_path, backup_path)
-                logger.info(f"✅ Создан бэкап: {backup_path}")
-                
-                # Удаляем старые бэкапы (старше 30 дней)
-                for filename in os.listdir(backup_dir):
-                    file_path = os.path.join(backup_dir, filename)
-                    if os.path.isfile(file_path):
-                        file_age_days = (now - datetime.fromtimestamp(
-                            os.path.getmtime(file_path)
-                        )).days
-                        
-                        if file_age_days > 30:
-                            os.remove(file_path)
-                            logger.info(f"Удалён старый бэкап: {filename}")
-                
-                await asyncio.sleep(3600)  # Ждём час
-            else:
-                await asyncio.sleep(60)  # Проверяем каждую минуту
-        
-        except asyncio.CancelledError:
-            logger.info("Задача backup остановлена")
-            break
-        except Exception as e:
-            logger.error(f"Ошибка backup: {e}")
-            await asyncio.sleep(60)
+    # Копирование, проверка и сжатие идут в потоке и не блокируют event loop.
+    # Таймаут планировщика отменяет только ожидание, поэтому поток получает
+    # тот же срок и прерывается сам
+    await asyncio.to_thread(run_backup, db.db_path, timeout=BACKUP_TIMEOUT)
+
+
+def register_jobs():
+    """Регистрация периодических задач в планировщике"""
+    scheduler.add(
+        "reminders", REMINDERS_SCHEDULE, send_daily_reminders,
+        timeout=REMINDERS_TIMEOUT,
+        # Напоминание о задачах на сегодня после полуночи уже бесполезно
+        max_lateness=timedelta(hours=12),
+        description="Напоминания администраторам"
+    )
+    scheduler.add(
+        "backup", BACKUP_SCHEDULE, backup_database,
+        timeout=BACKUP_TIMEOUT,
+        description="Резервная копия базы данных"
+    )
 
 
 async def on_shutdown():
     """Корректное завершение работы бота"""
     logger.info("🛑 Остановка бота...")
     
-    # Останавливаем задачи
-    shutdown_event.set()
+    # Останавливаем периодические задачи
+    await scheduler.stop()
+    logger.info(f"Планировщик: {scheduler.stats()}")
+    
+    # Прерываем рассылки: они продолжатся после следующего запуска
+    from handlers import broadcast
+    await broadcast.stop_broadcasts()
     
     # Закрываем сессию бота
     await bot.session.close()
     
+    # Останавливаем процессы генерации отчётов
+    report_queue = get_report_queue()
+    logger.info(f"Генерация отчётов: {report_queue.stats()}")
+    await asyncio.to_thread(report_queue.shutdown)
+    
+    # Дожидаемся завершения запросов к базе
+    logger.info(f"Пул соединений БД: {db.sync.get_pool_stats()}")
+    logger.info(f"Кэш каталога ресурсов: {db.sync.get_catalogue_stats()}")
+    from utils import get_order_render_stats
+    logger.info(f"Кэш карточек заказов: {get_order_render_stats()}")
+    db.close()
+    
     logger.info("✅ Бот остановлен")
 
 
 async def main():
     """Основная функция запуска бота"""
+    setup()
+    
     logger.info("=" * 50)
     logger.info("🚀 Бот запущен")
     logger.info(f"👥 Администраторы: {ADMIN_IDS}")
     logger.info(f"💾 База данных: {db.db_path}")
     logger.info("=" * 50)
     
-    # Запуск задач
-    reminder_task = asyncio.create_task(send_daily_reminders())
-    backup_task = asyncio.create_task(backup_database())
+    # Запуск периодических задач
+    register_jobs()
+    await scheduler.start()
+    
+    # Продолжаем рассылки, прерванные прошлой остановкой
+    from handlers import broadcast
+    await broadcast.resume_broadcasts(bot)
     
     try:
         # Запуск polling
@@ -196,19 +190,6 @@ async def main():
         logger.info("Получен сигнал остановки")
     finally:
         # Корректное завершение
-        reminder_task.cancel()
-        backup_task.cancel()
-        
-        try:
-            await reminder_task
-        except asyncio.CancelledError:
-            pass
-        
-        try:
-            await backup_task
-        except asyncio.CancelledError:
-            pass
-        
         await on_shutdown()
 
 
@@ -0,0 +1,62 @@
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+# Сколько минимальных единиц (копеек) в одной основной
+MINOR_UNITS = 100
+
+# Наибольшая сумма в основных единицах (не включительно): в копейках
+# должна помещаться в INTEGER SQLite с большим запасом
+MAX_AMOUNT = 10 ** 12
+
+# Допустимые обозначения валюты после суммы
+_CURRENCY_RE = re.compile(r'\s*(руб\.?|р\.?|rub|₽)\s*$', re.IGNORECASE)
+
+
+def parse_money(text: Optional[str]) -> Optional[int]:
+    """
+    Сумма из текста в копейках: '5000' -> 500000, '1 500,50 руб.' -> 150050.
+    Пустая строка и '-' означают "не указано" (None).
+    При некорректном значении бросает ValueError с понятным описанием.
+    """
+    if text is None:
+        return None
+
+    value = text.strip()
+    if not value or value == '-':
+        return None
+
+    value = _CURRENCY_RE.sub('', value)
+    value = value.replace(' ', '').replace('\u00a0', '').replace(',', '.')
+
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError("не число")
+
+    if not amount.is_finite():
+        raise ValueError("не число")
+    # Decimal понимает '1e30' - в сумме такой записи быть не должно
+    if 'e' in value.lower():
+        raise ValueError("экспоненциальная запись не поддерживается")
+    if amount < 0:
+        raise ValueError("отрицательная сумма")
+    if amount >= MAX_AMOUNT:
+        raise ValueError(f"сумма должна быть меньше {MAX_AMOUNT}")
+
+    minor = amount * MINOR_UNITS
+    if minor != minor.to_integral_value():
+        raise ValueError("больше двух знаков после запятой")
+
+    return int(minor)
+
+
+def format_money(minor: Optional[int]) -> str:
+    """Копейки -> текст для отображения: 500000 -> '5000', 150050 -> '1500.50'"""
+    if minor is None:
+        return ''
+
+    units, cents = divmod(minor, MINOR_UNITS)
+    if cents:
+        return f"{units}.{cents:02d}"
+    return str(units)
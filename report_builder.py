@@ -0,0 +1,378 @@
+import io
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.utils import get_column_letter
+
+from database import Database
+
+# Горизонт пиковой загрузки в отчёте по оборудованию (дней)
+PEAK_HORIZON_DAYS = 30
+
+# Предельная ширина столбца (символов)
+MAX_COLUMN_WIDTH = 50
+
+# Как часто сообщать о прогрессе (строк данных)
+PROGRESS_STEP = 1000
+
+# progress(записано строк, всего строк или None, если заранее неизвестно)
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+STATUS_NAMES = {
+    'pending': 'Ожидает выдачи',
+    'issued': 'Выдано',
+    'overdue': 'Просрочено',
+    'completed': 'Завершено'
+}
+
+STATUS_COLORS = {
+    'pending': 'FFF4E6',
+    'issued': 'E7F3FF',
+    'overdue': 'FFE7E7',
+    'completed': 'E7FFE7'
+}
+
+# Стили создаются один раз и переиспользуются всеми ячейками
+TITLE_FONT = Font(bold=True, size=14, color="366092")
+SECTION_FONT = Font(bold=True, size=11)
+BOLD_FONT = Font(bold=True)
+ITALIC_FONT = Font(italic=True)
+HEADER_FONT = Font(bold=True, color="FFFFFF", size=11)
+HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+CENTER = Alignment(horizontal='center', vertical='center')
+VCENTER = Alignment(vertical='center')
+THIN_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+
+_fills: Dict[str, PatternFill] = {}
+
+
+def _fill(color: str) -> PatternFill:
+    if color not in _fills:
+        _fills[color] = PatternFill(start_color=color, end_color=color, fill_type="solid")
+    return _fills[color]
+
+
+def fit_width(*lengths: int) -> int:
+    """Ширина столбца по самому длинному значению (как при автоподборе)"""
+    return min(max(lengths, default=0) + 2, MAX_COLUMN_WIDTH)
+
+
+def period_text(start_date: Optional[str], end_date: Optional[str]) -> str:
+    if start_date and end_date:
+        return f"Период: {start_date} — {end_date}"
+    return "Период: за всё время"
+
+
+class ReportSheet:
+    """
+    Лист отчёта в режиме write-only: каждая строка сразу сериализуется
+    и не хранится в памяти. Ширины столбцов в этом режиме записываются
+    перед первой строкой, поэтому передаются в конструктор.
+    """
+
+    def __init__(self, title: str, widths: Sequence[int],
+                 progress: Optional[ProgressCallback] = None, total: Optional[int] = None):
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(title)
+        self.columns = len(widths)
+        self.row = 0
+        self.data_rows = 0
+        self.progress = progress
+        self.total = total
+        for col, width in enumerate(widths, 1):
+            self.ws.column_dimensions[get_column_letter(col)].width = width
+
+    def cell(self, value, font=None, fill=None, alignment=None, border=None) -> WriteOnlyCell:
+        cell = WriteOnlyCell(self.ws, value=value)
+        if font is not None:
+            cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if alignment is not None:
+            cell.alignment = alignment
+        if border is not None:
+            cell.border = border
+        return cell
+
+    def append(self, values: Sequence = ()):
+        self.ws.append(list(values))
+        self.row += 1
+
+    def merge(self, first_col: int = 1, last_col: Optional[int] = None):
+        """Объединить ячейки последней записанной строки"""
+        last_col = last_col or self.columns
+        self.ws.merged_cells.add(
+            f"{get_column_letter(first_col)}{self.row}:{get_column_letter(last_col)}{self.row}"
+        )
+
+    def title(self, text: str, font=TITLE_FONT, alignment=CENTER):
+        """Строка-заголовок на всю ширину таблицы"""
+        self.append([self.cell(text, font=font, alignment=alignment)])
+        self.merge()
+
+    def header(self, columns: Sequence[str]):
+        self.append([
+            self.cell(name, font=HEADER_FONT, fill=HEADER_FILL, alignment=CENTER, border=THIN_BORDER)
+            for name in columns
+        ])
+
+    def data_row(self, values: Sequence, fill: Optional[PatternFill] = None):
+        """Строка данных с рамкой; без явной заливки строки чередуются"""
+        if fill is None:
+            # Номер строки, которая будет записана
+            fill = _fill("F2F2F2" if (self.row + 1) % 2 == 0 else "FFFFFF")
+        self.append([
+            self.cell(value, fill=fill, alignment=VCENTER, border=THIN_BORDER)
+            for value in values
+        ])
+        self.data_rows += 1
+        if self.progress and self.data_rows % PROGRESS_STEP == 0:
+            self.progress(self.data_rows, self.total)
+
+    def to_bytes(self) -> bytes:
+        if self.progress:
+            self.progress(self.data_rows, self.data_rows)
+        buffer = io.BytesIO()
+        self.wb.save(buffer)
+        return buffer.getvalue()
+
+
+def generate_clients_excel(db: Database, start_date=None, end_date=None,
+                           progress: Optional[ProgressCallback] = None) -> bytes:
+    """Excel отчёт по клиентам"""
+    headers = ['Имя клиента', 'Телефон', 'Первый заказ', 'Последний заказ', 'Всего заказов', 'Общая сумма']
+    text = db.get_report_text_widths(start_date, end_date)
+    widths = [
+        fit_width(len(headers[0]), text['name']),
+        fit_width(len(headers[1]), text['phone']),
+        fit_width(len(headers[2]), 10),
+        fit_width(len(headers[3]), 10),
+        fit_width(len(headers[4])),
+        fit_width(len(headers[5])),
+    ]
+
+    sheet = ReportSheet("База клиентов", widths, progress)
+    sheet.title("ОТЧЁТ: БАЗА КЛИЕНТОВ")
+    sheet.title(period_text(start_date, end_date), font=ITALIC_FONT, alignment=Alignment(horizontal='center'))
+    sheet.append()
+    sheet.header(headers)
+
+    clients_count = 0
+    total_orders_sum = 0
+    total_revenue_sum = 0.0
+
+    for client_name, phone, first_order, last_order, total_orders, total_spent in db.iter_clients_report(start_date, end_date):
+        sheet.data_row([
+            client_name,
+            phone,
+            first_order[:10] if first_order else '',
+            last_order[:10] if last_order else '',
+            total_orders,
+            f"{total_spent:.2f}" if total_spent else "0.00",
+        ])
+        clients_count += 1
+        total_orders_sum += total_orders
+        total_revenue_sum += total_spent or 0
+
+    # Итоги
+    sheet.append()
+    sheet.append([
+        sheet.cell(f"ИТОГО КЛИЕНТОВ: {clients_count}", font=BOLD_FONT), None, None, None,
+        sheet.cell(total_orders_sum, font=BOLD_FONT),
+        sheet.cell(f"{total_revenue_sum:.2f}", font=BOLD_FONT),
+    ])
+    sheet.merge(1, 4)
+
+    return sheet.to_bytes()
+
+
+def generate_financial_excel(db: Database, start_date=None, end_date=None,
+                             progress: Optional[ProgressCallback] = None) -> bytes:
+    """Excel финансовый отчёт"""
+    total_orders, total_revenue, avg_order = db.get_financial_report(start_date, end_date)
+    revenue_text = f"{total_revenue:.2f} руб." if total_revenue else "0.00 руб."
+    avg_text = f"{avg_order:.2f} руб." if avg_order else "0.00 руб."
+    new_clients = db.get_new_clients_count(start_date, end_date)
+    resource_units = db.get_resource_units(start_date, end_date)
+
+    headers = ['№ Заказа', 'Клиент', 'Период', 'Стоимость', 'Статус']
+    text = db.get_report_text_widths(start_date, end_date)
+    widths = [
+        fit_width(len(headers[0]), len("ДЕТАЛИЗАЦИЯ ПО ЗАКАЗАМ:"), len("ОБОРУДОВАНИЕ ЗА ПЕРИОД:"),
+                  *(len(name) + 1 for name, _ in resource_units)),
+        fit_width(len(headers[1]), text['name_phone'] + 3, len(revenue_text), len(avg_text)),
+        fit_width(len(headers[2]), len("ГГГГ-ММ-ДД — ГГГГ-ММ-ДД")),
+        fit_width(len(headers[3]), text['cost']),
+        fit_width(len(headers[4]), max(len(name) for name in STATUS_NAMES.values())),
+    ]
+
+    sheet = ReportSheet("Финансовый отчёт", widths, progress, total_orders)
+    sheet.title("ФИНАНСОВЫЙ ОТЧЁТ")
+    sheet.title(period_text(start_date, end_date), font=ITALIC_FONT, alignment=Alignment(horizontal='center'))
+    sheet.append()
+
+    # Сводка
+    sheet.append([sheet.cell("СВОДКА:", font=Font(bold=True, size=12))])
+    sheet.append(["Всего заказов:", sheet.cell(total_orders, font=BOLD_FONT)])
+    sheet.append(["Общая выручка:", sheet.cell(revenue_text, font=Font(bold=True, color="00AA00"))])
+    sheet.append(["Средний чек:", sheet.cell(avg_text, font=BOLD_FONT)])
+    sheet.append(["Новых клиентов:", sheet.cell(new_clients, font=BOLD_FONT)])
+    sheet.append()
+
+    # Забронированные единицы оборудования
+    if resource_units:
+        sheet.append([sheet.cell("ОБОРУДОВАНИЕ ЗА ПЕРИОД:", font=SECTION_FONT)])
+        for name, units in resource_units:
+            sheet.append([f"{name}:", sheet.cell(f"{units} шт.", font=BOLD_FONT)])
+        sheet.append()
+
+    # Таблица заказов
+    sheet.append([sheet.cell("ДЕТАЛИЗАЦИЯ ПО ЗАКАЗАМ:", font=SECTION_FONT)])
+    sheet.header(headers)
+
+    for order in db.iter_operations_report(start_date, end_date):
+        order_id, client_name, client_phone, start, end, cost, status, created_at, completed_at = order
+        sheet.data_row([
+            f"#{order_id}",
+            f"{client_name} ({client_phone})",
+            f"{start} — {end}",
+            cost if cost else "—",
+            STATUS_NAMES.get(status, status),
+        ])
+
+    return sheet.to_bytes()
+
+
+def generate_operations_excel(db: Database, start_date=None, end_date=None,
+                              progress: Optional[ProgressCallback] = None) -> bytes:
+    """Excel отчёт по операциям"""
+    status_stats = db.get_status_counts(start_date, end_date)
+    headers = ['№', 'Клиент', 'Телефон', 'Начало', 'Конец', 'Стоимость', 'Статус', 'Создан']
+    text = db.get_report_text_widths(start_date, end_date)
+    status_width = max(len(name) for name in STATUS_NAMES.values())
+    widths = [
+        fit_width(len(headers[0]), len("ДЕТАЛЬНАЯ ИНФОРМАЦИЯ:"), status_width + 1),
+        fit_width(len(headers[1]), text['name']),
+        fit_width(len(headers[2]), text['phone']),
+        fit_width(len(headers[3]), 10),
+        fit_width(len(headers[4]), 10),
+        fit_width(len(headers[5]), text['cost']),
+        fit_width(len(headers[6]), status_width),
+        fit_width(len(headers[7]), 16),
+    ]
+
+    sheet = ReportSheet("История операций", widths, progress, sum(status_stats.values()))
+    sheet.title("ИСТОРИЯ ОПЕРАЦИЙ")
+    sheet.title(period_text(start_date, end_date), font=ITALIC_FONT, alignment=Alignment(horizontal='center'))
+    sheet.append()
+
+    # Статистика по статусам
+    sheet.append([sheet.cell("СТАТИСТИКА:", font=SECTION_FONT)])
+    for status, count in status_stats.items():
+        sheet.append([f"{STATUS_NAMES.get(status, status)}:", sheet.cell(count, font=BOLD_FONT)])
+    sheet.append()
+
+    # Таблица операций
+    sheet.append([sheet.cell("ДЕТАЛЬНАЯ ИНФОРМАЦИЯ:", font=SECTION_FONT)])
+    sheet.header(headers)
+
+    for op in db.iter_operations_report(start_date, end_date):
+        order_id, client_name, client_phone, start, end, cost, status, created_at, completed_at = op
+        # Цветовое выделение по статусу
+        color = STATUS_COLORS.get(status)
+        sheet.data_row([
+            f"#{order_id}",
+            client_name,
+            client_phone,
+            start,
+            end,
+            cost if cost else "—",
+            STATUS_NAMES.get(status, status),
+            created_at[:16] if created_at else "",
+        ], fill=_fill(color if color else "FFFFFF"))
+
+    return sheet.to_bytes()
+
+
+def peak_period() -> Tuple[str, str]:
+    """Период пиковой загрузки в отчёте по оборудованию: сегодня + PEAK_HORIZON_DAYS дней"""
+    today = datetime.now()
+    peak_end = today + timedelta(days=PEAK_HORIZON_DAYS - 1)
+    return today.strftime('%Y-%m-%d'), peak_end.strftime('%Y-%m-%d')
+
+
+def generate_equipment_report(db: Database, progress: Optional[ProgressCallback] = None,
+                              peak_usage: Optional[Dict[int, int]] = None) -> bytes:
+    """
+    Excel отчёт по оборудованию.
+    peak_usage - готовая пиковая загрузка {resource_id: единиц} (например, из журнала
+    броней основного процесса); без неё пик считается запросом к базе.
+    """
+    resources = db.get_resources()
+    today = datetime.now().strftime('%Y-%m-%d')
+
+    headers = ['Название', 'Всего единиц', 'Доступно сейчас', 'Забронировано', '% загрузки', 'Статус',
+               f'Пик за {PEAK_HORIZON_DAYS} дн.']
+    widths = [
+        fit_width(len(headers[0]), *(len(resource[1]) for resource in resources)),
+        fit_width(len(headers[1])),
+        fit_width(len(headers[2])),
+        fit_width(len(headers[3])),
+        fit_width(len(headers[4])),
+        fit_width(len(headers[5]), len("Полностью занято")),
+        fit_width(len(headers[6])),
+    ]
+
+    # Доступность всех ресурсов на сегодня одним запросом
+    availability = db.get_availability_bulk(today, today)
+
+    # Пиковая одновременная загрузка на ближайший период
+    if peak_usage is None:
+        peak_usage = db.get_peak_usage_bulk(*peak_period())
+
+    sheet = ReportSheet("Оборудование", widths, progress, len(resources))
+    sheet.title("ОТЧЁТ ПО ОБОРУДОВАНИЮ")
+    sheet.title(f"Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}", font=ITALIC_FONT,
+                alignment=Alignment(horizontal='center'))
+    sheet.append()
+    sheet.header(headers)
+
+    for res_id, name, description, total_quantity in resources:
+        available = availability.get(res_id, total_quantity)
+        booked = total_quantity - available
+        utilization = (booked / total_quantity * 100) if total_quantity > 0 else 0
+
+        # Статус
+        if available == 0:
+            status = "Полностью занято"
+            status_color = "FFE7E7"
+        elif available < total_quantity * 0.3:
+            status = "Высокая загрузка"
+            status_color = "FFF4E6"
+        else:
+            status = "Доступно"
+            status_color = "E7FFE7"
+
+        sheet.data_row([
+            name,
+            total_quantity,
+            available,
+            booked,
+            f"{utilization:.1f}%",
+            status,
+            f"{peak_usage.get(res_id, 0)}/{total_quantity}",
+        ], fill=_fill(status_color))
+
+    # Итоги
+    sheet.append()
+    sheet.title(f"ВСЕГО ПОЗИЦИЙ: {len(resources)}", font=BOLD_FONT, alignment=Alignment(horizontal='center'))
+
+    return sheet.to_bytes()
@@ -0,0 +1,387 @@
+import asyncio
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import report_builder
+from config import (
+    DATABASE_PATH, REPORT_WORKERS, REPORT_MAX_PER_USER,
+    REPORT_CACHE_MAX_MB, REPORT_CACHE_MAX_ENTRIES, logger
+)
+from database import Database, get_database
+
+# Ключ задачи: (тип отчёта, начало периода, конец периода)
+JobKey = Tuple[str, Optional[str], Optional[str]]
+
+# on_progress(записано строк, всего строк или None)
+AsyncProgressCallback = Callable[[int, Optional[int]], Awaitable[None]]
+
+# Пиковая загрузка для отчёта по оборудованию: {resource_id: единиц} или None
+PeakSource = Callable[[], Optional[Dict[int, int]]]
+
+# Сколько секунд ждать процессы пула при остановке, прежде чем завершить их принудительно
+SHUTDOWN_TIMEOUT = 10.0
+
+REPORT_TYPES = ('clients', 'financial', 'operations', 'equipment')
+
+# Отчёты, зависящие только от периода и данных; отчёт по оборудованию
+# строится на текущий момент и не кэшируется
+CACHEABLE_REPORTS = ('clients', 'financial', 'operations')
+
+
+class ReportLimitError(Exception):
+    """У пользователя уже формируется максимум отчётов"""
+
+
+# === ПРОЦЕСС-ОБРАБОТЧИК ===
+
+_worker_db: Optional[Database] = None
+_worker_progress = None
+
+
+def _init_worker(db_path: str, progress_queue):
+    """Инициализация процесса пула: своё соединение с базой и канал прогресса"""
+    global _worker_db, _worker_progress
+    _worker_db = Database(db_path, pool_size=1, cache_catalogue=False,
+                          use_ledger=False, init_schema=False)
+    _worker_progress = progress_queue
+
+
+def _run_report(key: JobKey, peak_usage: Optional[Dict[int, int]] = None) -> bytes:
+    """Сформировать отчёт в процессе пула"""
+    report_type, start_date, end_date = key
+
+    def progress(done: int, total: Optional[int]):
+        _worker_progress.put((key, done, total))
+
+    # Задача взята в работу
+    progress(0, None)
+
+    if report_type == 'clients':
+        return report_builder.generate_clients_excel(_worker_db, start_date, end_date, progress)
+    if report_type == 'financial':
+        return report_builder.generate_financial_excel(_worker_db, start_date, end_date, progress)
+    if report_type == 'operations':
+        return report_builder.generate_operations_excel(_worker_db, start_date, end_date, progress)
+    if report_type == 'equipment':
+        return report_builder.generate_equipment_report(_worker_db, progress, peak_usage)
+    raise ValueError(f"Неизвестный тип отчёта: {report_type}")
+
+
+# === ОСНОВНОЙ ПРОЦЕСС ===
+
+def _ledger_peak_usage() -> Optional[Dict[int, int]]:
+    """
+    Пиковая загрузка из журнала броней основного процесса (O(log n) на ресурс,
+    без обращения к базе). Без журнала - None: пик посчитает процесс пула запросом.
+    """
+    db = get_database()
+    if db.ledger is None:
+        return None
+    return db.get_peak_usage_bulk(*report_builder.peak_period())
+
+
+class ReportResult:
+    """Готовый отчёт: содержимое .xlsx и file_id после первой отправки в Telegram"""
+
+    __slots__ = ('key', 'version', 'content', 'file_id')
+
+    def __init__(self, key: JobKey, version: int, content: Optional[bytes]):
+        self.key = key
+        self.version = version
+        self.content = content
+        self.file_id: Optional[str] = None
+
+
+class ReportCache:
+    """
+    LRU готовых отчётов, ограниченный числом записей и суммарным размером.
+    Запись действительна, пока не изменилась версия данных (Database.data_version).
+    После отправки в Telegram содержимое заменяется на file_id.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[JobKey, ReportResult]" = OrderedDict()
+        self._size = 0
+
+        # Счётчики
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0   # записи, устаревшие из-за изменения данных
+        self.evictions = 0     # вытеснены по размеру или числу записей
+
+    def _drop(self, key: JobKey):
+        entry = self._entries.pop(key)
+        self._size -= len(entry.content or b'')
+
+    def get(self, key: JobKey, version: int) -> Optional[ReportResult]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.version != version:
+            self._drop(key)
+            self.invalidated += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: JobKey, version: int, content: bytes) -> ReportResult:
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version:
+            # Тот же отчёт уже сохранён (например, общий результат дедуплицированных запросов)
+            return entry
+        if entry is not None:
+            self._drop(key)
+
+        entry = ReportResult(key, version, content)
+        if len(content) > self.max_bytes:
+            return entry
+
+        self._entries[key] = entry
+        self._size += len(content)
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+        return entry
+
+    def set_file_id(self, entry: ReportResult, file_id: str):
+        """Запомнить file_id отправленного отчёта и освободить его содержимое"""
+        entry.file_id = file_id
+        if self._entries.get(entry.key) is entry and entry.content is not None:
+            self._size -= len(entry.content)
+            entry.content = None
+
+    def stats(self) -> Dict:
+        requests = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'size': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'invalidated': self.invalidated,
+            'evictions': self.evictions,
+        }
+
+
+class ReportQueue:
+    """
+    Очередь генерации отчётов в ограниченном пуле процессов (spawn).
+    openpyxl не блокирует event loop и не конкурирует с ботом за GIL.
+    Одинаковые запросы, уже находящиеся в работе, получают общий результат.
+    Число задач одного пользователя ограничено, поэтому очередь пула
+    не больше (число администраторов x max_per_user).
+    Готовые отчёты кэшируются до изменения версии данных.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, max_workers: int = REPORT_WORKERS,
+                 max_per_user: int = REPORT_MAX_PER_USER,
+                 cache_max_bytes: int = REPORT_CACHE_MAX_MB * 1024 * 1024,
+                 cache_max_entries: int = REPORT_CACHE_MAX_ENTRIES,
+                 version_source: Callable[[], int] = None,
+                 peak_source: PeakSource = _ledger_peak_usage):
+        self.db_path = db_path
+        self.max_workers = max(1, max_workers)
+        self.max_per_user = max(1, max_per_user)
+        self.cache = ReportCache(cache_max_bytes, cache_max_entries)
+        # Версия данных, по которой проверяется актуальность кэша
+        self.version_source = version_source or (lambda: get_database().data_version)
+        # Журнал броней есть только в основном процессе, поэтому пик для отчёта
+        # по оборудованию считается здесь и передаётся в процесс пула готовым
+        self.peak_source = peak_source
+
+        self._ctx = multiprocessing.get_context('spawn')
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._progress_queue = None
+        self._listener: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Задачи в работе: (ключ, версия данных) -> future
+        self._inflight: Dict[Tuple[JobKey, int], asyncio.Future] = {}
+        self._subscribers: Dict[JobKey, List[AsyncProgressCallback]] = {}
+        self._user_jobs: Dict[int, int] = {}
+
+        # Счётчики
+        self.submitted = 0      # задач отправлено в пул
+        self.deduplicated = 0   # запросов присоединились к уже идущей задаче
+        self.failed = 0         # задач завершились ошибкой
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._progress_queue is None:
+            self._loop = asyncio.get_running_loop()
+            self._progress_queue = self._ctx.Queue()
+            self._listener = threading.Thread(
+                target=self._listen, args=(self._progress_queue,),
+                name="report-progress", daemon=True
+            )
+            self._listener.start()
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self._ctx,
+                initializer=_init_worker,
+                initargs=(self.db_path, self._progress_queue)
+            )
+        return self._pool
+
+    def _listen(self, progress_queue):
+        """Поток-приёмник прогресса из процессов пула"""
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            try:
+                self._loop.call_soon_threadsafe(self._dispatch, *message)
+            except RuntimeError:
+                # Event loop уже закрыт - прогресс больше некому показывать
+                return
+
+    def _dispatch(self, key: JobKey, done: int, total: Optional[int]):
+        for callback in list(self._subscribers.get(key, [])):
+            asyncio.ensure_future(callback(done, total))
+
+    def _forget(self, job: Tuple[JobKey, int], future: asyncio.Future):
+        if self._inflight.get(job) is future:
+            del self._inflight[job]
+
+    def is_busy(self) -> bool:
+        """Все процессы пула заняты, новая задача встанет в очередь"""
+        return len(self._inflight) >= self.max_workers
+
+    def lookup(self, report_type: str, start_date: str = None,
+               end_date: str = None) -> Optional[ReportResult]:
+        """Готовый отчёт из кэша, если данные с тех пор не менялись"""
+        if report_type not in CACHEABLE_REPORTS:
+            return None
+        return self.cache.get((report_type, start_date, end_date), self.version_source())
+
+    def remember_file_id(self, result: ReportResult, file_id: str):
+        """Повторная отправка этого отчёта пойдёт по file_id без загрузки файла"""
+        self.cache.set_file_id(result, file_id)
+
+    async def run(self, user_id: int, report_type: str, start_date: str = None,
+                  end_date: str = None, on_progress: AsyncProgressCallback = None) -> ReportResult:
+        """
+        Сформировать отчёт (кэш предварительно проверяется через lookup).
+        Бросает ReportLimitError, если у пользователя уже max_per_user задач.
+        """
+        if report_type not in REPORT_TYPES:
+            raise ValueError(f"Неизвестный тип отчёта: {report_type}")
+        if self._user_jobs.get(user_id, 0) >= self.max_per_user:
+            raise ReportLimitError(f"Не больше {self.max_per_user} отчётов одновременно")
+
+        key = (report_type, start_date, end_date)
+        # Версия фиксируется до чтения данных: если запись случится во время
+        # генерации, результат сохранится под старой версией и не будет выдан
+        version = self.version_source()
+        job = (key, version)
+        self._user_jobs[user_id] = self._user_jobs.get(user_id, 0) + 1
+        if on_progress:
+            self._subscribers.setdefault(key, []).append(on_progress)
+
+        try:
+            future = self._inflight.get(job)
+            if future is None:
+                future = self._submit(job)
+                self.submitted += 1
+            else:
+                self.deduplicated += 1
+                logger.info(f"Отчёт {key} уже формируется, ожидаем общий результат")
+
+            # shield: отмена одного ожидающего не отменяет общую задачу
+            content = await asyncio.shield(future)
+            if report_type in CACHEABLE_REPORTS:
+                return self.cache.put(key, version, content)
+            return ReportResult(key, version, content)
+
+        except BrokenProcessPool:
+            # Процесс пула аварийно завершился - пул пересоздаётся при следующем запросе
+            logger.error("Пул генерации отчётов сломан, будет пересоздан")
+            self._pool = None
+            self.failed += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+        finally:
+            self._user_jobs[user_id] -= 1
+            if not self._user_jobs[user_id]:
+                del self._user_jobs[user_id]
+            if on_progress:
+                subscribers = self._subscribers.get(key, [])
+                if on_progress in subscribers:
+                    subscribers.remove(on_progress)
+                if not subscribers:
+                    self._subscribers.pop(key, None)
+
+    def _submit(self, job: Tuple[JobKey, int]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        key = job[0]
+        peak_usage = self.peak_source() if key[0] == 'equipment' else None
+        future = loop.run_in_executor(self._get_pool(), _run_report, key, peak_usage)
+        self._inflight[job] = future
+        future.add_done_callback(lambda done, job=job: self._forget(job, done))
+        return future
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.max_workers,
+            'in_flight': len(self._inflight),
+            'submitted': self.submitted,
+            'deduplicated': self.deduplicated,
+            'failed': self.failed,
+            'cache': self.cache.stats(),
+        }
+
+    def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """
+        Остановить пул и поток-приёмник прогресса.
+        Процессы пула (и ещё запускающиеся) дожидаются до timeout секунд,
+        затем завершаются принудительно. Очередь прогресса закрывается
+        только после них, а поток-приёмник - до закрытия event loop.
+        """
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            processes = list((pool._processes or {}).values())
+            stopper = threading.Thread(
+                target=pool.shutdown, kwargs={'wait': True, 'cancel_futures': True},
+                name="report-shutdown", daemon=True
+            )
+            stopper.start()
+            stopper.join(timeout)
+            if stopper.is_alive():
+                logger.warning(f"Процессы генерации отчётов не завершились за {timeout} с, останавливаем")
+                for process in processes:
+                    if process.is_alive():
+                        process.terminate()
+                stopper.join(timeout)
+
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._listener.join(timeout)
+            self._progress_queue.close()
+            self._progress_queue.join_thread()
+            self._progress_queue = None
+            self._listener = None
+
+
+_report_queue: Optional[ReportQueue] = None
+
+
+def get_report_queue() -> ReportQueue:
+    global _report_queue
+    if _report_queue is None:
+        _report_queue = ReportQueue()
+    return _report_queue
@@ -0,0 +1,322 @@
+import asyncio
+import heapq
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from config import logger
+from database import AsyncDatabase, get_async_database
+
+# Формат времени запусков в таблице scheduler_runs
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Дальше этого горизонта подходящее время не ищется (спецификация вроде "30 февраля")
+MAX_SEARCH_DAYS = 366 * 5
+
+ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+}
+
+JobFunc = Callable[[], Awaitable[None]]
+
+
+def _parse_field(text: str, lo: int, hi: int) -> FrozenSet[int]:
+    """Поле cron: '*', '5', '1-5', '*/15', '10-50/10' и списки через запятую"""
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"шаг должен быть положительным: {text}")
+
+        if part == '*':
+            start, end = lo, hi
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = end = int(part)
+            if step != 1:
+                end = hi
+
+        if start < lo or end > hi or start > end:
+            raise ValueError(f"значение вне диапазона {lo}-{hi}: {text}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSpec:
+    """
+    Расписание в формате cron: 'минута час день месяц день_недели' (0 - воскресенье).
+    Как в cron, если заданы и день месяца, и день недели, подходит любой из них.
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        fields = ALIASES.get(spec.strip(), spec).split()
+        if len(fields) != 5:
+            raise ValueError(f"ожидается 5 полей расписания: {spec!r}")
+
+        minute, hour, day, month, weekday = fields
+        self.minutes = sorted(_parse_field(minute, 0, 59))
+        self.hours = sorted(_parse_field(hour, 0, 23))
+        self.days = _parse_field(day, 1, 31)
+        self.months = _parse_field(month, 1, 12)
+        # 7 - тоже воскресенье
+        self.weekdays = frozenset(d % 7 for d in _parse_field(weekday, 0, 7))
+        self._any_day = day.startswith('*')
+        self._any_weekday = weekday.startswith('*')
+
+    def _day_matches(self, day: date) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайшее время запуска строго позже moment"""
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(MAX_SEARCH_DAYS):
+            if self._day_matches(day):
+                first_day = day == start.date()
+                for hour in self.hours:
+                    if first_day and hour < start.hour:
+                        continue
+                    for minute in self.minutes:
+                        if first_day and hour == start.hour and minute < start.minute:
+                            continue
+                        return datetime(day.year, day.month, day.day, hour, minute)
+            day += timedelta(days=1)
+        raise ValueError(f"расписание {self.spec!r} не срабатывает в ближайшие годы")
+
+    def __str__(self) -> str:
+        return self.spec
+
+
+class Job:
+    """Задача планировщика и сведения о её последнем запуске"""
+
+    def __init__(self, name: str, spec: CronSpec, func: JobFunc, timeout: Optional[float],
+                 catch_up: bool, max_lateness: Optional[timedelta], description: str):
+        self.name = name
+        self.spec = spec
+        self.func = func
+        self.timeout = timeout
+        self.catch_up = catch_up
+        self.max_lateness = max_lateness
+        self.description = description
+
+        self.next_run: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+        # Последний запуск (восстанавливается из scheduler_runs)
+        self.last_scheduled: Optional[datetime] = None
+        self.last_started: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_status: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+
+class Scheduler:
+    """
+    Планировщик периодических задач на куче ближайших запусков.
+    Цикл спит ровно до ближайшего запуска, поэтому в простое не просыпается.
+    Время последнего запуска хранится в базе: пропущенный за время остановки
+    бота запуск выполняется один раз сразу после старта.
+    """
+
+    def __init__(self, database: AsyncDatabase = None):
+        self._db = database
+        self._jobs: Dict[str, Job] = {}
+        # (время запуска, номер, имя задачи, плановое время)
+        self._heap: List[Tuple[datetime, int, str, datetime]] = []
+        self._counter = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+        # Счётчики
+        self.wakeups = 0   # пробуждения цикла
+        self.runs = 0      # запущено задач
+        self.skipped = 0   # запуски пропущены: предыдущий ещё выполняется
+
+    @property
+    def db(self) -> AsyncDatabase:
+        if self._db is None:
+            self._db = get_async_database()
+        return self._db
+
+    def add(self, name: str, spec: str, func: JobFunc, timeout: Optional[float] = None,
+            catch_up: bool = True, max_lateness: Optional[timedelta] = None,
+            description: str = ""):
+        """
+        Зарегистрировать задачу.
+        timeout - максимальная длительность запуска в секундах;
+        max_lateness - насколько поздно ещё имеет смысл догонять пропущенный запуск.
+        """
+        if name in self._jobs:
+            raise ValueError(f"Задача {name} уже зарегистрирована")
+        job = Job(name, CronSpec(spec), func, timeout, catch_up, max_lateness, description)
+        self._jobs[name] = job
+        if self._loop_task is not None:
+            self._schedule(job, job.spec.next_after(datetime.now()))
+
+    def jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def _push(self, job: Job, fire_at: datetime, scheduled_for: datetime):
+        job.next_run = fire_at
+        self._counter += 1
+        heapq.heappush(self._heap, (fire_at, self._counter, job.name, scheduled_for))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _schedule(self, job: Job, scheduled_for: datetime):
+        self._push(job, scheduled_for, scheduled_for)
+
+    def _missed_run(self, job: Job, now: datetime) -> Optional[datetime]:
+        """Последний плановый запуск между прошлым запуском и now (несколько пропусков - один запуск)"""
+        if job.last_scheduled is None:
+            return None
+        missed = None
+        moment = job.spec.next_after(job.last_scheduled)
+        while moment <= now:
+            missed = moment
+            moment = job.spec.next_after(moment)
+        return missed
+
+    async def start(self):
+        """Восстановить последние запуски из базы и запустить цикл"""
+        if self._loop_task is not None:
+            return
+        self._wakeup = asyncio.Event()
+
+        runs = await self.db.get_scheduler_runs()
+        now = datetime.now()
+        for job in self._jobs.values():
+            record = runs.get(job.name)
+            if record:
+                scheduled_for, started_at, duration, status, error = record
+                job.last_scheduled = datetime.strptime(scheduled_for, TIME_FORMAT)
+                job.last_started = datetime.strptime(started_at, TIME_FORMAT)
+                job.last_duration = duration
+                job.last_status = status
+                job.last_error = error
+
+            missed = self._missed_run(job, now)
+            if missed is not None and job.catch_up and (
+                    job.max_lateness is None or now - missed <= job.max_lateness):
+                logger.info(f"Задача {job.name}: пропущен запуск {missed:%Y-%m-%d %H:%M}, выполняем сейчас")
+                self._push(job, now, missed)
+            else:
+                if missed is not None:
+                    logger.info(f"Задача {job.name}: пропущенный запуск {missed:%Y-%m-%d %H:%M} не догоняется")
+                self._schedule(job, job.spec.next_after(now))
+
+        self._loop_task = asyncio.create_task(self._run_loop(), name="scheduler")
+        logger.info(f"Планировщик запущен, задач: {len(self._jobs)}")
+
+    async def _run_loop(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                self.wakeups += 1
+                continue
+
+            fire_at, _, name, scheduled_for = self._heap[0]
+            delay = (fire_at - datetime.now()).total_seconds()
+            if delay > 0:
+                # Спим до ближайшего запуска или до добавления задачи.
+                # После перевода часов время проверяется заново.
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeups += 1
+                continue
+
+            heapq.heappop(self._heap)
+            job = self._jobs[name]
+            self._fire(job, scheduled_for)
+            self._schedule(job, job.spec.next_after(max(scheduled_for, datetime.now())))
+
+    def _fire(self, job: Job, scheduled_for: datetime):
+        if job.running:
+            self.skipped += 1
+            logger.warning(f"Задача {job.name} ещё выполняется, запуск {scheduled_for:%H:%M} пропущен")
+            return
+        self.runs += 1
+        job.task = asyncio.create_task(self._run_job(job, scheduled_for), name=f"job-{job.name}")
+
+    async def _run_job(self, job: Job, scheduled_for: datetime):
+        started_at = datetime.now()
+        started = time.monotonic()
+        error = None
+        try:
+            await asyncio.wait_for(job.func(), job.timeout)
+            status = 'ok'
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            error = f"превышен таймаут {job.timeout} с"
+            logger.error(f"Задача {job.name}: {error}")
+        except asyncio.CancelledError:
+            logger.info(f"Задача {job.name} остановлена")
+            raise
+        except Exception as e:
+            status = 'error'
+            error = str(e)
+            logger.error(f"Ошибка в задаче {job.name}: {e}")
+
+        job.last_scheduled = scheduled_for
+        job.last_started = started_at
+        job.last_duration = time.monotonic() - started
+        job.last_status = status
+        job.last_error = error
+        logger.info(f"Задача {job.name} выполнена за {job.last_duration:.2f} с: {status}")
+
+        await self.db.record_scheduler_run(
+            job.name, scheduled_for.strftime(TIME_FORMAT), started_at.strftime(TIME_FORMAT),
+            job.last_duration, status, error
+        )
+
+    def stats(self) -> Dict:
+        return {
+            'jobs': len(self._jobs),
+            'wakeups': self.wakeups,
+            'runs': self.runs,
+            'skipped': self.skipped,
+        }
+
+    async def stop(self):
+        """Остановить цикл и выполняющиеся задачи"""
+        tasks = [job.task for job in self._jobs.values() if job.running]
+        if self._loop_task is not None:
+            tasks.append(self._loop_task)
+            self._loop_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._heap.clear()
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
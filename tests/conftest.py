@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# config.py требует токен и администраторов при импорте
+os.environ.setdefault('BOT_TOKEN', '123456:TEST-TOKEN')
+os.environ.setdefault('ADMIN_IDS', '1')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import Database  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'test.db')
+    # Процессы, запущенные из теста, тоже работают с временной базой
+    monkeypatch.setenv('DATABASE_PATH', path)
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    database = Database(db_path)
+    yield database
+    database.close()
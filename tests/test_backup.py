@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+import backup
+from backup import BackupError, BackupTimeout, run_backup
+
+
+def test_backup_stops_at_deadline(db, tmp_path):
+    """Бэкап, не уложившийся в срок, прерывается и не оставляет файлов"""
+    backup_dir = tmp_path / "backups"
+    with pytest.raises(BackupTimeout):
+        run_backup(db.db_path, str(backup_dir), timeout=0)
+    assert os.listdir(backup_dir) == []
+
+    metrics = run_backup(db.db_path, str(backup_dir), timeout=60)
+    assert os.path.exists(metrics['path'])
+
+
+def test_backup_skipped_while_previous_runs(db, tmp_path):
+    """Пока поток предыдущего бэкапа не завершился, новый не запускается"""
+    with backup._backup_lock:
+        with pytest.raises(BackupError, match="ещё выполняется"):
+            run_backup(db.db_path, str(tmp_path / "backups"))
@@ -0,0 +1,77 @@
+import random
+import threading
+from datetime import date, timedelta
+
+from database import Database
+
+THREADS = 16
+ORDERS_PER_THREAD = 25
+DAYS = 10
+STOCK = {'Палатка': 5, 'Спальник': 3}
+
+
+def _peak_usage(db: Database):
+    """Максимальная занятость каждого ресурса по дням, посчитанная напрямую по заказам"""
+    with db.get_connection() as conn:
+        rows = conn.execute("""
+            SELECT o.start_date, o.end_date, oi.resource_id, oi.quantity
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.status IN ('pending', 'issued', 'overdue')
+        """).fetchall()
+
+    usage = {}
+    for start, end, resource_id, quantity in rows:
+        day = date.fromisoformat(start)
+        while day <= date.fromisoformat(end):
+            usage[resource_id, day] = usage.get((resource_id, day), 0) + quantity
+            day += timedelta(days=1)
+
+    peak = {}
+    for (resource_id, _), quantity in usage.items():
+        peak[resource_id] = max(peak.get(resource_id, 0), quantity)
+    return peak
+
+
+def test_concurrent_creates_never_overbook(db_path):
+    db = Database(db_path, pool_size=THREADS)
+    for name, quantity in STOCK.items():
+        db.add_resource(name, quantity=quantity)
+    resources = {row[0]: row[3] for row in db.get_resources()}
+    client_id = db.add_client("Нагрузочный тест", "+70000000000")
+    first_day = date.today() + timedelta(days=1)
+
+    created = []
+    barrier = threading.Barrier(THREADS)
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        barrier.wait()
+        for _ in range(ORDERS_PER_THREAD):
+            start = first_day + timedelta(days=rng.randrange(DAYS))
+            end = start + timedelta(days=rng.randrange(3))
+            items = [
+                {'resource_id': resource_id, 'quantity': rng.randint(1, 2)}
+                for resource_id in rng.sample(list(resources), rng.randint(1, len(resources)))
+            ]
+            order_id = db.create_order_with_items(
+                client_id, start.isoformat(), end.isoformat(),
+                'pickup', '', None, 1, items
+            )
+            if order_id is not None:
+                created.append(order_id)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    try:
+        # Спрос заведомо больше запаса: часть заказов создана, часть отклонена
+        assert 0 < len(created) < THREADS * ORDERS_PER_THREAD
+        assert len(set(created)) == len(created)
+        for resource_id, peak in _peak_usage(db).items():
+            assert peak <= resources[resource_id]
+    finally:
+        db.close()
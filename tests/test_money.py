@@ -0,0 +1,19 @@
+import pytest
+
+from money import MAX_AMOUNT, parse_money
+
+
+@pytest.mark.parametrize('text, minor', [
+    ('5000', 500000),
+    ('1 500,50 руб.', 150050),
+    ('-', None),
+    (str(MAX_AMOUNT - 1), (MAX_AMOUNT - 1) * 100),
+])
+def test_parse_money(text, minor):
+    assert parse_money(text) == minor
+
+
+@pytest.mark.parametrize('text', ['1e30', '1E2', '5e-1', str(MAX_AMOUNT), '-5', '1.005', 'abc'])
+def test_parse_money_rejects(text):
+    with pytest.raises(ValueError):
+        parse_money(text)
@@ -0,0 +1,54 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from database import Database
+
+
+def _fill(db: Database, orders: int = 2000):
+    """Заказы с позициями вокруг сегодняшнего дня во всех статусах"""
+    rng = random.Random(1)
+    for i in range(3):
+        db.add_resource(f"Ресурс {i}", quantity=100)
+    resource_ids = [row[0] for row in db.get_resources()]
+    client_ids = [db.add_client(f"Клиент {i}", f"+7{i:010d}") for i in range(50)]
+
+    with db.get_connection() as conn:
+        for _ in range(orders):
+            start = date.today() + timedelta(days=rng.randint(-60, 60))
+            end = start + timedelta(days=rng.randint(0, 5))
+            cursor = conn.execute("""
+                INSERT INTO orders (client_id, start_date, end_date, delivery_type, status, created_by, cost_minor)
+                VALUES (?, ?, ?, 'pickup', ?, 1, ?)
+            """, (rng.choice(client_ids), start.isoformat(), end.isoformat(),
+                  rng.choice(['pending', 'issued', 'overdue', 'completed', 'completed']),
+                  rng.randint(0, 100000)))
+            conn.execute(
+                "INSERT INTO order_items (order_id, resource_id, quantity) VALUES (?, ?, ?)",
+                (cursor.lastrowid, rng.choice(resource_ids), rng.randint(1, 3))
+            )
+        conn.commit()
+        conn.execute("ANALYZE")
+
+
+@pytest.fixture(params=['empty', 'filled'])
+def plan_db(request, db):
+    if request.param == 'filled':
+        _fill(db)
+    return db
+
+
+def test_hot_queries_use_indexes(plan_db):
+    """Ни один горячий запрос не просматривает orders или order_items целиком"""
+    assert plan_db.check_query_plans() == {}
+
+
+def test_full_scan_is_reported(db, monkeypatch):
+    """Проверка действительно ловит SCAN по охраняемой таблице"""
+    def unindexed_query():
+        with db.get_connection() as conn:
+            conn.execute("SELECT id FROM orders WHERE delivery_comment = ?", ('x',)).fetchall()
+
+    monkeypatch.setattr(db, '_hot_queries', lambda: {'unindexed': unindexed_query})
+    assert db.check_query_plans() == {'unindexed': ['SCAN orders']}
@@ -0,0 +1,18 @@
+from report_jobs import ReportQueue
+
+
+def test_resource_writes_invalidate_cached_reports(db):
+    """Отчёты показывают названия ресурсов: правка каталога делает кэш устаревшим"""
+    queue = ReportQueue(db_path=db.db_path, version_source=lambda: db.data_version)
+    db.add_resource("Палатка", quantity=5)
+    resource_id = db.get_resources()[0][0]
+
+    queue.cache.put(('financial', None, None), db.data_version, b'report')
+    assert queue.lookup('financial') is not None
+
+    assert db.update_resource(resource_id, name="Шатёр")
+    assert queue.lookup('financial') is None
+
+    queue.cache.put(('financial', None, None), db.data_version, b'report')
+    assert db.delete_resource(resource_id)
+    assert queue.lookup('financial') is None
@@ -0,0 +1,93 @@
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import types
+
+from openpyxl import load_workbook
+
+import database
+import report_jobs
+from report_jobs import ReportQueue
+
+from conftest import ROOT
+
+MAIN_PATH = os.path.join(ROOT, 'main.py')
+
+
+def _worker_state():
+    """Выполняется в процессе пула: что успело создаться кроме базы отчётов"""
+    return {
+        'report_db': report_jobs._worker_db is not None,
+        'main_db': database._db_instance is not None,
+        'handlers': 'handlers' in sys.modules,
+    }
+
+
+def test_main_import_has_no_side_effects(db_path):
+    """spawn выполняет main.py как __mp_main__: это не должно строить базу и роутеры"""
+    code = (
+        "import runpy, sys, database\n"
+        f"runpy.run_path({MAIN_PATH!r}, run_name='__mp_main__')\n"
+        "print(database._db_instance is None, 'handlers' in sys.modules)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT,
+        capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['True', 'False']
+
+
+def test_worker_opens_database_once(db, db_path, monkeypatch):
+    """Процесс пула, запущенный из main.py, открывает только свою облегчённую базу"""
+    # Главный модуль процесса - main.py, как при запуске бота
+    main_module = types.ModuleType('__main__')
+    main_module.__file__ = MAIN_PATH
+    monkeypatch.setitem(sys.modules, '__main__', main_module)
+
+    async def run():
+        queue = ReportQueue(db_path=db_path, max_workers=1)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(queue._get_pool(), _worker_state)
+        finally:
+            queue.shutdown()
+
+    assert asyncio.run(run()) == {'report_db': True, 'main_db': False, 'handlers': False}
+
+
+def test_shutdown_while_workers_start(db_path, capfd):
+    """Остановка сразу после запуска пула: без трассировок от процессов и с остановленным приёмником"""
+    async def run():
+        queue = ReportQueue(db_path=db_path, max_workers=2)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(queue._get_pool(), os.getpid)
+        listener = queue._listener
+        queue.shutdown()
+        future.cancel()
+        return listener
+
+    listener = asyncio.run(run())
+    assert not listener.is_alive()
+    assert 'Traceback' not in capfd.readouterr().err
+
+
+def test_equipment_peak_comes_from_main_process(db, db_path):
+    """Пик загрузки считается в основном процессе и доходит до процесса пула готовым"""
+    db.add_resource("Палатка", quantity=10)
+    resource_id = db.get_resources()[0][0]
+
+    async def run():
+        queue = ReportQueue(db_path=db_path, max_workers=1,
+                            version_source=lambda: 0, peak_source=lambda: {resource_id: 7})
+        try:
+            return await queue.run(1, 'equipment')
+        finally:
+            queue.shutdown()
+
+    result = asyncio.run(run())
+    rows = load_workbook(io.BytesIO(result.content)).active.iter_rows(values_only=True)
+    tent = next(row for row in rows if row[0] == "Палатка")
+    assert tent[-1] == "7/10"
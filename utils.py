@@ -1,11 +1,12 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from aiogram.types import InlineKeyboardButton, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from config import logger
-from database import get_database  # ИСПРАВЛЕНО: используем singleton
+from config import ORDER_RENDER_CACHE_SIZE, logger
+from database import get_async_database  # ИСПРАВЛЕНО: используем singleton
 
-db = get_database()  # ИСПРАВЛЕНО: вместо Database()
+db = get_async_database()  # ИСПРАВЛЕНО: вместо Database()
 
 
 def parse_date_range(text: str) -> Tuple[Optional[Tuple[str, str]], Optional[str]]:
@@ -47,11 +48,59 @@ def parse_date_range(text: str) -> Tuple[Optional[Tuple[str, str]], Optional[str
         return None, "❌ Произошла ошибка при обработке дат. Попробуйте снова."
 
 
-def format_order(order: Tuple, show_items: bool = True) -> str:
-    """Форматирование информации о заказе"""
+# Кэш отрисовки заказов:
+# (order_id, версия заказа, версия каталога, show_items) -> (поля заказа, начало, конец, текст)
+# Подсветка зависит от текущего дня и добавляется к тексту из кэша при каждом вызове
+_order_render_cache: "OrderedDict[Tuple, Tuple]" = OrderedDict()
+_order_render_stats = {'hits': 0, 'misses': 0}
+
+
+def _order_render_key(order: Tuple, show_items: bool) -> Tuple:
+    return (order[0], db.sync.order_version(order[0]), db.sync.catalogue_version, show_items)
+
+
+def _order_highlight(start_dt, end_dt) -> str:
+    """Отметка срочности заказа относительно сегодняшнего дня"""
+    today = datetime.now().date()
+    if end_dt == today:
+        return "🔴 "
+    if end_dt == today + timedelta(days=1):
+        return "🟡 "
+    if start_dt == today or start_dt == today + timedelta(days=1):
+        return "🟢 "
+    return ""
+
+
+def _cached_order(order: Tuple, show_items: bool) -> Optional[str]:
+    """Текст заказа из кэша или None"""
+    key = _order_render_key(order, show_items)
+    entry = _order_render_cache.get(key)
+    # Кортеж заказа сверяется с закэшированным: запись, прочитанная до
+    # изменения заказа, не должна попасть в кэш под новой версией
+    if entry is None or entry[0] != order[:9]:
+        return None
+    _order_render_cache.move_to_end(key)
+    _order_render_stats['hits'] += 1
+    _, start_dt, end_dt, body = entry
+    return _order_highlight(start_dt, end_dt) + body
+
+
+async def format_order(order: Tuple, show_items: bool = True,
+                       items: Optional[List[Tuple]] = None) -> str:
+    """
+    Форматирование информации о заказе.
+    Позиции можно передать заранее (см. Database.get_items_for_orders),
+    иначе они будут загружены отдельным запросом.
+    Готовый текст кэшируется до следующего изменения заказа.
+    """
     if not order or len(order) < 5:
         return "❌ Ошибка: неверный формат заказа"
     
+    cached = _cached_order(order, show_items)
+    if cached is not None:
+        return cached
+    
+    key = _order_render_key(order, show_items)
     order_id, client_name, client_phone, start, end = order[:5]
     delivery_type = order[5] if len(order) > 5 else 'pickup'
     delivery_comment = order[6] if len(order) > 6 else ''
@@ -62,33 +111,25 @@ def format_order(order: Tuple, show_items: bool = True) -> str:
     delivery_text = "Доставка" if delivery_type == 'delivery' else "Самовывоз"
     
     try:
-        today = datetime.now().date()
         start_dt = datetime.strptime(start, '%Y-%m-%d').date()
         end_dt = datetime.strptime(end, '%Y-%m-%d').date()
+        cacheable = True
         
-        highlight = ""
-        if end_dt == today:
-            highlight = "🔴 "
-        elif end_dt == today + timedelta(days=1):
-            highlight = "🟡 "
-        elif start_dt == today:
-            highlight = "🟢 "
-        elif start_dt == today + timedelta(days=1):
-            highlight = "🟢 "
-        
-        text = f"{highlight}<b>#{order_id}</b> | {client_name}\n"
+        text = f"<b>#{order_id}</b> | {client_name}\n"
         text += f"📞 {client_phone}\n"
         text += f"📅 {start} — {end}\n"
         
         # Получаем позиции заказа
         if show_items:
             try:
-                items = db.get_order_items(order_id)
+                if items is None:
+                    items = await db.get_order_items(order_id)
                 if items:
                     text += "📦 "
                     items_text = ", ".join([f"{item_name}×{quantity}" for _, item_name, quantity, _ in items])
                     text += f"{items_text}\n"
             except Exception as e:
+                cacheable = False
                 logger.error(f"Ошибка получения позиций для заказа {order_id}: {e}")
         
         text += f"{delivery_emoji} {delivery_text}"
@@ -99,12 +140,39 @@ def format_order(order: Tuple, show_items: bool = True) -> str:
         if cost:
             text += f" | 💰 {cost}"
         
-        return text
+        _order_render_stats['misses'] += 1
+        if cacheable:
+            _order_render_cache[key] = (order[:9], start_dt, end_dt, text)
+            if len(_order_render_cache) > ORDER_RENDER_CACHE_SIZE:
+                _order_render_cache.popitem(last=False)
+        
+        return _order_highlight(start_dt, end_dt) + text
     except Exception as e:
         logger.error(f"Ошибка форматирования заказа {order_id}: {e}")
         return f"❌ Ошибка форматирования заказа #{order_id}"
+
+
+async def format_orders(orders: List[Tuple], show_items: bool = True) -> List[str]:
+    """
+    Форматирование списка заказов: позиции одним запросом
+    загружаются только для заказов, которых нет в кэше.
+    """
+    texts = [_cached_order(order, show_items) if order and len(order) >= 5 else None
+             for order in orders]
+    missing = [order[0] for order, text in zip(orders, texts) if text is None and order]
+    items = await db.get_items_for_orders(missing) if show_items and missing else {}
     
-def format_booking(booking: Tuple, show_actions: bool = False) -> str:
+    for i, order in enumerate(orders):
+        if texts[i] is None:
+            texts[i] = await format_order(order, show_items, items.get(order[0]) if order else None)
+    return texts
+
+
+def get_order_render_stats() -> dict:
+    """Статистика кэша отрисовки заказов"""
+    return {**_order_render_stats, 'size': len(_order_render_cache)}
+    
+async def format_booking(booking: Tuple, show_actions: bool = False) -> str:
     """Legacy функция для обратной совместимости"""
     # Старый формат: (id, resource_name, client_name, phone, start, end, quantity, ...)
     if len(booking) >= 7:
@@ -147,7 +215,31 @@ def format_booking(booking: Tuple, show_actions: bool = False) -> str:
         return text
     
     # Новый формат заказа
-    return format_order(booking, show_items=True)
+    return await format_order(booking, show_items=True)
+
+
+def add_pagination_row(builder: InlineKeyboardBuilder, prefix: str, first: str, last: str,
+                       has_prev: bool, has_next: bool):
+    """
+    Кнопки листания keyset-страниц: '{prefix}_prev_{курсор первой строки}'
+    и '{prefix}_next_{курсор последней строки}'. Курсор не длиннее 40 байт,
+    чтобы callback_data уложилась в лимит Telegram в 64 байта.
+    """
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="⬅️ Пред.", callback_data=f"{prefix}_prev_{first}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="След. ➡️", callback_data=f"{prefix}_next_{last}"))
+    if buttons:
+        builder.row(*buttons)
+
+
+def parse_page_callback(data: str) -> Tuple[bool, Optional[str]]:
+    """(вперёд, курсор) из callback_data кнопки листания; для первой страницы курсор None"""
+    parts = data.split("_", 2)
+    if len(parts) < 3 or parts[1] not in ('prev', 'next'):
+        return True, None
+    return parts[1] == 'next', parts[2]
 
 
 def get_main_keyboard():